@@ -7,9 +7,11 @@ import (
 	"io"
 	"log"
 	"net/http"
+	"net/url"
 	"os"
 	"strings"
 	"sync"
+	"time"
 
 	"github.com/go-redis/redis/v8"
 	"github.com/gorilla/mux"
@@ -152,15 +154,28 @@ func internalNetworkMiddleware(next http.Handler) http.Handler {
 			return
 		}
 		
-		// Логируем успешный доступ для отладки
-		log.Printf("Разрешен доступ к внутреннему API от IP: %s, Path: %s", clientIP, r.URL.Path)
+		// Correlation ID от Python-сервисов возвращаем в ответе и пишем в лог,
+		// чтобы строку бекенда можно было сопоставить с трассой бота или Алисы
+		requestID := r.Header.Get("X-Request-ID")
+		if requestID != "" {
+			w.Header().Set("X-Request-ID", requestID)
+		}
 		
+		start := time.Now()
 		next.ServeHTTP(w, r)
+		
+		// Логируем успешный доступ для отладки
+		log.Printf("Разрешен доступ к внутреннему API от IP: %s, Path: %s, RequestID: %s, Duration: %s",
+			clientIP, r.URL.Path, requestID, time.Since(start))
 	})
 }
 
-func main() {
+// newRouter собирает все маршруты сервера
+func newRouter() *mux.Router {
 	r := mux.NewRouter()
+	// Маршрут подбирается по экранированному пути: "/" в названии элемента приходит как %2F
+	// и не должен делить путь на сегменты. Значение {name} раскодирует pathName
+	r.UseEncodedPath()
 
 	// Публичные маршруты (без авторизации)
 	r.HandleFunc("/", indexHandler).Methods("GET") // Главная страница доступна всем
@@ -172,10 +187,13 @@ func main() {
 	internal := r.PathPrefix("/internal/api").Subrouter()
 	internal.Use(internalNetworkMiddleware)
 	internal.HandleFunc("/list", internalListHandler).Methods("GET")
+	internal.HandleFunc("/lists", internalListsHandler).Methods("GET")
 	internal.HandleFunc("/add", internalAddHandler).Methods("POST")
+	internal.HandleFunc("/add/bulk", internalBulkAddHandler).Methods("POST")
 	internal.HandleFunc("/buy/{name}", internalBuyHandler).Methods("PUT")
 	internal.HandleFunc("/delete/{name}", internalDeleteHandler).Methods("DELETE")
 	internal.HandleFunc("/edit/{name}", internalEditHandler).Methods("PUT")
+	internal.HandleFunc("/item/{name}", internalPatchItemHandler).Methods("PATCH")
 
 	// Защищённые маршруты (требуют авторизации через OAuth)
 	// Регистрируем напрямую с применением middleware
@@ -196,6 +214,22 @@ func main() {
 	r.HandleFunc("/api/shared-lists", authMiddleware(http.HandlerFunc(getSharedListsHandler)).ServeHTTP).Methods("GET")
 	r.HandleFunc("/api/share-list", authMiddleware(http.HandlerFunc(shareListHandler)).ServeHTTP).Methods("POST")
 
+	return r
+}
+
+// pathName возвращает раскодированное название элемента из {name} в пути
+func pathName(w http.ResponseWriter, r *http.Request) (string, bool) {
+	name, err := url.PathUnescape(mux.Vars(r)["name"])
+	if err != nil {
+		http.Error(w, "Invalid item name", http.StatusBadRequest)
+		return "", false
+	}
+	return name, true
+}
+
+func main() {
+	r := newRouter()
+
 	fmt.Println("Server is running on port 8080...")
 	log.Fatal(http.ListenAndServe(":8080", r))
 }
@@ -696,8 +730,10 @@ func editHandler(w http.ResponseWriter, r *http.Request) {
 		return
 	}
 	
-	vars := mux.Vars(r)
-	oldName := vars["name"]
+	oldName, ok := pathName(w, r)
+	if !ok {
+		return
+	}
 
 	var editedItem Item
 	err := json.NewDecoder(r.Body).Decode(&editedItem)
@@ -800,8 +836,10 @@ func buyHandler(w http.ResponseWriter, r *http.Request) {
 		return
 	}
 	
-	vars := mux.Vars(r)
-	itemName := vars["name"]
+	itemName, ok := pathName(w, r)
+	if !ok {
+		return
+	}
 
 	var item struct {
 		Bought   bool   `json:"bought"`
@@ -867,8 +905,10 @@ func deleteHandler(w http.ResponseWriter, r *http.Request) {
 		return
 	}
 	
-	vars := mux.Vars(r)
-	itemName := vars["name"]
+	itemName, ok := pathName(w, r)
+	if !ok {
+		return
+	}
 
 	category := r.URL.Query().Get("category")
 	if category == "" {
@@ -1324,24 +1364,8 @@ func internalListHandler(w http.ResponseWriter, r *http.Request) {
 	}
 
 	// Для внутреннего API объединяем данные всех пользователей из SERVICE_USER_IDS
-	// Если SERVICE_USER_IDS не указан, используем только SERVICE_USER_ID
-	serviceUserIDs := os.Getenv("SERVICE_USER_IDS") // Формат: "77415476,1179386959"
-	var allUserIDs []string
-	
-	if serviceUserIDs != "" {
-		// Разбиваем строку по запятой и убираем пробелы
-		for _, id := range strings.Split(serviceUserIDs, ",") {
-			trimmedID := strings.TrimSpace(id)
-			if trimmedID != "" {
-				allUserIDs = append(allUserIDs, trimmedID)
-			}
-		}
-	}
-	
-	// Если SERVICE_USER_IDS не указан, используем только SERVICE_USER_ID
-	if len(allUserIDs) == 0 {
-		allUserIDs = []string{userID}
-	}
+	// (формат: "77415476,1179386959"), иначе используем только SERVICE_USER_ID
+	allUserIDs := internalUserIDs(userID)
 
 	// Объединяем данные из всех указанных пользователей
 	var allItems []Item
@@ -1445,8 +1469,10 @@ func internalBuyHandler(w http.ResponseWriter, r *http.Request) {
 		log.Printf("SERVICE_USER_ID не настроен, используется дефолтный: service")
 	}
 	
-	vars := mux.Vars(r)
-	itemName := vars["name"]
+	itemName, ok := pathName(w, r)
+	if !ok {
+		return
+	}
 
 	var item struct {
 		Bought   bool   `json:"bought"`
@@ -1511,8 +1537,10 @@ func internalDeleteHandler(w http.ResponseWriter, r *http.Request) {
 		log.Printf("SERVICE_USER_ID не настроен, используется дефолтный: service")
 	}
 	
-	vars := mux.Vars(r)
-	itemName := vars["name"]
+	itemName, ok := pathName(w, r)
+	if !ok {
+		return
+	}
 
 	category := r.URL.Query().Get("category")
 	if category == "" {
@@ -1574,8 +1602,10 @@ func internalEditHandler(w http.ResponseWriter, r *http.Request) {
 		log.Printf("SERVICE_USER_ID не настроен, используется дефолтный: service")
 	}
 	
-	vars := mux.Vars(r)
-	oldName := vars["name"]
+	oldName, ok := pathName(w, r)
+	if !ok {
+		return
+	}
 
 	var editedItem Item
 	err := json.NewDecoder(r.Body).Decode(&editedItem)
@@ -1669,3 +1699,346 @@ func internalEditHandler(w http.ResponseWriter, r *http.Request) {
 
 	w.WriteHeader(http.StatusOK)
 }
+
+// loadItems читает список из Redis; отсутствующий или битый ключ дает пустой список
+func loadItems(ctx context.Context, client *redis.Client, key string) ([]Item, error) {
+	val, err := client.Get(ctx, key).Result()
+	if err == redis.Nil || (err == nil && val == "") {
+		return []Item{}, nil
+	} else if err != nil {
+		return nil, err
+	}
+
+	var items []Item
+	if err := json.Unmarshal([]byte(val), &items); err != nil {
+		log.Printf("Ошибка парсинга JSON для %s: %v, значение: %s", key, err, val)
+		return []Item{}, nil
+	}
+	return items, nil
+}
+
+func saveItems(ctx context.Context, client *redis.Client, key string, items []Item) error {
+	data, err := json.Marshal(items)
+	if err != nil {
+		return err
+	}
+	return client.Set(ctx, key, data, 0).Err()
+}
+
+// saveItemsPair записывает два списка одним MSET, чтобы перенос между категориями
+// не оставил элемент в обоих списках, если вторая запись не удалась
+func saveItemsPair(ctx context.Context, client *redis.Client, key string, items []Item, otherKey string, otherItems []Item) error {
+	data, err := json.Marshal(items)
+	if err != nil {
+		return err
+	}
+	otherData, err := json.Marshal(otherItems)
+	if err != nil {
+		return err
+	}
+	return client.MSet(ctx, key, data, otherKey, otherData).Err()
+}
+
+// Частичное обновление элемента: заполненные поля меняются, остальные остаются как есть
+type itemPatch struct {
+	Category *string `json:"category"`
+	Priority *int    `json:"priority"`
+	Bought   *bool   `json:"bought"`
+}
+
+// internalPatchItemHandler меняет приоритет/статус на месте или переносит элемент в другую категорию
+// за один запрос, без передачи всего элемента клиентом
+func internalPatchItemHandler(w http.ResponseWriter, r *http.Request) {
+	userID := getServiceUserID(r)
+	if userID == "" {
+		userID = "service"
+	}
+
+	itemName, ok := pathName(w, r)
+	if !ok {
+		return
+	}
+	category := r.URL.Query().Get("category")
+	if category == "" {
+		http.Error(w, "Category is required", http.StatusBadRequest)
+		return
+	}
+
+	var patch itemPatch
+	if err := json.NewDecoder(r.Body).Decode(&patch); err != nil {
+		http.Error(w, err.Error(), http.StatusBadRequest)
+		return
+	}
+	if patch.Priority != nil && (*patch.Priority < 1 || *patch.Priority > 3) {
+		http.Error(w, "Priority must be between 1 and 3", http.StatusBadRequest)
+		return
+	}
+	if patch.Category != nil && strings.TrimSpace(*patch.Category) == "" {
+		http.Error(w, "Category cannot be empty", http.StatusBadRequest)
+		return
+	}
+
+	ctx := r.Context()
+	client := getRedisClient()
+	defer client.Close()
+
+	mutex.Lock()
+	defer mutex.Unlock()
+
+	key := "shoppingList:" + userID + ":" + category
+	items, err := loadItems(ctx, client, key)
+	if err != nil {
+		http.Error(w, err.Error(), http.StatusInternalServerError)
+		return
+	}
+
+	index := -1
+	for i := range items {
+		if items[i].Name == itemName {
+			index = i
+			break
+		}
+	}
+	if index == -1 {
+		http.Error(w, "Item not found", http.StatusNotFound)
+		return
+	}
+
+	item := items[index]
+	if patch.Priority != nil {
+		item.Priority = *patch.Priority
+	}
+	if patch.Bought != nil {
+		item.Bought = *patch.Bought
+	}
+
+	if patch.Category != nil && strings.TrimSpace(*patch.Category) != category {
+		newCategory := strings.TrimSpace(*patch.Category)
+		newKey := "shoppingList:" + userID + ":" + newCategory
+		newItems, err := loadItems(ctx, client, newKey)
+		if err != nil {
+			http.Error(w, err.Error(), http.StatusInternalServerError)
+			return
+		}
+		for _, existing := range newItems {
+			if existing.Name == item.Name {
+				http.Error(w, "Item already exists in target category", http.StatusConflict)
+				return
+			}
+		}
+		item.Category = newCategory
+		items = append(items[:index], items[index+1:]...)
+		newItems = append(newItems, item)
+		if err := saveItemsPair(ctx, client, key, items, newKey, newItems); err != nil {
+			http.Error(w, err.Error(), http.StatusInternalServerError)
+			return
+		}
+	} else {
+		items[index] = item
+		if err := saveItems(ctx, client, key, items); err != nil {
+			http.Error(w, err.Error(), http.StatusInternalServerError)
+			return
+		}
+	}
+	logActivity("Patched", item.Name)
+
+	w.Header().Set("Content-Type", "application/json")
+	json.NewEncoder(w).Encode(item)
+}
+
+// internalUserIDs возвращает пользователей, чьи списки объединяет внутренний API:
+// SERVICE_USER_IDS (через запятую) или один userID
+func internalUserIDs(userID string) []string {
+	var allUserIDs []string
+	for _, id := range strings.Split(os.Getenv("SERVICE_USER_IDS"), ",") {
+		trimmedID := strings.TrimSpace(id)
+		if trimmedID != "" {
+			allUserIDs = append(allUserIDs, trimmedID)
+		}
+	}
+	if len(allUserIDs) == 0 {
+		allUserIDs = []string{userID}
+	}
+	return allUserIDs
+}
+
+// internalListsHandler отдает все списки пользователя одним ответом {категория: [элементы]}.
+// Категории передаются через ?categories=a,b,c; без параметра берутся все существующие ключи.
+// Все ключи читаются одним MGET вместо запроса на каждую категорию.
+func internalListsHandler(w http.ResponseWriter, r *http.Request) {
+	userID := getServiceUserID(r)
+	if userID == "" {
+		userID = "service"
+	}
+
+	ctx := r.Context()
+	client := getRedisClient()
+	defer client.Close()
+
+	allUserIDs := internalUserIDs(userID)
+
+	var categories []string
+	for _, category := range strings.Split(r.URL.Query().Get("categories"), ",") {
+		category = strings.TrimSpace(category)
+		if category != "" {
+			categories = append(categories, category)
+		}
+	}
+	if len(categories) == 0 {
+		seen := map[string]bool{}
+		for _, uid := range allUserIDs {
+			prefix := "shoppingList:" + uid + ":"
+			iter := client.Scan(ctx, 0, prefix+"*", 100).Iterator()
+			for iter.Next(ctx) {
+				category := strings.TrimPrefix(iter.Val(), prefix)
+				if !seen[category] {
+					seen[category] = true
+					categories = append(categories, category)
+				}
+			}
+			if err := iter.Err(); err != nil {
+				http.Error(w, err.Error(), http.StatusInternalServerError)
+				return
+			}
+		}
+	}
+
+	result := make(map[string][]Item, len(categories))
+	for _, category := range categories {
+		result[category] = []Item{}
+	}
+
+	if len(categories) > 0 {
+		keys := make([]string, 0, len(categories)*len(allUserIDs))
+		for _, uid := range allUserIDs {
+			for _, category := range categories {
+				keys = append(keys, "shoppingList:"+uid+":"+category)
+			}
+		}
+
+		values, err := client.MGet(ctx, keys...).Result()
+		if err != nil {
+			http.Error(w, err.Error(), http.StatusInternalServerError)
+			return
+		}
+
+		for i, value := range values {
+			val, ok := value.(string)
+			if !ok || val == "" {
+				continue
+			}
+			uid := allUserIDs[i/len(categories)]
+			category := categories[i%len(categories)]
+
+			var items []Item
+			if err := json.Unmarshal([]byte(val), &items); err != nil {
+				log.Printf("Ошибка парсинга JSON для %s: %v", keys[i], err)
+				continue
+			}
+			// Добавляем префикс с user_id, если пользователей несколько (как в /list)
+			if len(allUserIDs) > 1 {
+				for j := range items {
+					items[j].Name = "[" + uid + "] " + items[j].Name
+				}
+			}
+			result[category] = append(result[category], items...)
+		}
+	}
+
+	w.Header().Set("Content-Type", "application/json")
+	json.NewEncoder(w).Encode(result)
+}
+
+// internalBulkAddHandler добавляет несколько элементов за один запрос.
+// Элементы группируются по категориям: все списки читаются одним MGET и
+// записываются одним MSET, вместо чтения-записи списка на каждый элемент
+func internalBulkAddHandler(w http.ResponseWriter, r *http.Request) {
+	userID := getServiceUserID(r)
+	if userID == "" {
+		userID = "service"
+	}
+
+	var newItems []Item
+	if err := json.NewDecoder(r.Body).Decode(&newItems); err != nil {
+		http.Error(w, err.Error(), http.StatusBadRequest)
+		return
+	}
+
+	var categories []string
+	byCategory := map[string][]Item{}
+	for _, item := range newItems {
+		item.Name = strings.TrimSpace(item.Name)
+		item.Category = strings.TrimSpace(item.Category)
+		if item.Name == "" {
+			continue
+		}
+		if item.Category == "" {
+			http.Error(w, "Category is required", http.StatusBadRequest)
+			return
+		}
+		if item.Priority < 1 || item.Priority > 3 {
+			item.Priority = 2
+		}
+		if _, ok := byCategory[item.Category]; !ok {
+			categories = append(categories, item.Category)
+		}
+		byCategory[item.Category] = append(byCategory[item.Category], item)
+	}
+	if len(categories) == 0 {
+		http.Error(w, "No items provided", http.StatusBadRequest)
+		return
+	}
+
+	ctx := r.Context()
+	client := getRedisClient()
+	defer client.Close()
+
+	mutex.Lock()
+	defer mutex.Unlock()
+
+	keys := make([]string, len(categories))
+	for i, category := range categories {
+		keys[i] = "shoppingList:" + userID + ":" + category
+	}
+	values, err := client.MGet(ctx, keys...).Result()
+	if err != nil {
+		http.Error(w, err.Error(), http.StatusInternalServerError)
+		return
+	}
+
+	added := 0
+	pairs := make([]interface{}, 0, len(keys)*2)
+	for i, category := range categories {
+		var items []Item
+		if val, ok := values[i].(string); ok && val != "" {
+			if err := json.Unmarshal([]byte(val), &items); err != nil {
+				log.Printf("Ошибка парсинга JSON: %v, значение: %s", err, val)
+				items = []Item{}
+			}
+		}
+		for _, item := range byCategory[category] {
+			items = append(items, item)
+			logActivity("Added", item.Name)
+			added++
+		}
+
+		data, err := json.Marshal(items)
+		if err != nil {
+			http.Error(w, err.Error(), http.StatusInternalServerError)
+			return
+		}
+		pairs = append(pairs, keys[i], data)
+	}
+
+	if err := client.MSet(ctx, pairs...).Err(); err != nil {
+		http.Error(w, err.Error(), http.StatusInternalServerError)
+		return
+	}
+
+	w.Header().Set("Content-Type", "application/json")
+	w.WriteHeader(http.StatusCreated)
+	json.NewEncoder(w).Encode(map[string]interface{}{
+		"message": "Items added successfully",
+		"added":   added,
+	})
+}
@@ -0,0 +1,46 @@
+package main
+
+// Запуск: SESSION_SECRET=test go test ./... (init требует SESSION_SECRET)
+
+import (
+	"net/http"
+	"net/http/httptest"
+	"testing"
+
+	"github.com/gorilla/mux"
+)
+
+// Название с "/" приходит в пути как %2F и должно попасть в маршрут с {name} целиком
+func TestItemNameWithSlash(t *testing.T) {
+	router := newRouter()
+	cases := []struct {
+		method, path, want string
+	}{
+		{"DELETE", "/internal/api/delete/%D0%BC%D0%BE%D0%BB%D0%BE%D0%BA%D0%BE%2F%D0%BA%D0%B5%D1%84%D0%B8%D1%80?category=x", "молоко/кефир"},
+		{"PATCH", "/internal/api/item/a%2Fb%3F%23%20c?category=x", "a/b?# c"},
+		{"PUT", "/internal/api/buy/1%2F2", "1/2"},
+		{"PUT", "/edit/a%2Fb", "a/b"},
+		{"DELETE", "/delete/%D1%85%D0%BB%D0%B5%D0%B1", "хлеб"},
+	}
+	for _, c := range cases {
+		req := httptest.NewRequest(c.method, c.path, nil)
+		var match mux.RouteMatch
+		if !router.Match(req, &match) || match.MatchErr != nil {
+			t.Errorf("%s %s: маршрут не найден (%v)", c.method, c.path, match.MatchErr)
+			continue
+		}
+		req = mux.SetURLVars(req, match.Vars)
+		name, ok := pathName(httptest.NewRecorder(), req)
+		if !ok || name != c.want {
+			t.Errorf("%s %s: название %q, ожидалось %q", c.method, c.path, name, c.want)
+		}
+	}
+}
+
+func TestItemNameInvalidEscape(t *testing.T) {
+	req := mux.SetURLVars(httptest.NewRequest("DELETE", "/internal/api/delete/x", nil), map[string]string{"name": "%zz"})
+	w := httptest.NewRecorder()
+	if _, ok := pathName(w, req); ok || w.Code != http.StatusBadRequest {
+		t.Errorf("ожидался 400 для неверного экранирования, получен %d", w.Code)
+	}
+}
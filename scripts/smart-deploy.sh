@@ -130,6 +130,13 @@ else
             debug "  → telegram-bot (изменен: $file)"
         fi
         
+        # Общие модули Python-сервисов
+        if [[ "$file" == services/common/* ]]; then
+            SERVICES_MAP["alice"]=1
+            SERVICES_MAP["telegram-bot"]=1
+            debug "  → alice, telegram-bot (изменен: $file)"
+        fi
+        
         # Docker файлы
         if [[ "$file" == docker/Dockerfile ]]; then
             SERVICES_MAP["geshtalt"]=1
@@ -1,9 +1,32 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import requests
-import g4f
+from requests.adapters import HTTPAdapter
+import logging
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from common import internal_api, metrics
+from common.internal_api import APIError
+from common.health import Health
+from common.items import split_items
+from common.llm import LLMExecutor, build_scheduler
+from intents import build_router
+from common.recipe_cache import RecipeCache, recipe_prompt
+from common.redis_client import get_redis
+from common.resilience import CircuitBreaker, CircuitOpenError, backoff, hedged_call
+from common.tracing import REQUEST_ID_HEADER, Trace, setup_logging, stage
+from common.write_queue import Rejected, WriteBehindQueue
+
+setup_logging("alice")
+logger = logging.getLogger("alice")
 
 app = Flask(__name__)
+# Готовность воркера для /readyz: включается в конце импорта, когда созданы очередь записи,
+# кэш рецептов и маршрутизатор интентов, и снимается в начале остановки (gunicorn.conf.py)
+health = Health()
 
 # Хост и порт для обращения к geshtalt внутри Docker-сети
 GESHTALT_HOST = 'geshtalt'
@@ -13,105 +36,278 @@ BASE_URL = f'http://{GESHTALT_HOST}:{GESHTALT_PORT}/internal/api'
 # Получаем user_id для сервиса из .env
 SERVICE_USER_ID = os.getenv("SERVICE_USER_ID", "")
 
-# Формируем заголовки для внутреннего API
-def get_headers():
-    headers = {"Content-Type": "application/json"}
-    if SERVICE_USER_ID:
-        headers["X-User-ID"] = SERVICE_USER_ID
-    return headers
+# Яндекс Диалоги ждут ответ навыка около 3 секунд: весь вебхук, включая
+# обращения к бекенду и GPT, должен уложиться в этот бюджет
+RESPONSE_BUDGET = float(os.getenv("ALICE_RESPONSE_BUDGET", "2.5"))
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "1"))
+HTTP_POOL_SIZE = int(os.getenv("ALICE_HTTP_POOL", "16"))
+# Чтения повторяются и хеджируются в пределах бюджета; после BREAKER_FAILURES ошибок
+# подряд бекенд считается недоступным на BREAKER_RESET секунд, и навык отвечает из снимка
+API_RETRIES = int(os.getenv("API_RETRIES", "1"))
+API_HEDGE_AFTER = float(os.getenv("API_HEDGE_AFTER", "0.2"))
+# Таймауты и повторы урезаются до остатка бюджета; меньше MIN_BACKEND_TIME секунд — запрос не начинаем
+MIN_BACKEND_TIME = 0.05
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "10"))
+backend_breaker = CircuitBreaker("backend", failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET)
+# Потоки для хеджирующих запросов: второй запрос уходит, пока первый ещё ждёт ответа
+hedge_pool = ThreadPoolExecutor(max_workers=HTTP_POOL_SIZE, thread_name_prefix="backend")
 
-def add_to_shopping_list(item_name, category):
-    if not item_name.strip():  # Проверка на пустую строку
-        return {"error": "Item name cannot be empty"}
-    url = f'{BASE_URL}/add'
-    payload = {
-        "name": item_name,
-        "category": category
-    }
-    response = requests.post(url, json=payload, headers=get_headers())
-    return response.json()
-
-def get_list_by_category(category):
-    url = f'{BASE_URL}/list?category={category}'
-    response = requests.get(url, headers=get_headers())
-    if response.status_code == 200:
-        data = response.json()
-        print(f"Полученные данные для категории '{category}': {data}")
-        filtered_items = [item['name'] for item in data if item.get('category', '').lower() == category.lower() and item['name'].strip()]
-        print(f"Элементы в категории '{category}': {filtered_items}")
-        return filtered_items
-    else:
-        print(f"Ошибка получения данных: {response.status_code}, текст ошибки: {response.text}")
-        return []
+# Верхняя граница ожидания GPT; фактически ждём не дольше остатка бюджета
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "2.5"))
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "2"))
+# Провайдеры g4f для гонки (через запятую, например "Bing,You"); пусто — g4f выбирает сам.
+# Статистика провайдеров общая с другим сервисом через Redis, без Redis — в файле LLM_PROVIDER_STATE
+LLM_PROVIDERS = os.getenv("LLM_PROVIDERS", "")
+LLM_RACE = int(os.getenv("LLM_RACE", "2"))
+LLM_PROVIDER_STATE = os.getenv("LLM_PROVIDER_STATE", "")
+llm = LLMExecutor(
+    model='gpt-4', max_workers=LLM_WORKERS, timeout=LLM_TIMEOUT,
+    scheduler=build_scheduler(LLM_PROVIDERS, top_k=LLM_RACE, redis_client=get_redis(), state_path=LLM_PROVIDER_STATE),
+)
+# g4f загружается в фоне после старта воркера: воркер принимает запросы, не дожидаясь импорта,
+# а первый запрос рецепта не платит за него из бюджета ответа
+LLM_WARMUP = os.getenv("LLM_WARMUP", "true").lower() in ("1", "true", "yes")
+if LLM_WARMUP:
+    llm.warm_up_in_background()
 
-@app.route('/', methods=['POST'])
-def webhook():
-    data = request.json
-    print("Request received: ", data)
-    
-    command = data['request']['command'].strip().lower()
-    
-    if command == '':
-        response_text = "Привет, что нужно сделать?"
-    elif command.startswith('запиши') or command.startswith('записать'):
-        item_to_record = ' '.join(data['request']['nlu']['tokens'][1:])
-        if not item_to_record.strip():
-            response_text = "Пожалуйста, укажите, что нужно записать. Например: 'Запиши молоко'."
-        else:
-            print(f"Записано в список 'не-забыть': '{item_to_record}'")
-            api_response = add_to_shopping_list(item_to_record, 'не-забыть')
-            print("API response:", api_response)
-            if 'error' in api_response:
-                response_text = "Ошибка: не удалось добавить пустую запись."
-            else:
-                response_text = f"Записано в список 'не-забыть': '{item_to_record}'"
-    elif command.startswith('купить'):
-        item_to_buy = ' '.join(data['request']['nlu']['tokens'][1:])
-        if not item_to_buy.strip():
-            response_text = "Пожалуйста, укажите, что нужно купить. Например: 'Купить хлеб'."
-        else:
-            print(f"Записано в список 'купить': '{item_to_buy}'")
-            api_response = add_to_shopping_list(item_to_buy, 'купить')
-            print("API response:", api_response)
-            if 'error' in api_response:
-                response_text = "Ошибка: не удалось добавить пустую запись."
+# Кэш предложений блюд по содержимому холодильника (общий с ботом Redis)
+RECIPE_CACHE_TTL = int(os.getenv("RECIPE_CACHE_TTL", str(6 * 3600)))
+RECIPE_CACHE_MAX = int(os.getenv("RECIPE_CACHE_MAX", "256"))
+recipe_cache = RecipeCache(get_redis(), ttl=RECIPE_CACHE_TTL, max_entries=RECIPE_CACHE_MAX)
+
+# Категории, которые читает навык, и время жизни снимка списков
+ALICE_CATEGORIES = ['купить', 'не-забыть', 'холодос']
+LISTS_SNAPSHOT_TTL = float(os.getenv("LISTS_SNAPSHOT_TTL", "10"))
+_lists_lock = threading.Lock()
+_lists_snapshot = (0, None)
+# Идущая загрузка снимка (Future) и номер сброса снимка, при котором она началась
+_lists_loading = None
+_lists_generation = 0
+# Последнее увиденное значение write_queue.flushed(): так снимок сбрасывается и после записи другого воркера
+_lists_flushed = -1
+
+# Очередь отложенной записи добавлений: файл SQLite (общий для воркеров) и окно склейки.
+# В образе файл лежит на томе /data/alice, чтобы подтверждённые пользователю добавления
+# переживали перезапуск воркера и контейнера
+WRITE_QUEUE_PATH = os.getenv("ALICE_QUEUE_PATH", os.path.join(tempfile.gettempdir(), "alice", "write_queue.db"))
+WRITE_BATCH_WINDOW = float(os.getenv("WRITE_BATCH_WINDOW", "0.2"))
+
+# Общая сессия с пулом keep-alive соединений к бекенду для всех потоков сервера;
+# заголовки (X-User-ID, X-Request-ID, Content-Type) собирает internal_api.Call
+http = requests.Session()
+http.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE))
+
+def _backend_call(call, route, headers, timeout):
+    started = time.perf_counter()
+    try:
+        response = http.request(
+            call.method, f'{BASE_URL}{call.path}', params=call.params, data=call.body, headers=headers,
+            timeout=timeout,
+        )
+    except requests.RequestException:
+        metrics.observe_backend(call.method, route, time.perf_counter() - started)
+        raise
+    metrics.observe_backend(call.method, route, time.perf_counter() - started, response.status_code)
+    return response
+
+def _retry_fits(deadline, pause):
+    """Хватит ли бюджета на паузу и ещё одну попытку."""
+    return deadline is None or deadline - time.monotonic() - pause >= MIN_BACKEND_TIME
+
+def backend_request(call, user=SERVICE_USER_ID, deadline=None):
+    """Запрос к внутреннему API (internal_api.Call) через автомат отключения; GET повторяется и хеджируется.
+
+    С deadline (time.monotonic()) таймаут каждой попытки и паузы между ними не выходят за бюджет
+    ответа, а повтор, на который не осталось времени, не делается. Ответ 5xx после всех попыток
+    возвращается как есть. Бросает CircuitOpenError, если бекенд отключен автоматом, и
+    requests.Timeout, если бюджет кончился до запроса.
+    """
+    route = metrics.route_of(call.path)
+    headers = call.headers(user)
+    idempotent = call.method == 'GET'
+    attempts = 1 + (API_RETRIES if idempotent else 0)
+    for attempt in range(1, attempts + 1):
+        timeout = API_TIMEOUT
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout < MIN_BACKEND_TIME:
+                raise requests.Timeout("бюджет ответа исчерпан до запроса к бекенду")
+        backend_breaker.check()
+        try:
+            if idempotent and API_HEDGE_AFTER and API_HEDGE_AFTER < timeout:
+                # Хеджирующая копия уходит позже и получает только остаток таймаута попытки
+                attempt_end = time.monotonic() + timeout
+                response = hedged_call(
+                    hedge_pool, lambda: _backend_call(call, route, headers, attempt_end - time.monotonic()),
+                    API_HEDGE_AFTER,
+                    on_hedge=lambda: metrics.BACKEND_RETRIES.labels(route, 'hedge').inc(),
+                )
             else:
-                response_text = f"Записано в список 'купить': '{item_to_buy}'"
-    elif command == 'что купить':
-        items_to_buy = get_list_by_category('купить')
-        if items_to_buy:
-            response_text = "В списке 'купить': " + ', '.join(items_to_buy)
-        else:
-            response_text = "Список 'купить' пуст."
-    elif command == 'что не забыть':
-        items_to_remember = get_list_by_category('не-забыть')
-        if items_to_remember:
-            response_text = "В списке 'не-забыть': " + ', '.join(items_to_remember)
-        else:
-            response_text = "Список 'не-забыть' пуст."
-    elif command == 'что в холодильнике':
-        items_in_fridge = get_list_by_category('холодос')
-        if items_in_fridge:
-            response_text = "В холодильнике: " + ', '.join(items_in_fridge)
-        else:
-            response_text = "В холодильнике пусто."
-    elif command == 'что приготовить':
-        items_in_fridge = get_list_by_category('холодос')
-        if items_in_fridge:
-            print(f"Продукты в холодильнике: {items_in_fridge}")
-            prompt = f"Что можно приготовить из таких продуктов: {', '.join(items_in_fridge)}? Назови только 5 названий блюд."
-            try:
-                response_from_gpt = g4f.ChatCompletion.create(model='gpt-4', messages=[{"role": "user", "content": prompt}])
-                print(f"Ответ от GPT: {response_from_gpt}")
-                response_text = f"{response_from_gpt}"
-            except Exception as e:
-                print(f"Ошибка при обращении к GPT: {e}")
-                response_text = "Извините, произошла ошибка при запросе рецепта."
+                response = _backend_call(call, route, headers, timeout)
+        except requests.RequestException:
+            backend_breaker.failure()
+            pause = backoff(attempt, 0.05, 0.4)
+            if attempt == attempts or not _retry_fits(deadline, pause):
+                raise
         else:
-            response_text = "В холодильнике пусто, нечего приготовить."
-    else:
-        response_text = "Извините, я не понимаю эту команду."
+            if response.status_code < 500:
+                backend_breaker.success()
+                return response
+            backend_breaker.failure()
+            pause = backoff(attempt, 0.05, 0.4)
+            if attempt == attempts or not _retry_fits(deadline, pause):
+                return response
+        metrics.BACKEND_RETRIES.labels(route, 'retry').inc()
+        time.sleep(pause)
+
+def send_adds(user, items):
+    """Отправляет накопленные в очереди добавления пользователя одним запросом к /add/bulk."""
+    call = internal_api.add_items(items)
+    response = backend_request(call, user)
+    try:
+        call.result(response.status_code, response.content)
+    except APIError as e:
+        if e.status_code >= 500 or e.status_code in (408, 429):
+            raise
+        # Бекенд отверг элементы, повтор не поможет: очередь переносит их в rejected и пишет в лог
+        raise Rejected(f"{e.status_code} - {e.text[:200]}") from e
+
+# Снимок списков сбрасывается, когда бекенд подтвердил запись: в этом воркере сразу через on_flushed,
+# в остальных — по счётчику write_queue.flushed() при следующем чтении снимка
+write_queue = WriteBehindQueue(
+    send_adds, path=WRITE_QUEUE_PATH, window=WRITE_BATCH_WINDOW,
+    on_flushed=lambda user: invalidate_lists_snapshot(),
+)
+
+def shutdown():
+    """Останавливает воркер: снимает готовность и досылает очередь записи (вызывается из gunicorn worker_exit).
+
+    Что не успело уйти за несколько секунд, остаётся в файле очереди и уйдёт после перезапуска.
+    """
+    health.set_ready(False)
+    write_queue.close(timeout=5.0)
+
+def add_to_shopping_list(items, category):
+    """Ставит элементы в очередь записи; ответ пользователю не ждёт бекенд."""
+    items = [name for name in items if name.strip()]
+    if not items:  # Проверка на пустую строку
+        return {"error": "Item name cannot be empty"}
+    write_queue.put(SERVICE_USER_ID, [{"name": name, "category": category} for name in items])
+    return {"queued": len(items)}
+
+def _fetch_lists(stale, deadline):
+    """Загружает /lists: (списки, свежие ли). При сбое бекенда отдаёт stale, если он есть."""
+    call = internal_api.get_lists(ALICE_CATEGORIES)
+    try:
+        with stage("backend"):
+            response = backend_request(call, deadline=deadline)
+    except (requests.RequestException, CircuitOpenError) as e:
+        if stale is None:
+            raise
+        # Бекенд недоступен: отвечаем по устаревшему снимку, а не ошибкой
+        logger.warning("Бекенд недоступен, ответ из старого снимка", extra={"fields": {"error": str(e)}})
+        metrics.CACHE_REQUESTS.labels("lists_snapshot", "stale").inc()
+        return stale, False
+    try:
+        fresh = call.result(response.status_code, response.content)
+    except APIError as e:
+        logger.error("Ошибка получения данных", extra={"fields": {"status": e.status_code, "body": e.text[:200]}})
+        if stale is not None and e.status_code >= 500:
+            metrics.CACHE_REQUESTS.labels("lists_snapshot", "stale").inc()
+            return stale, False
+        return {}, False
+    metrics.CACHE_REQUESTS.labels("lists_snapshot", "miss").inc()
+    return fresh, True
+
+def get_lists_snapshot(deadline=None):
+    """Возвращает снимок всех списков навыка, загруженный одним запросом к /lists.
+
+    Снимок живёт LISTS_SNAPSHOT_TTL секунд, поэтому "что купить" и "что не забыть"
+    подряд обслуживаются без повторных обращений к бекенду. Загрузка идёт вне
+    блокировки и одна на воркер: остальные потоки ждут её Future не дольше своего
+    deadline. Запись, подтверждённая любым воркером (write_queue.flushed()),
+    делает снимок устаревшим. Если бекенд недоступен или не успел, ответ идёт
+    из последнего снимка, даже устаревшего.
+    """
+    global _lists_snapshot, _lists_loading, _lists_generation, _lists_flushed
+    flushed = write_queue.flushed()
+    with _lists_lock:
+        if flushed > _lists_flushed:
+            _lists_flushed = flushed
+            _lists_snapshot = (0, _lists_snapshot[1])
+            _lists_generation += 1
+        expires_at, stale = _lists_snapshot
+        if stale is not None and expires_at > time.monotonic():
+            metrics.CACHE_REQUESTS.labels("lists_snapshot", "hit").inc()
+            return stale
+        loading = _lists_loading
+        leader = loading is None
+        if leader:
+            loading = _lists_loading = Future()
+            generation = _lists_generation
+
+    if not leader:
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        try:
+            return loading.result(timeout=timeout)
+        except FutureTimeoutError:
+            if stale is None:
+                raise requests.Timeout("снимок списков не загрузился в бюджет ответа")
+            metrics.CACHE_REQUESTS.labels("lists_snapshot", "stale").inc()
+            return stale
+
+    try:
+        lists, fresh = _fetch_lists(stale, deadline)
+    except BaseException as e:
+        with _lists_lock:
+            _lists_loading = None
+        loading.set_exception(e)
+        raise
+    with _lists_lock:
+        # Если снимок сбросили во время загрузки, ответ мог не застать запись: сохраняем его
+        # запасным, но не свежим
+        if fresh and generation == _lists_generation:
+            _lists_snapshot = (time.monotonic() + LISTS_SNAPSHOT_TTL, lists)
+        elif fresh:
+            _lists_snapshot = (0, lists)
+        _lists_loading = None
+    loading.set_result(lists)
+    return lists
 
+def invalidate_lists_snapshot():
+    """Помечает снимок устаревшим; сам снимок остаётся запасным ответом на случай сбоя бекенда."""
+    global _lists_snapshot, _lists_generation
+    with _lists_lock:
+        _lists_snapshot = (0, _lists_snapshot[1])
+        _lists_generation += 1
+
+def get_list_by_category(category, deadline=None):
+    # Бекенд отдаёт элементы уже по категориям, отбрасываем только пустые названия
+    data = get_lists_snapshot(deadline).get(category) or []
+    filtered_items = [item['name'] for item in data if item['name'].strip()]
+    # Добавления, которые ещё в очереди, показываем сразу
+    for item in write_queue.pending(SERVICE_USER_ID, category):
+        if item['name'] not in filtered_items:
+            filtered_items.append(item['name'])
+    return filtered_items
+
+def suggest_recipes(items, deadline):
+    """Возвращает блюда из кэша или от GPT, либо None, если GPT не успел до дедлайна.
+
+    Незавершённый вызов продолжает работать в пуле и по готовности попадает в кэш,
+    откуда его забирает следующий запрос пользователя.
+    """
+    cached = recipe_cache.get(items)
+    if cached is not None:
+        return cached
+    timeout = min(LLM_TIMEOUT, max(0.0, deadline - time.monotonic()))
+    with stage("llm"):
+        return llm.complete(
+            recipe_prompt(items), timeout=timeout, on_result=lambda text: recipe_cache.set(items, text)
+        )
+
+def build_response(data, response_text, session_state=None):
     response = {
         "version": "1.0",
         "session": {
@@ -125,11 +321,159 @@ def webhook():
             "end_session": False
         }
     }
-    
-    print("Response to be sent: ", response)
-    
-    return jsonify(response)
+    if session_state is not None:
+        response["session_state"] = session_state
+    return response
+
+@app.errorhandler(requests.RequestException)
+@app.errorhandler(CircuitOpenError)
+def api_unavailable(e):
+    """Бекенд не ответил в отведённое время — отвечаем Алисе сразу, а не ошибкой 500."""
+    logger.error("Ошибка обращения к API", extra={"fields": {"error": str(e)}})
+    return jsonify(build_response(request.json, "Не получилось связаться со списками, попробуйте ещё раз."))
+
+def command_argument(match, ctx):
+    """Текст после фразы команды с исходной пунктуацией.
+
+    В nlu.tokens запятых нет, поэтому для разбиения "молоко, хлеб и яйца"
+    берём те же слова из original_utterance.
+    """
+    original = ctx['data']['request'].get('original_utterance') or ''
+    words = original.split()
+    consumed = len(ctx['tokens']) - len(match.args)
+    if len(words) != len(ctx['tokens']):
+        return match.text
+    return ' '.join(words[consumed:])
+
+def add_item(match, ctx, category, example):
+    items = split_items(command_argument(match, ctx))
+    if not items:
+        return f"Пожалуйста, укажите, что нужно {example}", None
+    api_response = add_to_shopping_list(items, category)
+    if 'error' in api_response:
+        logger.error("Ошибка добавления", extra={"fields": {"error": api_response['error']}})
+        return "Ошибка: не удалось добавить запись.", None
+    return f"Записано в список '{category}': " + ', '.join(f"'{name}'" for name in items), None
+
+def show_list(category, prefix, empty, deadline):
+    items = get_list_by_category(category, deadline)
+    if items:
+        return prefix + ', '.join(items), None
+    return empty, None
+
+def handle_greeting(match, ctx):
+    return "Привет, что нужно сделать?", None
+
+def handle_add_remember(match, ctx):
+    return add_item(match, ctx, 'не-забыть', "записать. Например: 'Запиши молоко'.")
+
+def handle_add_buy(match, ctx):
+    return add_item(match, ctx, 'купить', "купить. Например: 'Купить хлеб'.")
+
+def handle_list_buy(match, ctx):
+    return show_list('купить', "В списке 'купить': ", "Список 'купить' пуст.", ctx['deadline'])
+
+def handle_list_remember(match, ctx):
+    return show_list('не-забыть', "В списке 'не-забыть': ", "Список 'не-забыть' пуст.", ctx['deadline'])
+
+def handle_list_fridge(match, ctx):
+    return show_list('холодос', "В холодильнике: ", "В холодильнике пусто.", ctx['deadline'])
+
+def handle_suggest_recipes(match, ctx):
+    items_in_fridge = get_list_by_category('холодос', ctx['deadline'])
+    if not items_in_fridge:
+        return "В холодильнике пусто, нечего приготовить.", None
+    try:
+        response_from_gpt = suggest_recipes(items_in_fridge, ctx['deadline'])
+    except Exception as e:
+        logger.error("Ошибка при обращении к GPT", extra={"fields": {"error": str(e)}})
+        return "Извините, произошла ошибка при запросе рецепта.", None
+    if response_from_gpt is None:
+        # Не успели в бюджет: отдаём промежуточный ответ, результат заберём на следующем шаге
+        return ("Подбираю блюда, это займёт пару секунд. Скажите «дальше», и я расскажу.",
+                {"pending_recipe": items_in_fridge})
+    return response_from_gpt, None
+
+def handle_recipe_followup(match, ctx):
+    pending_recipe = ctx['state'].get('pending_recipe')
+    if not pending_recipe:
+        return handle_unknown(match, ctx)
+    try:
+        dishes = suggest_recipes(pending_recipe, ctx['deadline'])
+    except Exception as e:
+        # В том числе CircuitOpenError: GPT отключен автоматом после серии ошибок
+        logger.error("Ошибка при обращении к GPT", extra={"fields": {"error": str(e)}})
+        return "Извините, произошла ошибка при запросе рецепта.", {}
+    if dishes is None:
+        return "Всё ещё подбираю блюда. Скажите «дальше» через пару секунд.", {"pending_recipe": pending_recipe}
+    return dishes, {}
+
+def handle_unknown(match, ctx):
+    return "Извините, я не понимаю эту команду.", None
+
+router = build_router()
+
+INTENT_HANDLERS = {
+    "greeting": handle_greeting,
+    "add_remember": handle_add_remember,
+    "add_buy": handle_add_buy,
+    "list_buy": handle_list_buy,
+    "list_remember": handle_list_remember,
+    "list_fridge": handle_list_fridge,
+    "suggest_recipes": handle_suggest_recipes,
+    "recipe_followup": handle_recipe_followup,
+}
+
+@app.route('/', methods=['POST'])
+def webhook():
+    deadline = time.monotonic() + RESPONSE_BUDGET
+    with Trace("alice.webhook", request_id=request.headers.get(REQUEST_ID_HEADER)) as trace:
+        with trace.stage("parse"):
+            data = request.json
+            logger.debug("Request received", extra={"fields": {"payload": data}})
+
+            # Алиса присылает уже разбитые на токены слова без пунктуации
+            tokens = data['request'].get('nlu', {}).get('tokens')
+            if tokens is None:
+                tokens = data['request']['command'].lower().split()
+            # Состояние сессии Алиса возвращает в следующем запросе
+            state = (data.get('state') or {}).get('session') or {}
+            ctx = {"data": data, "tokens": tokens, "deadline": deadline, "state": state}
+            match = router.match(tokens)
+
+        trace.fields["intent"] = match.intent if match else "unknown"
+        handler = INTENT_HANDLERS.get(match.intent, handle_unknown) if match else handle_unknown
+        response_text, session_state = handler(match, ctx)
+
+        with trace.stage("render"):
+            if session_state is None and state.get('pending_recipe'):
+                # Другая команда не сбрасывает ожидание блюд
+                session_state = state
+            response = build_response(data, response_text, session_state)
+            logger.debug("Response to be sent", extra={"fields": {"payload": response}})
+            return jsonify(response)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Снаружи маршрут закрыт в nginx, метрики забирает Prometheus внутри кластера
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+# Пробы Kubernetes: /healthz — воркер обслуживает запросы, /readyz — флаг health (503 до конца
+# импорта и после сигнала остановки); g4f к готовности не относится (грузится в фоне)
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return Response("ok\n", content_type="text/plain; charset=utf-8")
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    if not health.ready:
+        return Response("unavailable\n", status=503, content_type="text/plain; charset=utf-8")
+    return Response("ok\n", content_type="text/plain; charset=utf-8")
+
+health.set_ready()
 
 if __name__ == '__main__':
+    # Локальный запуск; в Docker сервис запускается через gunicorn (см. docker/Dockerfile.python)
     # Flask работает только по HTTP, SSL терминация происходит в Nginx
-    app.run(host='0.0.0.0', port=2112, debug=False)
+    app.run(host='0.0.0.0', port=2112, debug=False, threaded=True)
@@ -0,0 +1,55 @@
+"""Настройки gunicorn для метрик Prometheus в нескольких воркерах и остановки воркеров.
+
+Gunicorn подхватывает этот файл сам (он лежит в рабочем каталоге образа).
+Воркеры пишут метрики в PROMETHEUS_MULTIPROC_DIR; каталог очищается при
+старте мастера, а значения gauge умершего воркера убираются при его выходе.
+Получив SIGTERM или SIGINT, воркер сразу снимает готовность (/readyz отвечает
+503), а перед выходом досылает очередь записи добавлений (alice.shutdown).
+"""
+import os
+import shutil
+import signal
+import sys
+
+
+def _not_ready():
+    alice = sys.modules.get("alice")
+    if alice is not None:
+        alice.health.set_ready(False)
+
+
+def on_starting(server):
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    # Gunicorn ставит свой обработчик SIGTERM до загрузки приложения; оборачиваем его,
+    # чтобы готовность снималась в момент сигнала, а не после остановки обработки запросов
+    handle_exit = worker.handle_exit
+
+    def on_term(sig, frame):
+        _not_ready()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, on_term)
+
+
+def worker_int(worker):
+    # SIGINT/SIGQUIT воркеру
+    _not_ready()
+
+
+def worker_exit(server, worker):
+    # Выполняется в самом воркере после остановки обработки запросов
+    alice = sys.modules.get("alice")
+    if alice is not None:
+        alice.shutdown()
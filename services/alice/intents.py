@@ -0,0 +1,120 @@
+"""Маршрутизация команд Алисы по интентам.
+
+Фразы команд раскладываются в префиксное дерево по токенам. Каждый токен
+перед вставкой и поиском нормализуется: синонимы сводятся к одному слову,
+а окончания русских глаголов и существительных срезаются, поэтому "купи",
+"купить" и "купите" попадают в один узел. Поиск проходит по токенам
+высказывания один раз, время разбора не зависит от числа команд.
+
+Модуль не зависит от Flask и бекенда: тесты — services/tests/test_intents.py,
+замер скорости — services/bench/micro_intents.py.
+"""
+
+# Окончания, которые срезаются при нормализации (сначала длинные)
+_SUFFIXES = sorted([
+    "ывать", "ивать", "ать", "ять", "еть", "ить", "уть", "ться", "тся",
+    "ите", "йте", "ешь", "ишь", "ем", "им", "ет", "ит", "ут", "ют",
+    "ый", "ий", "ой", "ая", "яя", "ое", "ее", "ые", "ие",
+    "е", "и", "й", "у", "ю", "ь", "а", "я", "о", "ы",
+], key=len, reverse=True)
+
+# Короче этого основа не укорачивается, чтобы "что" и "не" не превращались в мусор
+_MIN_STEM = 3
+
+_INTENT = object()
+
+
+def stem(token):
+    """Нормализует токен: нижний регистр, ё→е, срезанное окончание."""
+    token = token.lower().replace("ё", "е")
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= _MIN_STEM:
+            return token[:-len(suffix)]
+    return token
+
+
+class Match:
+    """Результат разбора: интент и токены после фразы команды (аргумент)."""
+
+    __slots__ = ("intent", "args")
+
+    def __init__(self, intent, args):
+        self.intent = intent
+        self.args = args
+
+    @property
+    def text(self):
+        return " ".join(self.args)
+
+    def __repr__(self):
+        return f"Match({self.intent!r}, {self.args!r})"
+
+
+class IntentRouter:
+    """Префиксное дерево фраз команд над нормализованными токенами."""
+
+    def __init__(self):
+        self._root = {}
+        self._synonyms = {}
+
+    def synonyms(self, canonical, *variants):
+        """Сводит варианты слова к canonical (например, "запиши" и "добавь")."""
+        target = self._normalize(canonical)
+        for variant in variants:
+            self._synonyms[stem(variant)] = target
+
+    def add(self, intent, *phrases, takes_args=False):
+        """Регистрирует фразы интента.
+
+        Интент с takes_args срабатывает, если фраза является префиксом высказывания,
+        остаток становится аргументом. Без takes_args фраза должна совпасть целиком.
+        """
+        for phrase in phrases:
+            node = self._root
+            for token in phrase.split():
+                node = node.setdefault(self._normalize(token), {})
+            node[_INTENT] = (intent, takes_args)
+
+    def _normalize(self, token):
+        key = stem(token)
+        return self._synonyms.get(key, key)
+
+    def match(self, tokens):
+        """Находит самую длинную подходящую фразу. Возвращает Match или None."""
+        # Все фразы-префиксы высказывания собираются за один проход по токенам
+        candidates = []
+        node = self._root
+        if _INTENT in node:
+            candidates.append((node[_INTENT], 0))
+        for i, token in enumerate(tokens):
+            node = node.get(self._normalize(token))
+            if node is None:
+                break
+            if _INTENT in node:
+                candidates.append((node[_INTENT], i + 1))
+        # От длинной фразы к короткой: интенты без аргументов требуют полного совпадения
+        for (intent, takes_args), length in reversed(candidates):
+            if takes_args or length == len(tokens):
+                return Match(intent, list(tokens[length:]))
+        return None
+
+
+def build_router():
+    """Интенты навыка Алисы."""
+    router = IntentRouter()
+    router.synonyms("запиши", "записать", "записывай", "запишите", "добавь", "добавить", "внеси")
+    router.synonyms("купить", "куплю", "покупай", "покупать", "прикупить")
+    router.synonyms("холодильник", "холодильнике", "холодос", "холодосе")
+    router.synonyms("приготовить", "сготовить", "готовить", "сварить")
+    router.synonyms("дальше", "далее", "продолжай", "рассказывай")
+
+    router.add("greeting", "")
+    router.add("add_remember", "запиши", "напомни", takes_args=True)
+    router.add("add_buy", "купить", "надо купить", "нужно купить", takes_args=True)
+    router.add("list_buy", "что купить", "что нужно купить", "что надо купить", "список покупок")
+    router.add("list_remember", "что не забыть", "что нужно не забыть")
+    router.add("list_fridge", "что в холодильнике", "что есть в холодильнике")
+    router.add("suggest_recipes", "что приготовить", "что можно приготовить")
+    router.add("recipe_followup", "дальше", "ну", "ну что")
+    return router
+
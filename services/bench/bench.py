@@ -0,0 +1,480 @@
+"""Офлайн нагрузочный тест навыка Алисы и телеграм-бота.
+
+Внутренний API geshtalt, g4f и Telegram Bot API заменяются локальными
+заглушками с настраиваемой задержкой, поэтому тест не ходит в сеть и его
+результаты воспроизводимы. Сервис импортируется как есть, запросы проходят
+через настоящие хендлеры: маршрут "/" Алисы получает записанные запросы
+Яндекс Диалогов (alice_payloads.jsonl), бот получает синтетические Update —
+нажатия кнопок и ввод текста, как при работе с реальным пользователем.
+
+В отчёте p50/p95/p99/max по сценариям, пропускная способность, число
+ошибок и запросов к заглушкам. Запуск из services/:
+
+    python bench/bench.py alice --requests 2000 --concurrency 16
+    python bench/bench.py bot --users 50 --rounds 5 --tg-latency 0.05
+    python bench/bench.py alice --json --max-p95 300   # для CI: код 1 при превышении
+    python bench/bench.py llm --llm-providers Fast:0.5:0.3,Steady:1.5:0,Slow:6:0.1
+    python bench/bench.py startup --runs 5         # время импорта сервисов (холодный старт)
+
+Цель startup не запускает нагрузку: она импортирует каждый сервис в
+отдельном процессе с python -X importtime и показывает время до готовности
+и самые тяжёлые модули. Здесь используется настоящий g4f, а не заглушка,
+чтобы было видно, попадает ли он в старт.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import stub_g4f
+from stub_api import StubAPI
+
+BENCH_DIR = Path(__file__).resolve().parent
+SERVICES_DIR = BENCH_DIR.parent
+CATEGORIES = ["купить", "не-забыть", "холодос"]
+
+
+def percentile(sorted_values, p):
+    """Перцентиль по методу ближайшего ранга."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Длительности по сценариям (потокобезопасно) и число ошибок."""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = 0
+        # Замеры внутри других сценариев (например, время до первого текста): не входят в "всего"
+        self.partial = set()
+        self._lock = threading.Lock()
+
+    def add(self, scenario, seconds, ok=True):
+        with self._lock:
+            self.samples.setdefault(scenario, []).append(seconds)
+            if not ok:
+                self.errors += 1
+
+    def add_partial(self, scenario, seconds):
+        with self._lock:
+            self.samples.setdefault(scenario, []).append(seconds)
+            self.partial.add(scenario)
+
+    def report(self, elapsed):
+        rows = {}
+        everything = []
+        for scenario, values in sorted(self.samples.items()):
+            values = sorted(values)
+            if scenario not in self.partial:
+                everything.extend(values)
+            rows[scenario] = self._row(values)
+        everything.sort()
+        return {
+            "scenarios": rows,
+            "total": self._row(everything),
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(len(everything) / elapsed, 1) if elapsed else 0.0,
+            "errors": self.errors,
+        }
+
+    @staticmethod
+    def _row(values):
+        return {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "max_ms": round((values[-1] if values else 0.0) * 1000, 2),
+        }
+
+
+def print_report(title, report):
+    print(f"\n{title}")
+    print(f"{'сценарий':<24}{'запросов':>9}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'max мс':>10}")
+    for scenario, row in [*report["scenarios"].items(), ("всего", report["total"])]:
+        print(f"{scenario:<24}{row['count']:>9}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+    print(f"\nвремя {report['elapsed_s']} с, {report['throughput_rps']} запросов/с, ошибок {report['errors']}")
+    print("заглушка API:", ", ".join(f"{route} {n}" for route, n in sorted(report["backend"].items())))
+    print("вызовов g4f:", report["llm_calls"])
+    if report.get("providers"):
+        print("провайдеры:", ", ".join(f"{name} {n}" for name, n in sorted(report["providers"].items())))
+
+
+def prepare_env(args, service, api_url):
+    """Окружение сервиса до его импорта: адрес заглушки, без Redis, тихие логи."""
+    os.environ.update({
+        "API_URL": api_url,
+        "SERVICE_USER_ID": "bench",
+        "REDIS_ADDR": "",
+        "REDIS_HOST": "",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "ERROR"),
+        "WRITE_BATCH_WINDOW": str(args.write_window),
+        "LLM_STREAM": "false" if args.no_llm_stream else "true",
+        # Новый файл очереди записи на каждый прогон: остаток прошлого прогона не должен уйти в заглушку
+        "ALICE_QUEUE_PATH": os.path.join(tempfile.mkdtemp(prefix="bench-"), "write_queue.db"),
+    })
+    sys.path[:0] = [str(SERVICES_DIR / service), str(SERVICES_DIR)]
+
+
+# Алиса
+
+def load_payloads(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_alice(args, stub, g4f):
+    prepare_env(args, "alice", stub.url)
+    import alice
+
+    alice.BASE_URL = stub.url
+    payloads = load_payloads(args.payloads)
+    recorder = Recorder()
+    local = threading.local()
+
+    def one(n):
+        if not hasattr(local, "client"):
+            local.client = alice.app.test_client()
+        record = payloads[n % len(payloads)]
+        started = time.perf_counter()
+        response = local.client.post("/", json=record["payload"])
+        elapsed = time.perf_counter() - started
+        ok = response.status_code == 200 and "text" in (response.get_json() or {}).get("response", {})
+        recorder.add(record["scenario"], elapsed, ok)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    # Очередь записи досылает добавления уже после ответа; ждём её, чтобы посчитать запросы в бекенд
+    alice.write_queue.close(timeout=10)
+
+    report = recorder.report(elapsed)
+    report.update(backend=dict(stub.requests), llm_calls=len(g4f.calls))
+    return report
+
+
+# GPT
+
+def run_llm(args, stub, g4f):
+    """Предложения блюд без кэша: каждый запрос — новый набор продуктов, вызов g4f (или гонка провайдеров)."""
+    sys.path[:0] = [str(SERVICES_DIR)]
+    from common.llm import LLMExecutor, build_scheduler
+
+    scheduler = build_scheduler(
+        os.getenv("LLM_PROVIDERS", ""), top_k=args.llm_race, state_path=os.getenv("LLM_PROVIDER_STATE", "")
+    )
+    llm = LLMExecutor(max_workers=args.concurrency, max_pending=args.concurrency * 2, timeout=60, scheduler=scheduler)
+    recorder = Recorder()
+
+    def one(n):
+        started = time.perf_counter()
+        try:
+            ok = llm.complete(f"Что приготовить из: продукт {n}?") is not None
+        except Exception:
+            ok = False
+        recorder.add("suggest", time.perf_counter() - started, ok)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    llm.shutdown()
+
+    report = recorder.report(elapsed)
+    report.update(backend=dict(stub.requests), llm_calls=len(g4f.calls), providers=dict(Counter(g4f.calls)))
+    if scheduler is not None:
+        report["provider_stats"] = scheduler.stats()
+    return report
+
+
+# Телеграм-бот
+
+def make_fake_bot(latency, limiter=None):
+    """Bot, который вместо Telegram Bot API отвечает из памяти с задержкой latency.
+
+    Экземпляры Bot неизменяемы, поэтому состояние хранится в атрибутах класса.
+    С limiter (SendQueue бота) запросы проходят через очередь с лимитами Telegram.
+    """
+    from telegram import Bot, Chat, Message, User
+
+    class FakeBot(Bot):
+        screens = {}  # chat_id -> последнее отправленное или отредактированное сообщение
+        shown = {}  # chat_id -> [(время, текст)] отправок и правок
+        calls = {}
+        message_ids = iter(range(1, 10 ** 9))
+        me = User(1, "bench_bot", is_bot=True, username="bench_bot")
+
+        def _message(self, chat_id, text, reply_markup):
+            message = Message(
+                next(self.message_ids), datetime.now(timezone.utc), Chat(chat_id, Chat.PRIVATE),
+                from_user=self.me, text=text, reply_markup=reply_markup,
+            )
+            message.set_bot(self)
+            self.screens[chat_id] = message
+            self.shown.setdefault(chat_id, []).append((time.perf_counter(), text))
+            return message
+
+        async def _send(self, method):
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if latency:
+                await asyncio.sleep(latency)
+            return {}
+
+        async def _call(self, method, data):
+            if limiter is None:
+                return await self._send(method)
+            return await limiter.process_request(self._send, (method,), {}, method, data, None)
+
+        async def send_message(self, chat_id, text, *args, reply_markup=None, **kwargs):
+            await self._call("sendMessage", {"chat_id": chat_id})
+            return self._message(chat_id, text, reply_markup)
+
+        async def edit_message_text(self, text, chat_id=None, message_id=None, *args, reply_markup=None, **kwargs):
+            if await self._call("editMessageText", {"chat_id": chat_id, "message_id": message_id}) is True:
+                # Очередь склеила правку с более новой
+                return True
+            return self._message(chat_id, text, reply_markup)
+
+        async def answer_callback_query(self, callback_query_id, *args, **kwargs):
+            await self._call("answerCallbackQuery", {"callback_query_id": callback_query_id})
+            return True
+
+    return FakeBot("123456:bench")
+
+
+def button(message, prefix):
+    """callback_data кнопок сообщения, начинающиеся с prefix."""
+    markup = message.reply_markup
+    if markup is None:
+        return []
+    return [b.callback_data for row in markup.inline_keyboard for b in row if (b.callback_data or "").startswith(prefix)]
+
+
+async def run_bot_async(args, stub, g4f):
+    prepare_env(args, "telegram-bot", stub.url)
+    os.environ["TELEGRAM_TOKEN"] = "123456:bench"
+    from telegram import CallbackQuery, Chat, Message, Update, User
+    import telegram_bot as tb
+
+    limiter = None
+    if args.tg_limits:
+        limiter = tb.SendQueue(
+            global_rate=tb.TG_GLOBAL_RATE, chat_rate=tb.TG_CHAT_RATE, chat_burst=tb.TG_CHAT_BURST,
+            group_per_minute=tb.TG_GROUP_PER_MINUTE, max_retries=tb.TG_MAX_RETRIES,
+        )
+        await limiter.initialize()
+    bot = make_fake_bot(args.tg_latency, limiter)
+    screens = type(bot).screens
+    recorder = Recorder()
+    update_ids = iter(range(1, 10 ** 9))
+    application = SimpleNamespace(create_task=asyncio.ensure_future, persistence=None)
+    error_prefixes = ("Ошибка", "Произошла ошибка", "Извините")
+    await tb.lists.start()
+
+    async def step(user, context, scenario, handler, data=None, text=None):
+        chat_id = user.id
+        if data is not None:
+            query = CallbackQuery(str(next(update_ids)), user, str(chat_id), message=screens[chat_id], data=data)
+            query.set_bot(bot)
+            update = Update(next(update_ids), callback_query=query)
+        else:
+            message = Message(
+                next(update_ids), datetime.now(timezone.utc), Chat(chat_id, Chat.PRIVATE), from_user=user, text=text
+            )
+            message.set_bot(bot)
+            update = Update(next(update_ids), message=message)
+        before = screens[chat_id]
+        shown = type(bot).shown
+        shown[chat_id] = []
+        started = time.perf_counter()
+        ok = True
+        try:
+            await handler(update, context)
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        after = screens[chat_id]
+        if after is not before and (after.text or "").startswith(error_prefixes):
+            ok = False
+        recorder.add(scenario, elapsed, ok)
+        if scenario == "suggest_dishes":
+            # Что видит пользователь: время до первого текста ответа, а не до заглушки
+            first = next((at for at, text in shown[chat_id] if not text.startswith("Думаю")), None)
+            if first is not None:
+                recorder.add_partial("suggest_dishes:first_text", first - started)
+
+    async def virtual_user(n):
+        user = User(1000 + n, f"user{n}", is_bot=False)
+        context = SimpleNamespace(user_data={}, application=application)
+        await bot.send_message(user.id, "Выберите категорию:", reply_markup=tb.get_main_keyboard())
+        for round_no in range(args.rounds):
+            if round_no % args.recipe_every == 0:
+                await step(user, context, "suggest_dishes", tb.button_callback, data="suggest_dishes")
+            await step(user, context, "list", tb.button_callback, data="list:купить")
+            pages = button(screens[user.id], "list:купить:")
+            if pages:
+                await step(user, context, "list_page", tb.button_callback, data=pages[-1])
+            items = button(screens[user.id], "item:")
+            if not items:
+                continue
+            list_message = screens[user.id]
+            # Приоритет первого элемента и удаление двух последних: список не растёт от раунда к раунду
+            for data, action in [(items[0], "change_pri"), (items[-1], "delete"), (items[-2], "delete")]:
+                screens[user.id] = list_message
+                await step(user, context, "item", tb.button_callback, data=data)
+                token = data.split(":", 1)[1]
+                await step(user, context, f"item_action:{action}", tb.button_callback,
+                           data=f"item_action:{action}:{token}")
+                if action == "change_pri":
+                    await step(user, context, "pri", tb.button_callback, data="pri:3")
+            await step(user, context, "add", tb.button_callback, data="add:купить")
+            await step(user, context, "item_text", tb.handle_item_text, text=f"молоко {n}.{round_no} и хлеб {n}.{round_no}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(n) for n in range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    # Фоновая синхронизация досылает операции в бекенд; ждём её, чтобы посчитать запросы
+    deadline = time.monotonic() + 10
+    while tb.lists._ops and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    await tb.lists.close()
+    await tb.api.close()
+
+    report = recorder.report(elapsed)
+    report.update(backend=dict(stub.requests), llm_calls=len(g4f.calls), telegram=dict(type(bot).calls))
+    return report
+
+
+def run_bot(args, stub, g4f):
+    return asyncio.run(run_bot_async(args, stub, g4f))
+
+
+# Холодный старт
+
+STARTUP_SERVICES = {"alice": "alice", "bot": "telegram-bot"}
+STARTUP_MODULES = {"alice": "alice", "bot": "telegram_bot"}
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_profile(service, module):
+    """Импорт модуля сервиса в новом процессе: (секунды до конца импорта, {модуль верхнего уровня: секунды})."""
+    env = dict(os.environ, API_URL="http://127.0.0.1:9", REDIS_ADDR="", REDIS_HOST="", LOG_LEVEL="ERROR",
+               LLM_WARMUP="false", METRICS_PORT="0")
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    env["PYTHONPATH"] = os.pathsep.join([str(SERVICES_DIR / service), str(SERVICES_DIR)])
+    code = (f"import time; started = time.perf_counter(); import {module}; "
+            "import sys; print(time.perf_counter() - started, 'g4f' in sys.modules)")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env, capture_output=True,
+                            text=True, check=True, cwd=str(SERVICES_DIR / service))
+    seconds, g4f_loaded = result.stdout.split()
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        # importtime печатает модуль после его зависимостей, с отступом на два пробела глубже;
+        # считаем только то, что импортирует сам сервис (отступ 3), а не интерпретатор при запуске
+        if match and len(match.group(3)) == 3 and match.group(4) != module:
+            modules[match.group(4)] = int(match.group(2)) / 1e6
+        elif match and match.group(4) in ("site", "encodings"):
+            # Зависимости site и encodings печатаются до них самих: это старт интерпретатора
+            modules.clear()
+    return float(seconds), modules, g4f_loaded == "True"
+
+
+def run_startup(args):
+    report = {}
+    for target, service in STARTUP_SERVICES.items():
+        runs = [import_profile(service, STARTUP_MODULES[target]) for _ in range(args.runs)]
+        times = sorted(seconds for seconds, _, _ in runs)
+        modules = runs[-1][1]
+        report[target] = {
+            "import_p50_ms": round(percentile(times, 50) * 1000, 1),
+            "import_max_ms": round(times[-1] * 1000, 1),
+            "g4f_loaded": runs[-1][2],
+            "top_modules_ms": {name: round(seconds * 1000, 1)
+                               for name, seconds in sorted(modules.items(), key=lambda kv: -kv[1])[:8]},
+        }
+    return report
+
+
+def print_startup(report):
+    for target, row in report.items():
+        print(f"\n{target}: импорт p50 {row['import_p50_ms']} мс, max {row['import_max_ms']} мс, "
+              f"g4f при старте: {'да' if row['g4f_loaded'] else 'нет'}")
+        for name, ms in row["top_modules_ms"].items():
+            print(f"  {name:<24}{ms:>10} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("target", choices=["alice", "bot", "llm", "startup"])
+    parser.add_argument("--requests", type=int, default=1000, help="alice, llm: число запросов")
+    parser.add_argument("--concurrency", type=int, default=8, help="alice, llm: параллельных клиентов")
+    parser.add_argument("--payloads", default=str(BENCH_DIR / "alice_payloads.jsonl"))
+    parser.add_argument("--users", type=int, default=20, help="bot: виртуальных пользователей")
+    parser.add_argument("--rounds", type=int, default=5, help="bot: раундов сценария на пользователя")
+    parser.add_argument("--recipe-every", type=int, default=5, help="bot: 'Что приготовить' раз в N раундов")
+    parser.add_argument("--api-latency", type=float, default=0.005, help="задержка внутреннего API, с")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="задержка g4f, с")
+    parser.add_argument("--llm-providers", default="",
+                        help="фейковые провайдеры для гонки: имя:задержка:доля_ошибок,...")
+    parser.add_argument("--llm-race", type=int, default=2, help="llm: сколько провайдеров в гонке")
+    parser.add_argument("--tg-latency", type=float, default=0.03, help="bot: задержка Telegram Bot API, с")
+    parser.add_argument("--no-llm-stream", action="store_true", help="bot: ждать полный ответ GPT, а не показывать его по частям")
+    parser.add_argument("--tg-limits", action="store_true", help="bot: пропускать запросы через очередь с лимитами Telegram")
+    parser.add_argument("--items", type=int, default=30, help="элементов в каждой категории на старте")
+    parser.add_argument("--write-window", type=float, default=0.2, help="окно склейки добавлений, с")
+    parser.add_argument("--runs", type=int, default=3, help="startup: запусков на сервис")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="отчёт одной JSON-строкой")
+    parser.add_argument("--max-p95", type=float, default=0.0, help="код возврата 1, если общий p95 больше, мс")
+    args = parser.parse_args()
+
+    if args.target == "startup":
+        report = run_startup(args)
+        if args.json:
+            print(json.dumps(dict(report, target=args.target), ensure_ascii=False))
+        else:
+            print_startup(report)
+        return
+
+    random.seed(args.seed)
+    # g4f подменяется до импорта сервиса: common.llm и фоновая загрузка берут его из sys.modules
+    g4f = stub_g4f.install(args.llm_latency, args.llm_providers)
+    if args.llm_providers:
+        os.environ["LLM_PROVIDERS"] = ",".join(spec.split(":")[0] for spec in args.llm_providers.split(","))
+    stub = StubAPI(latency=args.api_latency, items_per_category=args.items, categories=CATEGORIES).start()
+    try:
+        report = {"alice": run_alice, "bot": run_bot, "llm": run_llm}[args.target](args, stub, g4f)
+    finally:
+        stub.stop()
+
+    if args.json:
+        print(json.dumps(dict(report, target=args.target), ensure_ascii=False))
+    else:
+        print_report({"alice": "Алиса", "bot": "Телеграм-бот", "llm": "GPT"}[args.target], report)
+        if "telegram" in report:
+            print("вызовов Telegram Bot API:", ", ".join(f"{m} {n}" for m, n in sorted(report["telegram"].items())))
+    if args.max_p95 and report["total"]["p95_ms"] > args.max_p95:
+        print(f"p95 {report['total']['p95_ms']} мс больше порога {args.max_p95} мс", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Микробенчмарки общего клиента внутреннего API (common.internal_api).
+
+Сравнивают разбор и сборку тел на синтетических ответах бекенда с тем, как
+сервисы делали это раньше: response.json() (декодирование байтов в строку и
+json.loads), json.dumps для тел и повторная фильтрация элементов по
+категории в Алисе. Сеть не участвует, замеряется только работа процессора.
+Запуск из services/:
+
+    python bench/micro_api.py
+    python bench/micro_api.py --items 500 --json
+"""
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from common import internal_api
+
+CATEGORIES = ["купить", "не-забыть", "холодос"]
+
+
+def make_lists(items):
+    """Ответ /lists: items элементов в каждой категории, с кириллицей, как в настоящих списках."""
+    return {
+        category: [
+            {"name": f"продукт {n} ({category})", "bought": n % 3 == 0, "category": category, "priority": n % 3 + 1}
+            for n in range(items)
+        ]
+        for category in CATEGORIES
+    }
+
+
+def legacy_names(content, category):
+    """Как Алиса читала список раньше: строка из байтов, json.loads и второй проход с фильтром по категории."""
+    data = json.loads(content.decode("utf-8")).get(category) or []
+    return [item["name"] for item in data if item.get("category", "").lower() == category.lower() and item["name"].strip()]
+
+
+def current_names(content, category):
+    lists = internal_api.get_lists(CATEGORIES).result(200, content)
+    return [item["name"] for item in lists[category] if item["name"].strip()]
+
+
+def measure(fn, number):
+    """Лучшее из пяти повторов, микросекунд на вызов."""
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def run(items, number):
+    lists = make_lists(items)
+    # Бекенд (Go encoding/json) отдаёт кириллицу как есть, без \\u-экранирования
+    content = json.dumps(lists, ensure_ascii=False).encode("utf-8")
+    one_list = json.dumps(lists["купить"], ensure_ascii=False).encode("utf-8")
+    added = [{"name": item["name"], "category": item["category"]} for item in lists["купить"]]
+    cases = {
+        "decode /lists": (
+            lambda: json.loads(content.decode("utf-8")),
+            lambda: internal_api.get_lists(CATEGORIES).result(200, content),
+        ),
+        "decode /list": (
+            lambda: json.loads(one_list.decode("utf-8")),
+            lambda: internal_api.get_list("купить").result(200, one_list),
+        ),
+        "alice: names of list": (
+            lambda: legacy_names(content, "холодос"),
+            lambda: current_names(content, "холодос"),
+        ),
+        "encode /add/bulk": (
+            lambda: json.dumps(added).encode("utf-8"),
+            lambda: internal_api.add_items(added).body,
+        ),
+    }
+    assert legacy_names(content, "холодос") == current_names(content, "холодос")
+    report = {}
+    for name, (before, after) in cases.items():
+        before_us, after_us = measure(before, number), measure(after, number)
+        report[name] = {
+            "before_us": round(before_us, 2), "after_us": round(after_us, 2), "speedup": round(before_us / after_us, 2),
+        }
+    return {"payload_bytes": len(content), "items_per_category": items, "cases": report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=100, help="элементов в каждой категории")
+    parser.add_argument("--number", type=int, default=2000, help="вызовов в одном повторе")
+    parser.add_argument("--json", action="store_true", help="отчёт одной JSON-строкой")
+    args = parser.parse_args()
+
+    report = run(args.items, args.number)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+        return
+    print(f"\nответ /lists: {report['payload_bytes']} байт, {report['items_per_category']} элементов в категории")
+    print(f"{'операция':<24}{'было мкс':>10}{'стало мкс':>11}{'ускорение':>11}")
+    for name, row in report["cases"].items():
+        print(f"{name:<24}{row['before_us']:>10}{row['after_us']:>11}{row['speedup']:>10}x")
+
+
+if __name__ == "__main__":
+    main()
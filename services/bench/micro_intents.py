@@ -0,0 +1,59 @@
+"""Микробенчмарк маршрутизатора интентов Алисы (alice/intents.py).
+
+Разбирает типичные высказывания навыка: команды с аргументом, команды
+целиком, синонимы и нераспознанные фразы. Сеть и Flask не участвуют.
+Запуск из services/:
+
+    python bench/micro_intents.py
+    python bench/micro_intents.py --number 50000 --json
+"""
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "alice"))
+
+from intents import build_router
+
+SAMPLES = [
+    "купить молоко хлеб и яйца",
+    "что купить",
+    "что в холодильнике",
+    "запиши позвонить маме",
+    "добавь сыр",
+    "что можно приготовить",
+    "как дела",
+]
+
+
+def run(number):
+    router = build_router()
+    samples = [sample.split() for sample in SAMPLES]
+    matches = {" ".join(sample): repr(router.match(sample)) for sample in samples}
+    # Лучшее из пяти повторов, number разборов всех фраз в каждом
+    elapsed = min(timeit.repeat(lambda: [router.match(sample) for sample in samples], number=number, repeat=5))
+    runs = number * len(samples)
+    return {"matches": matches, "per_second": round(runs / elapsed), "us_per_match": round(elapsed / runs * 1e6, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--number", type=int, default=20000, help="проходов по всем фразам в одном повторе")
+    parser.add_argument("--json", action="store_true", help="отчёт одной JSON-строкой")
+    args = parser.parse_args()
+
+    report = run(args.number)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+        return
+    for text, match in report["matches"].items():
+        print(f"{text:<28} -> {match}")
+    print(f"\n{report['per_second']:,} разборов/с, {report['us_per_match']} мкс на разбор")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Заглушка внутреннего API geshtalt для нагрузочных тестов.
+
+Повторяет маршруты /internal/api, которыми пользуются Алиса и бот, хранит
+списки в памяти и отвечает с заданной задержкой, имитируя сеть и Redis.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+PREFIX = "/internal/api"
+
+
+class StubAPI:
+    """HTTP-сервер в фоновом потоке со списками (пользователь, категория) в памяти."""
+
+    def __init__(self, latency=0.0, items_per_category=30, categories=()):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.lists = {}
+        self.requests = {}
+        self._server = None
+        self._seed = [
+            {"name": f"{category} {n}", "category": category, "bought": False, "priority": n % 3 + 1}
+            for category in categories for n in range(items_per_category)
+        ]
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}{PREFIX}"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self, method):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                user = self.headers.get("X-User-ID") or "service"
+                if stub.latency:
+                    time.sleep(stub.latency)
+                status, payload = stub.dispatch(method, parsed.path[len(PREFIX):], parse_qs(parsed.query), user, body)
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PATCH(self):
+                self._handle("PATCH")
+
+            def do_DELETE(self):
+                self._handle("DELETE")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="stub-api", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _items(self, user, category):
+        key = (user, category)
+        if key not in self.lists:
+            self.lists[key] = [dict(item) for item in self._seed if item["category"] == category]
+        return self.lists[key]
+
+    def dispatch(self, method, path, query, user, body):
+        head = path.strip("/").split("/")[0]
+        # У /delete и /item в пути название элемента, остальные маршруты считаем целиком
+        route = f"{method} /{head}" if head in ("delete", "item") else f"{method} /{path.strip('/')}"
+        with self.lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            category = (query.get("category") or [""])[0]
+
+            if route == "GET /list":
+                return 200, self._items(user, category)
+            if route == "GET /lists":
+                categories = (query.get("categories") or [""])[0].split(",")
+                return 200, {c: self._items(user, c) for c in categories if c}
+            if route in ("POST /add/bulk", "POST /add"):
+                items = body if isinstance(body, list) else [body]
+                for item in items:
+                    self._items(user, item["category"]).append(
+                        {"name": item["name"], "category": item["category"], "bought": False,
+                         "priority": item.get("priority") or 2}
+                    )
+                return 201, {"message": "Items added successfully", "added": len(items)}
+
+            name = unquote(path.strip("/").split("/", 1)[-1])
+            items = self._items(user, category)
+            if route == "DELETE /delete":
+                self.lists[(user, category)] = [item for item in items if item["name"] != name]
+                return 200, {}
+            if route == "PATCH /item":
+                item = next((item for item in items if item["name"] == name), None)
+                if item is None:
+                    return 404, {"error": "Item not found"}
+                new_category = body.get("category") or category
+                item.update({k: v for k, v in body.items() if k != "category"})
+                if new_category != category:
+                    items.remove(item)
+                    item["category"] = new_category
+                    self._items(user, new_category).append(item)
+                return 200, item
+        return 404, {"error": f"unknown route {route}"}
@@ -0,0 +1,63 @@
+"""Заглушка g4f с настраиваемой задержкой и фейковыми провайдерами.
+
+install() подкладывает модуль g4f в sys.modules до импорта сервисов, поэтому
+common.llm вызывает заглушку вместо внешних провайдеров. Провайдеры задаются
+строкой "имя:задержка:доля_ошибок,..." и доступны как g4f.Provider.<имя>,
+так что LLM_PROVIDERS с теми же именами включает гонку провайдеров.
+Провайдер, как и в настоящем g4f, можно передать классом или именем.
+
+С stream=True ответ отдаётся по словам, равномерно за ту же задержку.
+"""
+import random
+import sys
+import time
+import types
+
+
+def make_provider(name, latency, fail_rate):
+    """Класс провайдера, который отвечает через latency секунд или падает с вероятностью fail_rate."""
+    return type(name, (), {"latency": latency, "fail_rate": fail_rate})
+
+
+def install(latency=1.0, providers=""):
+    """Регистрирует фейковый g4f; без провайдера ответ приходит через latency секунд."""
+    module = types.ModuleType("g4f")
+    module.Provider = types.SimpleNamespace()
+    calls = []
+
+    for spec in filter(None, providers.split(",")):
+        name, provider_latency, fail_rate = spec.split(":")
+        setattr(module.Provider, name, make_provider(name, float(provider_latency), float(fail_rate)))
+
+    answer = "Плов, лагман, хинкали, пицца, борщ"
+
+    def generate(provider):
+        words = answer.split(" ")
+        delay = latency if provider is None else provider.latency * random.uniform(0.8, 1.2)
+        if provider is not None and random.random() < provider.fail_rate:
+            time.sleep(delay / len(words))
+            raise RuntimeError(f"{provider.__name__}: провайдер недоступен")
+        for n, word in enumerate(words):
+            time.sleep(delay / len(words))
+            yield word if n == 0 else " " + word
+
+    class ChatCompletion:
+        @staticmethod
+        def create(model, messages, provider=None, stream=False, **kwargs):
+            if isinstance(provider, str):
+                provider = getattr(module.Provider, provider)
+            calls.append(provider.__name__ if provider is not None else model)
+            if stream:
+                return generate(provider)
+            if provider is None:
+                time.sleep(latency)
+            else:
+                time.sleep(provider.latency * random.uniform(0.8, 1.2))
+                if random.random() < provider.fail_rate:
+                    raise RuntimeError(f"{provider.__name__}: провайдер недоступен")
+            return answer
+
+    module.ChatCompletion = ChatCompletion
+    module.calls = calls
+    sys.modules["g4f"] = module
+    return module
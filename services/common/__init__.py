@@ -0,0 +1 @@
+"""Общий код Python-сервисов (Алиса и телеграм-бот)."""
@@ -0,0 +1,47 @@
+"""Проверки живости и готовности для Kubernetes (/healthz и /readyz).
+
+Живость (liveness) значит, что процесс не завис: бот отмечает каждый оборот
+своего event loop через heartbeat(), и если отметок нет дольше stall_after
+секунд, /healthz отвечает 503 и kubelet перезапускает под. Готовность
+(readiness) значит, что под можно ставить под трафик: сервис включает её,
+когда закончил старт, и выключает в начале остановки, чтобы при
+раскатке запросы ушли на другие поды раньше, чем этот закроет соединения.
+
+Тяжёлое (g4f) к готовности не относится: оно загружается в фоне, и под
+принимает запросы, не дожидаясь его.
+"""
+import asyncio
+import threading
+import time
+
+
+class Health:
+    """Флаги живости и готовности сервиса."""
+
+    def __init__(self, stall_after=30.0):
+        self.stall_after = stall_after
+        self._ready = threading.Event()
+        self._beat = None
+
+    def set_ready(self, ready=True):
+        if ready:
+            self._ready.set()
+        else:
+            self._ready.clear()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def beat(self):
+        self._beat = time.monotonic()
+
+    def live(self):
+        """Жив ли процесс: до первой отметки считается живым (идёт старт)."""
+        return self._beat is None or time.monotonic() - self._beat < self.stall_after
+
+    async def heartbeat(self, interval=5.0):
+        """Отмечает живость event loop, пока задачу не отменят."""
+        while True:
+            self.beat()
+            await asyncio.sleep(interval)
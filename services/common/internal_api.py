@@ -0,0 +1,133 @@
+"""Общий клиент внутреннего API geshtalt (/internal/api) для Алисы и бота.
+
+Алиса ходит в бекенд синхронно через requests, бот — асинхронно через
+httpx, и у каждого свои повторы, хеджирование и автомат отключения. Общее у
+них — сами запросы и разбор ответов, и оно собрано здесь, без ввода-вывода:
+каждая операция возвращает Call (метод, путь, параметры, тело и ожидаемый
+статус), транспорт сервиса отправляет его и отдаёт статус и байты ответа в
+Call.result().
+
+Названия элементов экранируются в пути целиком (quote с safe=""), категории
+передаются параметрами, поэтому "/", "?", "#" и пробелы в них не ломают
+маршрут. Элементы в ответах описаны типом Item (TypedDict), то есть это
+те же словари, что отдаёт orjson, без преобразования. JSON разбирается
+orjson прямо из байтов ответа, без промежуточной строки, а бекенд отдаёт
+/list и /lists уже по категориям, так что ответ используется как есть, без
+второго прохода по элементам.
+"""
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, TypedDict
+from urllib.parse import quote
+
+import orjson
+
+from common.tracing import trace_headers
+
+JSON_CONTENT_TYPE = "application/json"
+
+
+class Item(TypedDict):
+    """Элемент списка, как его отдаёт бекенд (Item в backend/main.go)."""
+
+    name: str
+    bought: bool
+    category: str
+    priority: int  # 1 - низкий, 2 - средний, 3 - высокий
+
+
+class APIError(Exception):
+    """Бекенд ответил неожиданным статусом."""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"{status_code} - {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+def loads(content):
+    """JSON из байтов ответа; пустое тело (бекенд так отвечает на пустой список) — None."""
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        # Пробельное тело проверяем только после ошибки, чтобы не копировать каждый ответ
+        if not content.strip():
+            return None
+        raise
+
+
+def dumps(value):
+    """Тело запроса в JSON (UTF-8, без экранирования кириллицы)."""
+    return orjson.dumps(value)
+
+
+def _ignore(content):
+    return None
+
+
+class Call(NamedTuple):
+    """Один запрос к внутреннему API и разбор его ответа."""
+
+    method: str
+    path: str
+    params: Optional[Dict[str, str]] = None
+    body: Optional[bytes] = None
+    expected: int = 200
+    decode: Callable[[bytes], Any] = _ignore
+
+    def headers(self, user_id=None):
+        """X-Request-ID текущей трассы, X-User-ID (если задан) и Content-Type для тела."""
+        headers = trace_headers()
+        if user_id:
+            headers["X-User-ID"] = user_id
+        if self.body is not None:
+            headers["Content-Type"] = JSON_CONTENT_TYPE
+        return headers
+
+    def result(self, status_code, content):
+        """Разобранный ответ или APIError, если статус не тот, что ожидался."""
+        if status_code != self.expected:
+            raise APIError(status_code, content.decode("utf-8", "replace"))
+        return self.decode(content)
+
+
+def item_path(prefix, name):
+    """Путь к элементу: item_path("/item", "молоко/кефир") -> "/item/%D0%BC...%2F..."."""
+    return f"{prefix}/{quote(name, safe='')}"
+
+
+def _items(content) -> List[Item]:
+    return loads(content) or []
+
+
+def _item(content) -> Item:
+    return loads(content)
+
+
+def get_list(category):
+    """Элементы одной категории: список Item."""
+    return Call("GET", "/list", params={"category": category}, decode=_items)
+
+
+def get_lists(categories):
+    """{категория: список Item} для нескольких категорий одним запросом; отсутствующие — пустым списком."""
+    def decode(content) -> Dict[str, List[Item]]:
+        lists = loads(content) or {}
+        return {category: lists.get(category) or [] for category in categories}
+
+    return Call("GET", "/lists", params={"categories": ",".join(categories)}, decode=decode)
+
+
+def add_items(items):
+    """Добавляет несколько элементов ({"name", "category"}) одним запросом к /add/bulk."""
+    return Call("POST", "/add/bulk", body=dumps(items), expected=201, decode=loads)
+
+
+def patch_item(name, category, **fields):
+    """Частично обновляет элемент (priority, bought или перенос в category)."""
+    return Call(
+        "PATCH", item_path("/item", name), params={"category": category}, body=dumps(fields), decode=_item,
+    )
+
+
+def delete_item(name, category):
+    """Удаляет элемент из категории."""
+    return Call("DELETE", item_path("/delete", name), params={"category": category})
@@ -0,0 +1,21 @@
+"""Разбор фраз и сообщений с несколькими элементами списка."""
+import re
+
+# Разделители: перенос строки, запятая, точка с запятой и отдельное слово "и"
+_SEPARATORS = re.compile(r"[\n,;]+|\s+и\s+", re.IGNORECASE)
+
+
+def split_items(text):
+    """Делит "молоко, хлеб и яйца" на отдельные элементы.
+
+    Пустые части и повторы (без учёта регистра) отбрасываются, порядок сохраняется.
+    """
+    items = []
+    seen = set()
+    for part in _SEPARATORS.split(text or ""):
+        name = part.strip(" \t.!?-–—•*")
+        key = name.lower()
+        if name and key not in seen:
+            seen.add(key)
+            items.append(name)
+    return items
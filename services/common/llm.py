@@ -0,0 +1,467 @@
+"""Выполнение запросов к g4f вне обработчиков запросов.
+
+g4f работает синхронно и может отвечать десятки секунд, поэтому все вызовы
+идут через отдельный ограниченный пул потоков. Вызывающий код ждёт ответ не
+дольше дедлайна и получает None, если модель не успела ответить. Одинаковые
+промпты, запрошенные одновременно, склеиваются в один вызов модели.
+
+После серии ошибок g4f автомат отключения отклоняет новые вызовы сразу
+(CircuitOpenError), и пользователь получает ответ без ожидания дедлайна.
+
+Если задан список провайдеров (ProviderScheduler), промпт уходит
+одновременно нескольким лучшим из них и возвращается первый хороший ответ.
+
+astream() отдаёт ответ частями по мере генерации (stream=True в g4f), чтобы
+пользователь видел текст через секунду, а не после всей генерации. В гонке
+провайдеров побеждает тот, кто первым прислал текст, остальные потоки
+закрываются.
+
+Сам g4f импортируется при первом вызове или в warm_up(): пакет тянет
+сотни модулей провайдеров, и его импорт занимал больше половины времени
+старта сервисов. Провайдеры поэтому передаются в g4f по имени.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+
+from common import metrics
+from common.llm_providers import ProviderScheduler, provider_name
+from common.resilience import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+
+def _g4f():
+    import g4f
+    return g4f
+
+
+def build_scheduler(names, top_k=2, redis_client=None, state_path=""):
+    """ProviderScheduler для провайдеров из строки names (например, "Bing,You") или None, если список пуст.
+
+    Имена проверяются при загрузке g4f (LLMExecutor.warm_up), а не здесь, чтобы не импортировать g4f при старте.
+    """
+    providers = [name.strip() for name in names.split(",") if name.strip()]
+    if not providers:
+        return None
+    return ProviderScheduler(providers, top_k=top_k, redis_client=redis_client, state_path=state_path)
+
+
+class LLMExecutor:
+    """Ограниченный пул для вызовов g4f с дедлайном и склейкой одинаковых промптов."""
+
+    def __init__(self, model="gpt-4", max_workers=2, max_pending=8, timeout=20.0, breaker=None, scheduler=None):
+        self.model = model
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.breaker = breaker or CircuitBreaker("llm", failure_threshold=3, reset_timeout=30.0)
+        self.scheduler = scheduler
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        # Участники гонок; проигравшие дорабатывают здесь и пополняют статистику
+        self._race_pool = None
+        if scheduler is not None:
+            self._race_pool = ThreadPoolExecutor(
+                max_workers=max_workers * scheduler.top_k * 2, thread_name_prefix="llm-race"
+            )
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._streams = {}
+        self._loaded = False
+        self._load_lock = threading.Lock()
+
+    def warm_up(self):
+        """Импортирует g4f и проверяет имена провайдеров, чтобы первый запрос рецепта не ждал импорта."""
+        with self._load_lock:
+            if self._loaded:
+                return
+            started = time.perf_counter()
+            g4f = _g4f()
+            if self.scheduler is not None:
+                for name in list(self.scheduler.providers):
+                    if getattr(g4f.Provider, name, None) is None:
+                        logger.warning("Неизвестный провайдер g4f: %s", name)
+                        self.scheduler.discard(name)
+                if not self.scheduler.providers:
+                    logger.warning("Нет известных провайдеров g4f, провайдера выбирает g4f")
+                    self.scheduler = None
+            self._loaded = True
+            logger.info("g4f загружен за %.0f мс", (time.perf_counter() - started) * 1000)
+
+    def warm_up_in_background(self):
+        """Загружает g4f в фоновом потоке, не задерживая старт сервиса."""
+        threading.Thread(target=self._warm_up_quietly, name="llm-warmup", daemon=True).start()
+
+    def _warm_up_quietly(self):
+        try:
+            self.warm_up()
+        except Exception:
+            logger.exception("Не удалось загрузить g4f")
+
+    def _create(self, prompt):
+        started = time.perf_counter()
+        try:
+            self.warm_up()
+            if self.scheduler is None:
+                response = self._call(None, prompt)
+            else:
+                response = self._race(prompt)
+        except Exception:
+            metrics.LLM_DURATION.labels("error").observe(time.perf_counter() - started)
+            metrics.LLM_FAILURES.labels("error").inc()
+            self.breaker.failure()
+            raise
+        metrics.LLM_DURATION.labels("ok").observe(time.perf_counter() - started)
+        self.breaker.success()
+        return response
+
+    def _call(self, provider, prompt):
+        kwargs = {} if provider is None else {"provider": provider}
+        response = _g4f().ChatCompletion.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            **kwargs,
+        )
+        text = f"{response}"
+        if not text.strip():
+            raise ValueError("пустой ответ")
+        return text
+
+    def _race(self, prompt):
+        """Отправляет промпт лучшим провайдерам сразу и возвращает первый хороший ответ.
+
+        Если все участники ответили ошибкой, гонка повторяется один раз с другими
+        провайдерами: упавшие уже на паузе и в выбор не попадут.
+        """
+        tried = set()
+        error = None
+        for _ in range(2):
+            providers = [p for p in self.scheduler.pick() if provider_name(p) not in tried]
+            if not providers:
+                break
+            tried.update(provider_name(p) for p in providers)
+            futures = [self._race_pool.submit(self._timed_call, provider, prompt) for provider in providers]
+            for future in as_completed(futures):
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+        raise error or RuntimeError("нет доступных провайдеров")
+
+    def _timed_call(self, provider, prompt):
+        started = time.perf_counter()
+        try:
+            text = self._call(provider, prompt)
+        except Exception as e:
+            self.scheduler.record(provider, False, time.perf_counter() - started)
+            metrics.LLM_PROVIDER_CALLS.labels(provider_name(provider), "error").inc()
+            logger.debug("Провайдер GPT %s: %s", provider_name(provider), e)
+            raise
+        self.scheduler.record(provider, True, time.perf_counter() - started)
+        metrics.LLM_PROVIDER_CALLS.labels(provider_name(provider), "ok").inc()
+        return text
+
+    def submit(self, prompt, on_result=None):
+        """Ставит промпт в очередь или присоединяется к уже идущему вызову.
+
+        on_result(text) вызывается после успешного ответа модели, даже если
+        вызывающий уже не дождался дедлайна, — так ответ можно положить в кэш.
+        Возвращает concurrent.futures.Future либо None, если очередь переполнена.
+        Бросает CircuitOpenError, если g4f отключен автоматом.
+        """
+        with self._lock:
+            future = self._inflight.get(prompt)
+            if future is not None:
+                return future
+            if len(self._inflight) >= self.max_pending:
+                metrics.LLM_FAILURES.labels("rejected").inc()
+                return None
+            self.breaker.check()
+            future = self._pool.submit(self._create, prompt)
+            self._inflight[prompt] = future
+            metrics.LLM_IN_FLIGHT.inc()
+        future.add_done_callback(lambda _: self._done(prompt, future, on_result))
+        return future
+
+    def _done(self, prompt, future, on_result):
+        with self._lock:
+            if self._inflight.get(prompt) is future:
+                del self._inflight[prompt]
+                metrics.LLM_IN_FLIGHT.dec()
+        if on_result is None or future.cancelled() or future.exception() is not None:
+            return
+        self._deliver(on_result, future.result())
+
+    def complete(self, prompt, timeout=None, on_result=None):
+        """Синхронный вызов: текст ответа или None, если дедлайн истёк."""
+        future = self.submit(prompt, on_result)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            metrics.LLM_FAILURES.labels("timeout").inc()
+            return None
+
+    async def acomplete(self, prompt, timeout=None, on_result=None):
+        """Асинхронный вызов для asyncio: не блокирует event loop."""
+        future = self.submit(prompt, on_result)
+        if future is None:
+            return None
+        try:
+            # shield: отмена одного ожидающего не должна отменять общий вызов
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)),
+                self.timeout if timeout is None else timeout,
+            )
+        except asyncio.TimeoutError:
+            metrics.LLM_FAILURES.labels("timeout").inc()
+            return None
+
+    def _open_stream(self, provider, prompt):
+        kwargs = {} if provider is None else {"provider": provider}
+        # ignore_stream: провайдер без потоковой выдачи отдаст ответ одной частью
+        chunks = _g4f().ChatCompletion.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            ignore_stream=True,
+            **kwargs,
+        )
+        return [chunks] if isinstance(chunks, str) else chunks
+
+    def _read_stream(self, race, racer, provider, prompt):
+        """Читает поток провайдера в потоке пула и передаёт части в race от имени участника racer."""
+        started = time.perf_counter()
+        chunks = None
+        try:
+            self.warm_up()
+            chunks = self._open_stream(provider, prompt)
+            for chunk in chunks:
+                if race.stopped(racer):
+                    break
+                # Как concat_chunks в g4f: служебные части и ошибки пропускаются
+                if chunk and not isinstance(chunk, Exception):
+                    race.emit(racer, str(chunk))
+        except Exception as e:
+            if provider is not None and not race.stopped(racer):
+                self.scheduler.record(provider, False, time.perf_counter() - started)
+                metrics.LLM_PROVIDER_CALLS.labels(provider_name(provider), "error").inc()
+            self._finish_stream(race, racer, e, prompt)
+            return
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+        if provider is not None and race.winner == racer:
+            self.scheduler.record(provider, True, time.perf_counter() - started)
+            metrics.LLM_PROVIDER_CALLS.labels(provider_name(provider), "ok").inc()
+        self._finish_stream(race, racer, None, prompt)
+
+    def _start_stream(self, race, prompt):
+        """Запускает участников гонки: один вызов g4f или лучших ещё не опробованных провайдеров.
+
+        Возвращает False, если запускать некого.
+        """
+        if self.scheduler is None:
+            providers = [None]
+            pool = self._pool
+        else:
+            providers = [p for p in self.scheduler.pick() if provider_name(p) not in race.tried]
+            pool = self._race_pool
+        if not providers:
+            return False
+        for racer, provider in zip(race.start([provider_name(p) for p in providers]), providers):
+            pool.submit(self._read_stream, race, racer, provider, prompt)
+        return True
+
+    def _finish_stream(self, race, racer, error, prompt):
+        if not race.finish(racer, error):
+            return
+        # Никто не прислал текста. Как в _race, гонка повторяется один раз с другими провайдерами
+        if self.scheduler is not None and not race.retried and not race.stopped(racer):
+            race.retried = True
+            if self._start_stream(race, prompt):
+                return
+        race.fail()
+
+    async def astream(self, prompt, timeout=None, on_result=None):
+        """Асинхронный генератор частей ответа модели по мере генерации.
+
+        Одинаковые промпты склеиваются, как в submit(): присоединившийся
+        получает уже пришедшие части сразу, а дальше — вместе со всеми.
+        timeout ограничивает ожидание каждой следующей части (и первой): если
+        модель замолчала, генератор заканчивается на том, что уже пришло.
+        on_result(text) вызывается с полным текстом, если поток дошёл до конца.
+        Если очередь переполнена, генератор ничего не отдаёт. Бросает
+        CircuitOpenError, если g4f отключен автоматом, и ошибку g4f, если
+        ни один провайдер не прислал текста.
+        """
+        owner = False
+        with self._lock:
+            race = self._streams.get(prompt)
+            if race is None:
+                if len(self._inflight) + len(self._streams) >= self.max_pending:
+                    metrics.LLM_FAILURES.labels("rejected").inc()
+                    return
+                self.breaker.check()
+                race = self._streams[prompt] = _StreamRace(asyncio.get_running_loop())
+                owner = True
+        if owner:
+            metrics.LLM_IN_FLIGHT.inc()
+            if not self._start_stream(race, prompt):
+                race.fail()
+
+        started = time.perf_counter()
+        queue = race.subscribe()
+        parts = []
+        outcome = "error"
+        try:
+            error = None
+            while True:
+                try:
+                    racer, chunk, finished, e = await asyncio.wait_for(
+                        queue.get(), self.timeout if timeout is None else timeout
+                    )
+                except asyncio.TimeoutError:
+                    metrics.LLM_FAILURES.labels("timeout").inc()
+                    outcome = "timeout"
+                    break
+                if not finished:
+                    parts.append(chunk)
+                    yield chunk
+                    continue
+                if racer is None:
+                    # Ни один участник не прислал текста
+                    error = e
+                    break
+                # Победитель закончил: с ошибкой посреди ответа остаётся то, что он успел прислать
+                if e is None:
+                    outcome = "ok"
+                break
+            if outcome == "error" and not parts:
+                if owner:
+                    metrics.LLM_FAILURES.labels("error").inc()
+                raise error or RuntimeError("пустой ответ")
+        finally:
+            if race.unsubscribe(queue):
+                # Последний читатель ушёл: потоки провайдеров больше никому не нужны
+                race.cancel()
+                with self._lock:
+                    if self._streams.get(prompt) is race:
+                        del self._streams[prompt]
+                metrics.LLM_IN_FLIGHT.dec()
+            if owner:
+                metrics.LLM_DURATION.labels("ok" if outcome == "ok" else "error").observe(time.perf_counter() - started)
+                if parts:
+                    self.breaker.success()
+                elif outcome != "ok":
+                    self.breaker.failure()
+        text = "".join(parts)
+        if owner and outcome == "ok" and text.strip() and on_result is not None:
+            # on_result может ходить в Redis синхронно, поэтому вызывается не в event loop
+            asyncio.get_running_loop().run_in_executor(None, self._deliver, on_result, text)
+
+    @staticmethod
+    def _deliver(on_result, text):
+        try:
+            on_result(text)
+        except Exception:
+            logger.exception("Ошибка в обработчике ответа GPT")
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        if self._race_pool is not None:
+            self._race_pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _StreamRace:
+    """Общее состояние потокового вызова одного промпта: кто победил и кому слать части.
+
+    Потоки пула вызывают emit/finish от имени участника (номер в гонке).
+    События копятся в журнале и рассылаются в очереди читателей в event loop,
+    поэтому присоединившийся позже читатель получает их все с начала.
+    Победитель — первый участник, приславший текст; части остальных
+    отбрасываются, и по stopped() они прекращают чтение. Событие с участником
+    None значит, что текста не прислал никто.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.winner = None
+        self.tried = set()
+        self.retried = False
+        self._pending = 0
+        self._next = 0
+        self._error = None
+        self._events = []
+        self._queues = []
+        self._lock = threading.Lock()
+        self._cancelled = False
+
+    def start(self, names):
+        """Регистрирует участников с именами names и возвращает их номера."""
+        with self._lock:
+            racers = range(self._next, self._next + len(names))
+            self._next += len(names)
+            self._pending += len(names)
+            self.tried.update(names)
+        return racers
+
+    def subscribe(self):
+        queue = asyncio.Queue()
+        for event in self._events:
+            queue.put_nowait(event)
+        self._queues.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        """Отписывает читателя; True, если он был последним."""
+        self._queues.remove(queue)
+        return not self._queues
+
+    def emit(self, racer, chunk):
+        with self._lock:
+            if self._cancelled:
+                return
+            if self.winner is None:
+                self.winner = racer
+            elif self.winner != racer:
+                return
+        self._post((racer, chunk, False, None))
+
+    def finish(self, racer, error):
+        """Участник закончил. Возвращает True, если он был последним, а текста так никто и не прислал."""
+        with self._lock:
+            if self.winner is not None:
+                if racer == self.winner:
+                    self._post((racer, None, True, error))
+                return False
+            self._pending -= 1
+            self._error = error or self._error
+            return not self._pending
+
+    def fail(self):
+        self._post((None, None, True, self._error))
+
+    def stopped(self, racer):
+        return self._cancelled or (self.winner is not None and self.winner != racer)
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+
+    def _post(self, event):
+        if self._cancelled:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._dispatch, event)
+        except RuntimeError:
+            # event loop уже закрыт (бот остановлен), читать части некому
+            pass
+
+    def _dispatch(self, event):
+        self._events.append(event)
+        for queue in self._queues:
+            queue.put_nowait(event)
@@ -0,0 +1,147 @@
+"""Выбор провайдеров g4f по накопленной статистике.
+
+Без явного провайдера g4f сам выбирает бесплатный, и время ответа скачет от
+секунды до минуты. ProviderScheduler ведёт по каждому провайдеру скользящие
+(экспоненциальные) среднее время ответа и долю успехов и отдаёт top_k
+лучших для гонки: запрос уходит им одновременно, берётся первый хороший
+ответ. Провайдер, ответивший ошибкой несколько раз подряд, отправляется на
+паузу с растущей длительностью. Незнакомые провайдеры начинают с
+оптимистичной оценки, поэтому тоже получают шанс.
+
+Статистика хранится в Redis (общая для Алисы и бота, переживает перезапуск),
+без Redis — в JSON-файле state_path или только в памяти.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Вес нового наблюдения в скользящих средних
+ALPHA = 0.2
+# Начальная оценка незнакомого провайдера
+PRIOR_LATENCY = 5.0
+PRIOR_SUCCESS = 0.8
+# Пауза после ошибок подряд: 10 с, 20 с, 40 с ... не больше 5 минут
+COOLDOWN_BASE = 10.0
+COOLDOWN_MAX = 300.0
+
+
+def provider_name(provider):
+    return getattr(provider, "__name__", None) or str(provider)
+
+
+class ProviderStats:
+    """Скользящая статистика одного провайдера."""
+
+    __slots__ = ("latency", "success", "failures", "cooldown_until", "calls")
+
+    def __init__(self, latency=PRIOR_LATENCY, success=PRIOR_SUCCESS, failures=0, cooldown_until=0.0, calls=0):
+        self.latency = latency
+        self.success = success
+        self.failures = failures
+        self.cooldown_until = cooldown_until
+        self.calls = calls
+
+    def score(self):
+        """Ожидаемое время до хорошего ответа: чем меньше, тем лучше."""
+        return self.latency / max(self.success, 0.05)
+
+    def record(self, ok, seconds, now):
+        self.calls += 1
+        self.latency += ALPHA * (seconds - self.latency)
+        self.success += ALPHA * ((1.0 if ok else 0.0) - self.success)
+        if ok:
+            self.failures = 0
+            self.cooldown_until = 0.0
+        else:
+            self.failures += 1
+            self.cooldown_until = now + min(COOLDOWN_MAX, COOLDOWN_BASE * 2 ** (self.failures - 1))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ProviderScheduler:
+    """Выбирает провайдеров для гонки и учитывает результаты их вызовов."""
+
+    def __init__(self, providers, top_k=2, redis_client=None, state_path="", explore=0.1):
+        self.providers = {provider_name(p): p for p in providers}
+        self.top_k = top_k
+        self.redis = redis_client
+        self.state_path = state_path
+        # Доля гонок, в которые вместо последнего из лучших берётся случайный провайдер
+        self.explore = explore
+        self.key = "llm:providers"
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._stats = {name: ProviderStats() for name in self.providers}
+        self._load()
+
+    def pick(self):
+        """Провайдеры для следующей гонки, лучший первым."""
+        now = time.time()
+        with self._lock:
+            ranked = sorted(self.providers, key=lambda name: self._stats[name].score())
+            ready = [name for name in ranked if self._stats[name].cooldown_until <= now]
+        # Если все на паузе, гоняем лучших из них: ответ нужен всё равно
+        chosen = (ready or ranked)[:self.top_k]
+        rest = [name for name in ranked if name not in chosen]
+        if rest and len(chosen) > 1 and random.random() < self.explore:
+            chosen[-1] = random.choice(rest)
+        return [self.providers[name] for name in chosen]
+
+    def record(self, provider, ok, seconds):
+        """Учитывает результат вызова провайдера и сохраняет статистику."""
+        name = provider_name(provider)
+        with self._lock:
+            stats = self._stats.setdefault(name, ProviderStats())
+            stats.record(ok, seconds, time.time())
+            if not ok and stats.failures == 1:
+                logger.info("Провайдер GPT %s ответил ошибкой", name)
+            snapshot = stats.to_dict()
+        self._save(name, snapshot)
+
+    def discard(self, name):
+        """Убирает провайдера из выбора (например, g4f его не знает)."""
+        with self._lock:
+            self.providers.pop(name, None)
+            self._stats.pop(name, None)
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(stats.to_dict(), score=round(stats.score(), 3)) for name, stats in self._stats.items()}
+
+    def _load(self):
+        saved = {}
+        try:
+            if self.redis is not None:
+                saved = {name: json.loads(value) for name, value in self.redis.hgetall(self.key).items()}
+            elif self.state_path and os.path.exists(self.state_path):
+                with open(self.state_path, encoding="utf-8") as f:
+                    saved = json.load(f)
+        except (redis.RedisError, OSError, ValueError) as e:
+            logger.warning("Не удалось загрузить статистику провайдеров GPT: %s", e)
+        for name, values in saved.items():
+            if name in self._stats:
+                self._stats[name] = ProviderStats(**{k: v for k, v in values.items() if k in ProviderStats.__slots__})
+
+    def _save(self, name, snapshot):
+        try:
+            if self.redis is not None:
+                self.redis.hset(self.key, name, json.dumps(snapshot))
+            elif self.state_path:
+                with self._lock:
+                    state = {n: s.to_dict() for n, s in self._stats.items()}
+                with self._file_lock:
+                    tmp = f"{self.state_path}.tmp"
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        json.dump(state, f)
+                    os.replace(tmp, self.state_path)
+        except (redis.RedisError, OSError) as e:
+            logger.warning("Не удалось сохранить статистику провайдеров GPT: %s", e)
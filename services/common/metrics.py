@@ -0,0 +1,149 @@
+"""Метрики Prometheus для Python-сервисов.
+
+Время обработки по интентам Алисы и префиксам кнопок бота, время и ошибки
+запросов к внутреннему API и к g4f, попадания в кэши и число запросов в
+обработке. Алиса отдаёт метрики на маршруте /metrics, бот — на отдельном
+порту METRICS_PORT; там же бот отвечает на /healthz и /readyz (см. health.py).
+
+Алиса работает в нескольких воркерах gunicorn. Если задан
+PROMETHEUS_MULTIPROC_DIR, каждый воркер пишет значения в файлы этого
+каталога, а /metrics собирает их по всем воркерам (см. gunicorn.conf.py).
+"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+)
+from prometheus_client import multiprocess
+
+# Границы гистограмм: обработчики укладываются в секунды, g4f отвечает до минуты
+_FAST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_LLM_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+HANDLER_DURATION = Histogram(
+    "gestalt_handler_duration_seconds", "Время обработки запроса по интенту или кнопке",
+    ["handler"], buckets=_FAST_BUCKETS,
+)
+HANDLER_ERRORS = Counter(
+    "gestalt_handler_errors_total", "Запросы, завершившиеся исключением", ["handler"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "gestalt_requests_in_flight", "Запросы в обработке", multiprocess_mode="livesum",
+)
+STAGE_DURATION = Histogram(
+    "gestalt_stage_duration_seconds", "Время этапа обработки (parse, backend, llm, render)",
+    ["stage"], buckets=_FAST_BUCKETS,
+)
+BACKEND_DURATION = Histogram(
+    "gestalt_backend_request_duration_seconds", "Время запроса к внутреннему API",
+    ["method", "route"], buckets=_FAST_BUCKETS,
+)
+BACKEND_ERRORS = Counter(
+    "gestalt_backend_errors_total", "Неуспешные запросы к внутреннему API (network, client, server)",
+    ["route", "reason"],
+)
+BACKEND_RETRIES = Counter(
+    "gestalt_backend_retries_total", "Повторные (retry) и хеджирующие (hedge) запросы к внутреннему API",
+    ["route", "kind"],
+)
+CIRCUIT_OPEN = Gauge(
+    "gestalt_circuit_open", "Автомат отключения зависимости разомкнут (1) или замкнут (0)",
+    ["dependency"], multiprocess_mode="livemax",
+)
+CIRCUIT_REJECTIONS = Counter(
+    "gestalt_circuit_rejections_total", "Вызовы, отклонённые разомкнутым автоматом", ["dependency"],
+)
+LLM_DURATION = Histogram(
+    "gestalt_llm_duration_seconds", "Время вызова g4f", ["outcome"], buckets=_LLM_BUCKETS,
+)
+LLM_FAILURES = Counter(
+    "gestalt_llm_failures_total", "Неудачные запросы к GPT (error, timeout, rejected)", ["reason"],
+)
+LLM_PROVIDER_CALLS = Counter(
+    "gestalt_llm_provider_calls_total", "Вызовы провайдеров g4f в гонках по результату", ["provider", "outcome"],
+)
+LLM_IN_FLIGHT = Gauge(
+    "gestalt_llm_in_flight", "Вызовы g4f в пуле (выполняются или ждут потока)", multiprocess_mode="livesum",
+)
+CACHE_REQUESTS = Counter(
+    "gestalt_cache_requests_total", "Обращения к кэшам по результату (hit, stale, miss)", ["cache", "result"],
+)
+TELEGRAM_REQUESTS = Counter(
+    "gestalt_telegram_requests_total", "Запросы бота к Telegram по методу и результату (ok, error, retry_after, coalesced)",
+    ["method", "result"],
+)
+TELEGRAM_QUEUE_WAIT = Histogram(
+    "gestalt_telegram_queue_wait_seconds", "Ожидание запроса к Telegram в очереди лимитов", buckets=_FAST_BUCKETS,
+)
+LIVE_UPDATES = Counter(
+    "gestalt_live_updates_total", "Обновления сообщений со списками по событиям (edited, unchanged, gone, error)",
+    ["result"],
+)
+
+
+def route_of(path):
+    """Маршрут внутреннего API без названия элемента: /item/молоко -> /item."""
+    parts = path.strip("/").split("/")
+    if parts[0] in ("item", "delete"):
+        return f"/{parts[0]}"
+    return "/" + "/".join(parts)
+
+
+def observe_backend(method, route, seconds, status=None):
+    """Учитывает запрос к внутреннему API; status None означает сетевую ошибку."""
+    BACKEND_DURATION.labels(method, route).observe(seconds)
+    if status is None:
+        BACKEND_ERRORS.labels(route, "network").inc()
+    elif status >= 500:
+        BACKEND_ERRORS.labels(route, "server").inc()
+    elif status >= 400:
+        BACKEND_ERRORS.labels(route, "client").inc()
+
+
+def render():
+    """Текущие значения в текстовом формате Prometheus: (тело, Content-Type)."""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def _probe(ok):
+    return (200 if ok else 503), (b"ok\n" if ok else b"unavailable\n"), "text/plain; charset=utf-8"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    health = None
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body, content_type = render()
+            status = 200
+        elif path == "/healthz" and self.health is not None:
+            status, body, content_type = _probe(self.health.live())
+        elif path == "/readyz" and self.health is not None:
+            status, body, content_type = _probe(self.health.ready)
+        else:
+            status, body, content_type = 404, b"not found\n", "text/plain; charset=utf-8"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Пробы и сбор метрик идут каждые несколько секунд, в логе они не нужны
+        pass
+
+
+def serve(port, health=None):
+    """Отдаёт /metrics (и /healthz, /readyz, если передан health) на отдельном порту из фонового потока (для бота)."""
+    handler = type("Handler", (_Handler,), {"health": health})
+    server = ThreadingHTTPServer(("", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
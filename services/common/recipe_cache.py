@@ -0,0 +1,161 @@
+"""Кэш предложений блюд по содержимому холодильника.
+
+Ключ — отсортированный нормализованный набор продуктов, поэтому порядок
+и регистр в списке не влияют на попадание. Записи живут в Redis (общем с
+бекендом), чтобы кэш делили Алиса и бот; если Redis недоступен, используется
+локальный LRU в памяти процесса. Чтобы ответ из кэша подходил обоим
+сервисам, запрос к GPT они тоже строят одинаково — recipe_prompt() из того
+же нормализованного набора.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_items(items):
+    """Приводит список продуктов к каноническому виду: без регистра, дублей и порядка."""
+    normalized = set()
+    for item in items:
+        name = " ".join(item.lower().replace("ё", "е").split())
+        if name:
+            normalized.add(name)
+    return sorted(normalized)
+
+
+def recipe_prompt(items):
+    """Запрос к GPT за блюдами, общий для Алисы и бота (ответ одного попадает в кэш другого)."""
+    return (
+        f"Что можно приготовить из таких продуктов: {', '.join(normalize_items(items))}? "
+        "Назови только 10 названий блюд. Желательно из русской, татарской, грузинской, итальянской, "
+        "вьетнамской, узбекской, японской кухонь. Пример: лагман, манты, хинкали, мясо по-французски, "
+        "очпочмак, шаурма, бургер, пицца, борщ, солянка, курица во фритюре, на мангале, на пару. "
+        "Не повторяй, что я сказал, из этого списка - только как пример,от силы 1 повторенье."
+    )
+
+
+class RecipeCache:
+    """Кэш ответов GPT с TTL и LRU-вытеснением, счётчики попаданий и промахов."""
+
+    def __init__(self, redis_client=None, scope="dishes", ttl=6 * 3600, max_entries=256):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prefix = f"recipes:{scope}"
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = OrderedDict()
+
+    def _key(self, items):
+        digest = hashlib.sha1("\n".join(normalize_items(items)).encode("utf-8")).hexdigest()
+        return f"{self.prefix}:{digest}"
+
+    def get(self, items):
+        """Возвращает сохранённый ответ для набора продуктов или None."""
+        key = self._key(items)
+        value = None
+        if self.redis is not None:
+            try:
+                value = self._redis_get(key)
+            except redis.RedisError as e:
+                logger.warning("Кэш рецептов: Redis недоступен, используем локальный кэш: %s", e)
+                value = self._local_get(key)
+        else:
+            value = self._local_get(key)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.CACHE_REQUESTS.labels("recipes", "miss" if value is None else "hit").inc()
+        return value
+
+    def set(self, items, value):
+        """Сохраняет ответ для набора продуктов."""
+        if not value:
+            return
+        key = self._key(items)
+        if self.redis is not None:
+            try:
+                self._redis_set(key, value)
+                return
+            except redis.RedisError as e:
+                logger.warning("Кэш рецептов: не удалось записать в Redis: %s", e)
+        self._local_set(key, value)
+
+    def stats(self):
+        """Счётчики этого процесса и общие для всех сервисов (если есть Redis)."""
+        with self._lock:
+            stats = {"hits": self.hits, "misses": self.misses}
+        if self.redis is not None:
+            try:
+                shared = self.redis.hgetall(f"{self.prefix}:stats")
+                stats["shared_hits"] = int(shared.get("hits", 0))
+                stats["shared_misses"] = int(shared.get("misses", 0))
+            except redis.RedisError:
+                pass
+        return stats
+
+    # Redis: значение с TTL + sorted set с временем последнего обращения для LRU
+
+    def _redis_get(self, key):
+        value = self.redis.get(key)
+        pipe = self.redis.pipeline(transaction=False)
+        if value is None:
+            pipe.zrem(f"{self.prefix}:lru", key)
+            pipe.hincrby(f"{self.prefix}:stats", "misses", 1)
+        else:
+            pipe.zadd(f"{self.prefix}:lru", {key: time.time()})
+            pipe.hincrby(f"{self.prefix}:stats", "hits", 1)
+        pipe.execute()
+        return value
+
+    def _redis_set(self, key, value):
+        lru_key = f"{self.prefix}:lru"
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(key, value, ex=self.ttl)
+        pipe.zadd(lru_key, {key: now})
+        # Записи, к которым не обращались дольше TTL, уже истекли
+        pipe.zremrangebyscore(lru_key, 0, now - self.ttl)
+        pipe.zcard(lru_key)
+        size = pipe.execute()[-1]
+
+        excess = size - self.max_entries
+        if excess > 0:
+            oldest = self.redis.zrange(lru_key, 0, excess - 1)
+            if oldest:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.delete(*oldest)
+                pipe.zrem(lru_key, *oldest)
+                pipe.execute()
+
+    # Локальный LRU на случай, если Redis не настроен или недоступен
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def _local_set(self, key, value):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
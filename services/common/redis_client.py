@@ -0,0 +1,61 @@
+"""Подключение к Redis, общему с Go бекендом."""
+import os
+
+import redis
+import redis.asyncio
+
+_client = None
+_async_client = None
+
+
+def _connection_kwargs():
+    """Параметры подключения из окружения или None, если Redis не настроен.
+
+    Адрес берётся из REDIS_ADDR (как в бекенде) либо из REDIS_HOST/REDIS_PORT.
+    """
+    addr = os.getenv("REDIS_ADDR", "")
+    host = os.getenv("REDIS_HOST", "")
+    port = int(os.getenv("REDIS_PORT", "6379"))
+    if addr:
+        host, _, addr_port = addr.partition(":")
+        if addr_port:
+            port = int(addr_port)
+    if not host:
+        return None
+    return dict(
+        host=host,
+        port=port,
+        db=int(os.getenv("REDIS_DB", "0")),
+        password=os.getenv("REDIS_PASSWORD") or None,
+        socket_timeout=float(os.getenv("REDIS_TIMEOUT", "0.5")),
+        socket_connect_timeout=float(os.getenv("REDIS_TIMEOUT", "0.5")),
+        decode_responses=True,
+    )
+
+
+def get_redis():
+    """Возвращает общий синхронный клиент Redis или None, если Redis не настроен."""
+    global _client
+    if _client is not None:
+        return _client
+    kwargs = _connection_kwargs()
+    if kwargs is None:
+        return None
+    _client = redis.Redis(**kwargs)
+    return _client
+
+
+def get_async_redis():
+    """Возвращает общий асинхронный клиент Redis (для бота) или None.
+
+    Соединения клиента привязываются к event loop, поэтому использовать его
+    можно только из event loop приложения.
+    """
+    global _async_client
+    if _async_client is not None:
+        return _async_client
+    kwargs = _connection_kwargs()
+    if kwargs is None:
+        return None
+    _async_client = redis.asyncio.Redis(**kwargs)
+    return _async_client
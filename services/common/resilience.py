@@ -0,0 +1,143 @@
+"""Устойчивость исходящих вызовов: автомат отключения, повторы и хеджирование.
+
+Когда бекенд или провайдер g4f деградирует, каждый вызов ждёт свой таймаут,
+и хендлеры всех пользователей копятся за ним. CircuitBreaker считает
+ошибки подряд и после порога отвечает отказом сразу (CircuitOpenError), не
+обращаясь к зависимости; через reset_timeout пропускает один пробный вызов.
+Вызывающий код в этом случае отдаёт кэшированный или упрощённый ответ.
+
+Идемпотентные чтения повторяются с экспоненциальной задержкой и джиттером
+(backoff) и хеджируются: если ответ не пришёл за hedge_after, параллельно
+уходит второй такой же запрос и берётся первый успешный. Хвост задержки
+одного медленного соединения так не становится задержкой пользователя.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, TimeoutError as FutureTimeoutError, wait
+
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Зависимость недоступна: автомат разомкнут, вызов не выполнялся."""
+
+    def __init__(self, name):
+        super().__init__(f"{name} временно недоступен")
+        self.name = name
+
+
+class CircuitBreaker:
+    """Автомат отключения зависимости по числу ошибок подряд.
+
+    Потокобезопасен и не блокирует, поэтому один экземпляр подходит и для
+    потоков gunicorn, и для event loop бота.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=10.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def allow(self):
+        """Можно ли вызывать зависимость. Разомкнутый автомат раз в reset_timeout пропускает пробный вызов."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            # Следующая проба не раньше чем через reset_timeout, даже если эта потеряется (отмена вызова)
+            self._opened_at = time.monotonic()
+            self._probing = True
+            return True
+
+    def check(self):
+        """Как allow(), но вместо False бросает CircuitOpenError."""
+        if not self.allow():
+            metrics.CIRCUIT_REJECTIONS.labels(self.name).inc()
+            raise CircuitOpenError(self.name)
+
+    def success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Автомат %s: зависимость снова доступна", self.name)
+                metrics.CIRCUIT_OPEN.labels(self.name).set(0)
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._opened_at is None and self._failures >= self.failure_threshold:
+                logger.warning("Автомат %s: %d ошибок подряд, вызовы приостановлены", self.name, self._failures)
+                metrics.CIRCUIT_OPEN.labels(self.name).set(1)
+                self._opened_at = time.monotonic()
+            elif self._probing:
+                # Пробный вызов не удался: ждём ещё reset_timeout
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+def backoff(attempt, base, maximum):
+    """Пауза перед повтором attempt (с 1): экспонента с потолком и джиттером."""
+    return min(maximum, base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+def hedged_call(executor, fn, hedge_after, on_hedge=None):
+    """Выполняет fn в пуле; если ответа нет за hedge_after секунд, запускает второй fn.
+
+    Возвращает первый успешный результат. Если упали оба — исключение первого.
+    on_hedge() вызывается, когда уходит второй запрос (для метрик).
+    """
+    first = executor.submit(fn)
+    try:
+        return first.result(timeout=hedge_after)
+    except FutureTimeoutError:
+        pass
+    if on_hedge is not None:
+        on_hedge()
+    second = executor.submit(fn)
+    pending = {first, second}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+    return first.result()
+
+
+async def hedged(make_call, hedge_after, on_hedge=None):
+    """Асинхронный вариант hedged_call: make_call() возвращает новую корутину на каждый вызов."""
+    first = asyncio.ensure_future(make_call())
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            if on_hedge is not None:
+                on_hedge()
+            tasks.append(asyncio.ensure_future(make_call()))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+        return first.result()
+    finally:
+        # Проигравший запрос больше не нужен; при отмене вызывающего отменяются оба
+        for task in tasks:
+            if not task.done():
+                task.cancel()
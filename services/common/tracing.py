@@ -0,0 +1,156 @@
+"""Структурные логи и трассировка запросов для Python-сервисов.
+
+Логи пишутся в stdout одной JSON-строкой на событие. Каждый входящий запрос
+(вебхук Алисы, апдейт Telegram) оборачивается в Trace: он получает
+correlation ID, который уходит во внутренний API заголовком X-Request-ID,
+и собирает время по этапам (parse, backend, llm, render). Итоговая строка
+трассы пишется для доли запросов LOG_SAMPLE_RATE, а также всегда для
+медленных (дольше LOG_SLOW_MS) и завершившихся ошибкой. Время трассы и
+этапов всегда попадает в метрики Prometheus (common.metrics).
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+from common import metrics
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LOG_SLOW_MS = float(os.getenv("LOG_SLOW_MS", "1000"))
+
+_current = contextvars.ContextVar("trace", default=None)
+
+logger = logging.getLogger("trace")
+
+
+class JSONFormatter(logging.Formatter):
+    """Форматирует запись лога в одну JSON-строку."""
+
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "service": self.service,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        trace = _current.get()
+        if trace is not None:
+            entry["request_id"] = trace.request_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(service):
+    """Настраивает корневой логгер: JSON в stdout, уровень из LOG_LEVEL."""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter(service))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    # httpx пишет строку на каждый запрос на уровне INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+class Trace:
+    """Трасса одного входящего запроса: correlation ID и время по этапам."""
+
+    def __init__(self, name, request_id=None, **fields):
+        self.name = name
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.fields = fields
+        self.stages = {}
+        self._started = None
+        self._token = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self._token = _current.set(self)
+        metrics.REQUESTS_IN_FLIGHT.inc()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        duration_ms = (time.perf_counter() - self._started) * 1000
+        self._observe(duration_ms, exc_type)
+        if exc_type is None and duration_ms < LOG_SLOW_MS and random.random() >= LOG_SAMPLE_RATE:
+            return False
+        fields = dict(self.fields)
+        fields["request_id"] = self.request_id
+        fields["duration_ms"] = round(duration_ms, 1)
+        fields["stages_ms"] = {stage: round(ms, 1) for stage, ms in self.stages.items()}
+        if exc_type is not None:
+            fields["error"] = f"{exc_type.__name__}: {exc}"
+        logger.log(logging.ERROR if exc_type else logging.INFO, self.name, extra={"fields": fields})
+        return False
+
+    def _observe(self, duration_ms, exc_type):
+        # Интент Алисы известен только после разбора, поэтому он важнее имени трассы
+        handler = self.fields.get("intent") or self.name
+        metrics.REQUESTS_IN_FLIGHT.dec()
+        metrics.HANDLER_DURATION.labels(handler).observe(duration_ms / 1000)
+        if exc_type is not None:
+            metrics.HANDLER_ERRORS.labels(handler).inc()
+        for stage, ms in self.stages.items():
+            metrics.STAGE_DURATION.labels(stage).observe(ms / 1000)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def stage(name):
+    """Замеряет этап текущей трассы; вне трассы ничего не делает."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    with trace.stage(name):
+        yield
+
+
+def trace_headers():
+    """Заголовки для исходящих запросов во внутренний API."""
+    trace = _current.get()
+    if trace is None:
+        return {}
+    return {REQUEST_ID_HEADER: trace.request_id}
+
+
+def traced(name):
+    """Декоратор асинхронного хендлера: каждый вызов выполняется внутри своей Trace.
+
+    name — строка или функция от аргументов хендлера, возвращающая имя трассы.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with Trace(name(*args, **kwargs) if callable(name) else name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,195 @@
+"""Очередь отложенной записи добавлений в бекенд.
+
+Каждое добавление в бекенде — это глобальный мьютекс и чтение-запись всего
+списка категории в Redis. Фронтенд подтверждает добавление пользователю
+сразу, а элементы кладёт в локальную очередь. Фоновый поток ждёт короткое
+окно, забирает всё накопившееся и отправляет элементы каждого пользователя
+одним запросом к /add/bulk: серия продиктованных подряд элементов стоит
+бекенду одно чтение-запись на категорию, а не N.
+
+Очередь хранится в файле SQLite, поэтому переживает перезапуск и общая для
+воркеров gunicorn: строки забираются в аренду, и если воркер упал посреди
+отправки, их подберёт другой после истечения аренды. Путь ":memory:" даёт
+базу в памяти процесса (для тестов).
+
+Если бекенд окончательно отверг элементы (send бросает Rejected, например
+на ответ 4xx), повтор не поможет: строки переносятся в таблицу rejected и
+пишутся в лог, а не пропадают молча.
+
+on_flushed(user) вызывается только в том процессе, который отправил строки.
+Другим воркерам для сброса своих кэшей служит flushed(): счётчик
+подтверждённых отправок в том же файле.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from common.resilience import backoff
+
+logger = logging.getLogger(__name__)
+
+
+class Rejected(Exception):
+    """Бекенд отверг элементы, и повтор не поможет: они уходят в таблицу rejected."""
+
+
+class WriteBehindQueue:
+    """Очередь добавлений (пользователь, элемент) с пакетной отправкой из фонового потока."""
+
+    def __init__(self, send, path, window=0.2, retry_base=0.5, retry_max=30.0, lease=30.0, on_flushed=None):
+        # send(user, items) отправляет элементы одним запросом; Rejected — отказ навсегда,
+        # любое другое исключение означает "повторить позже"
+        self.send = send
+        self.path = path
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.window = window
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease = lease
+        self.on_flushed = on_flushed
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS adds (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "user TEXT, category TEXT, item TEXT, created REAL, claimed_until REAL DEFAULT 0)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rejected (id INTEGER PRIMARY KEY, "
+            "user TEXT, category TEXT, item TEXT, created REAL, rejected REAL, reason TEXT)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS flushes (id INTEGER PRIMARY KEY CHECK (id = 1), count INTEGER)")
+        self._db.execute("INSERT OR IGNORE INTO flushes VALUES (1, 0)")
+        self._db.commit()
+        # Строки, оставшиеся с прошлого запуска, отправляются сразу
+        if self._db.execute("SELECT 1 FROM adds LIMIT 1").fetchone():
+            self._ensure_thread()
+            self._wakeup.set()
+
+    def put(self, user, items):
+        """Ставит элементы (словари с name и category) в очередь и сразу возвращается."""
+        now = time.time()
+        rows = [(user, item["category"], json.dumps(item, ensure_ascii=False), now) for item in items]
+        with self._lock, self._db:
+            self._db.executemany("INSERT INTO adds (user, category, item, created) VALUES (?, ?, ?, ?)", rows)
+        self._ensure_thread()
+        self._wakeup.set()
+
+    def pending(self, user, category):
+        """Элементы категории, которые ещё не подтверждены бекендом (для чтения своих записей)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT item FROM adds WHERE user = ? AND category = ? ORDER BY id", (user, category)
+            ).fetchall()
+        return [json.loads(item) for item, in rows]
+
+    def flushed(self):
+        """Сколько раз любой процесс с этим файлом подтвердил отправку: меняется — кэш списков устарел."""
+        with self._lock:
+            return self._db.execute("SELECT count FROM flushes WHERE id = 1").fetchone()[0]
+
+    def close(self, timeout=2.0):
+        """Останавливает поток, пытаясь отправить остаток очереди.
+
+        Что не успело уйти, остаётся в файле и будет отправлено другим воркером или после перезапуска.
+        """
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _ensure_thread(self):
+        # Поток запускается лениво: под gunicorn модуль импортируется в каждом воркере после fork
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        attempt = 0
+        while True:
+            # Просыпаемся и без новых записей, чтобы подобрать строки упавшего воркера
+            self._wakeup.wait(self.lease)
+            if not self._stopped:
+                # Окно склейки: элементы, продиктованные подряд, уйдут одним запросом
+                time.sleep(self.window)
+            self._wakeup.clear()
+
+            batches = self._claim()
+            failed = False
+            for user, rows in batches.items():
+                ids = [row_id for row_id, _ in rows]
+                items = [item for _, item in rows]
+                try:
+                    self.send(user, items)
+                except Rejected as e:
+                    self._reject(ids, str(e))
+                    logger.error("Очередь записи: бекенд отверг %d элементов, они перенесены в rejected: %s",
+                                 len(ids), e, extra={"fields": {"user": user, "items": items}})
+                    continue
+                except Exception as e:
+                    failed = True
+                    self._release(ids)
+                    logger.warning("Очередь записи: не удалось отправить %d элементов: %s", len(ids), e)
+                    continue
+                self._ack(ids)
+                if self.on_flushed is not None:
+                    try:
+                        self.on_flushed(user)
+                    except Exception:
+                        # Строки уже подтверждены; ошибка колбэка не должна останавливать поток очереди
+                        logger.exception("Очередь записи: ошибка в on_flushed")
+
+            if self._stopped:
+                return
+            if failed:
+                attempt += 1
+                time.sleep(backoff(attempt, self.retry_base, self.retry_max))
+                self._wakeup.set()
+            else:
+                attempt = 0
+
+    def _claim(self):
+        """Забирает в аренду все свободные строки и группирует их по пользователю."""
+        now = time.time()
+        with self._lock, self._db:
+            # IMMEDIATE берет блокировку записи сразу, чтобы два воркера не забрали одни строки
+            self._db.execute("BEGIN IMMEDIATE")
+            rows = self._db.execute(
+                "SELECT id, user, item FROM adds WHERE claimed_until < ? ORDER BY id", (now,)
+            ).fetchall()
+            if rows:
+                self._db.executemany(
+                    "UPDATE adds SET claimed_until = ? WHERE id = ?", [(now + self.lease, row[0]) for row in rows]
+                )
+        batches = {}
+        for row_id, user, item in rows:
+            batches.setdefault(user, []).append((row_id, json.loads(item)))
+        return batches
+
+    def _ack(self, ids):
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM adds WHERE id = ?", [(row_id,) for row_id in ids])
+            self._db.execute("UPDATE flushes SET count = count + 1 WHERE id = 1")
+
+    def _reject(self, ids, reason):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO rejected SELECT id, user, category, item, created, ?, ? FROM adds WHERE id = ?",
+                [(now, reason, row_id) for row_id in ids],
+            )
+            self._db.executemany("DELETE FROM adds WHERE id = ?", [(row_id,) for row_id in ids])
+
+    def _release(self, ids):
+        with self._lock, self._db:
+            self._db.executemany("UPDATE adds SET claimed_until = 0 WHERE id = ?", [(row_id,) for row_id in ids])
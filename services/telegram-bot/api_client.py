@@ -0,0 +1,133 @@
+"""Асинхронный клиент внутреннего API geshtalt для телеграм-бота.
+
+Один экземпляр httpx.AsyncClient на весь процесс: keep-alive соединения
+переиспользуются между хендлерами, а семафор ограничивает число одновременных
+запросов к бекенду, чтобы всплеск нажатий не открывал сотни соединений.
+
+Чтения (GET) повторяются при сетевых ошибках и ответах 5xx и хеджируются.
+Автомат отключения после серии ошибок отвечает CircuitOpenError сразу, не
+дожидаясь таймаута; хендлеры в это время работают из локальной копии списков.
+
+Сами запросы и разбор ответов общие с Алисой (common.internal_api): клиент
+только отправляет Call и отдаёт байты ответа в Call.result().
+"""
+import asyncio
+import time
+from typing import Dict, List
+
+import httpx
+
+from common import internal_api
+from common.internal_api import Item
+from common.metrics import BACKEND_RETRIES, observe_backend, route_of
+from common.resilience import CircuitBreaker, backoff, hedged
+from common.tracing import stage
+
+
+class APIClient:
+    """Пул соединений к /internal/api с таймаутами и ограничением конкурентности."""
+
+    def __init__(
+        self, base_url, user_id="", timeout=5.0, max_connections=20, max_concurrency=10,
+        retries=2, retry_base=0.1, hedge_after=0.0, breaker=None,
+    ):
+        headers = {}
+        if user_id:
+            headers["X-User-ID"] = user_id
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 2.0)),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=30.0,
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Сколько раз повторять GET и через сколько секунд отправлять хеджирующий GET (0 — не отправлять)
+        self.retries = retries
+        self.retry_base = retry_base
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker("backend")
+
+    async def _send(self, method, path, *, headers, **kwargs):
+        """Единая точка выхода в бекенд: автомат отключения, повторы и хеджирование GET
+        и замер этапа backend.
+
+        Ответ 5xx после всех попыток возвращается как есть; CircuitOpenError — если бекенд отключен.
+        """
+        route = route_of(path)
+        idempotent = method == "GET"
+        attempts = 1 + (self.retries if idempotent else 0)
+
+        def call():
+            return self._request(method, path, route, headers=headers or None, **kwargs)
+
+        with stage("backend"):
+            attempt = 1
+            while True:
+                self.breaker.check()
+                try:
+                    if idempotent and self.hedge_after:
+                        response = await hedged(
+                            call, self.hedge_after, on_hedge=lambda: BACKEND_RETRIES.labels(route, "hedge").inc()
+                        )
+                    else:
+                        response = await call()
+                except httpx.HTTPError:
+                    self.breaker.failure()
+                    if attempt >= attempts:
+                        raise
+                else:
+                    if response.status_code < 500:
+                        self.breaker.success()
+                        return response
+                    self.breaker.failure()
+                    if attempt >= attempts:
+                        return response
+                BACKEND_RETRIES.labels(route, "retry").inc()
+                await asyncio.sleep(backoff(attempt, self.retry_base, self.retry_base * 8))
+                attempt += 1
+
+    async def _request(self, method, path, route, **kwargs):
+        async with self._semaphore:
+            # В метрику идет время самого запроса, без ожидания семафора
+            started = time.perf_counter()
+            try:
+                response = await self._client.request(method, path, **kwargs)
+            except httpx.HTTPError:
+                observe_backend(method, route, time.perf_counter() - started)
+                raise
+            observe_backend(method, route, time.perf_counter() - started, response.status_code)
+            return response
+
+    async def call(self, call, user_id=None):
+        """Выполняет запрос из common.internal_api и возвращает разобранный ответ (APIError при другом статусе)."""
+        response = await self._send(
+            call.method, call.path, params=call.params, content=call.body, headers=call.headers(user_id),
+        )
+        return call.result(response.status_code, response.content)
+
+    async def get_list(self, category, user_id=None) -> List[Item]:
+        """Возвращает элементы категории. user_id переопределяет пользователя клиента."""
+        return await self.call(internal_api.get_list(category), user_id)
+
+    async def get_lists(self, categories, user_id=None) -> Dict[str, List[Item]]:
+        """Возвращает {категория: элементы} для нескольких категорий одним запросом."""
+        return await self.call(internal_api.get_lists(categories), user_id)
+
+    async def add_items(self, items, user_id=None):
+        """Добавляет несколько элементов одним запросом к /add/bulk."""
+        return await self.call(internal_api.add_items(items), user_id)
+
+    async def patch_item(self, name, category, user_id=None, **fields) -> Item:
+        """Частично обновляет один элемент (priority, bought или перенос в category) одним запросом."""
+        return await self.call(internal_api.patch_item(name, category, **fields), user_id)
+
+    async def delete_item(self, name, category, user_id=None):
+        """Удаляет элемент из категории."""
+        await self.call(internal_api.delete_item(name, category), user_id)
+
+    async def close(self):
+        await self._client.aclose()
@@ -0,0 +1,115 @@
+"""Короткие токены для callback_data кнопок элементов.
+
+Telegram ограничивает callback_data 64 байтами, а кириллическое название
+элемента вместе с категорией быстро в них не помещается; двоеточие в названии
+к тому же ломало разбор "item_action:...:{name}:{category}". Вместо названия
+в кнопку кладётся токен фиксированной длины, а (пользователь, категория,
+элемент) хранится в таблице токенов.
+
+Токен — хэш тройки, поэтому повторный показ того же списка не плодит новых
+записей. Таблица — LRU в памяти процесса с ограничением размера; если есть
+Redis, записи дублируются туда с TTL, и кнопки старых сообщений продолжают
+работать после перезапуска бота.
+"""
+import base64
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# 9 байт хэша дают 12 символов base64url
+_TOKEN_BYTES = 9
+
+
+def make_token(user, category, name):
+    """Детерминированный токен для (пользователь, категория, элемент)."""
+    digest = hashlib.blake2b(
+        "\x00".join((user or "", category, name)).encode("utf-8"), digest_size=_TOKEN_BYTES
+    ).digest()
+    return base64.urlsafe_b64encode(digest).decode("ascii")
+
+
+class CallbackTokens:
+    """Ограниченная таблица токен -> (пользователь, категория, элемент) с LRU-вытеснением."""
+
+    def __init__(self, redis_client=None, max_entries=4096, ttl=7 * 24 * 3600):
+        self.redis = redis_client
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prefix = "cbtok"
+        self._lock = threading.Lock()
+        self._local = OrderedDict()
+        # Новые записи, которые ещё не ушли в Redis
+        self._pending = {}
+
+    def issue(self, user, category, name):
+        """Возвращает токен для элемента и запоминает его в локальной таблице."""
+        token = make_token(user, category, name)
+        with self._lock:
+            if token in self._local:
+                self._local.move_to_end(token)
+                return token
+            entry = (user, category, name)
+            self._local[token] = entry
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+            if self.redis is not None:
+                self._pending[token] = entry
+        return token
+
+    def resolve(self, token):
+        """Ищет токен в памяти процесса. Возвращает (user, category, name) или None."""
+        with self._lock:
+            entry = self._local.get(token)
+            if entry is not None:
+                self._local.move_to_end(token)
+            return entry
+
+    @property
+    def dirty(self):
+        return bool(self._pending)
+
+    def flush(self):
+        """Записывает новые токены в Redis одним пайплайном (блокирующий вызов)."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending or self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for token, entry in pending.items():
+                pipe.set(f"{self.prefix}:{token}", json.dumps(entry, ensure_ascii=False), ex=self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning("Токены кнопок: не удалось записать в Redis: %s", e)
+            # Возвращаем записи в очередь: issue() их больше не добавит, пока токен есть в памяти.
+            # Пока Redis недоступен, храним не больше max_entries самых новых
+            with self._lock:
+                pending.update(self._pending)
+                self._pending = pending
+                for token in list(pending)[:max(0, len(pending) - self.max_entries)]:
+                    del pending[token]
+
+    def fetch(self, token):
+        """Ищет токен в памяти, затем в Redis (блокирующий вызов)."""
+        entry = self.resolve(token)
+        if entry is not None or self.redis is None:
+            return entry
+        try:
+            value = self.redis.get(f"{self.prefix}:{token}")
+        except redis.RedisError as e:
+            logger.warning("Токены кнопок: Redis недоступен: %s", e)
+            return None
+        if value is None:
+            return None
+        entry = tuple(json.loads(value))
+        with self._lock:
+            self._local[token] = entry
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+        return entry
@@ -0,0 +1,383 @@
+"""Локальная реплика списков телеграм-бота с фоновой синхронизацией.
+
+Чтение отвечает из локальной копии сразу, даже если она старше TTL: тогда
+копия обновляется в фоне. Бекенд ждём только при самом первом чтении
+категории. Запись (добавление, удаление, перенос, приоритет) сразу меняет
+локальную копию и встаёт в очередь операций; фоновая задача отправляет
+очередь в бекенд по порядку, повторяя временные ошибки с экспоненциальной
+задержкой. Поэтому медленный или недоступный бекенд не останавливает
+интерфейс бота.
+
+Конфликты решаются по времени. Снимок категории из бекенда принимается,
+только если он запрошен после последней отправленной в бекенд операции по
+этой категории. Неподтверждённые операции новее любого снимка, поэтому они
+накладываются поверх него заново.
+
+Если задан path, списки и очередь операций хранятся в SQLite и переживают
+перезапуск бота.
+
+Пока бот получает уведомления об изменениях списков (live_lists.py), копия
+обновляется по ним, а по времени — только раз в push_ttl на случай
+потерянного уведомления.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import sqlite3
+import time
+from collections import deque
+
+import httpx
+
+from common.internal_api import APIError
+from common.metrics import CACHE_REQUESTS
+from common.resilience import CircuitOpenError, backoff
+
+logger = logging.getLogger(__name__)
+
+
+def apply_op(category, items, op):
+    """Применяет операцию очереди к списку категории и возвращает новый список."""
+    kind = op["kind"]
+    if kind == "add":
+        return items + op["items"] if category == op["category"] else items
+    if kind == "delete":
+        return [item for item in items if item["name"] != op["name"]]
+    # patch: частичное обновление, возможно с переносом в другую категорию
+    new_category = op["fields"].get("category", op["category"])
+    if new_category == op["category"]:
+        return [dict(item, **op["fields"]) if item["name"] == op["name"] else item for item in items]
+    if category == op["category"]:
+        return [item for item in items if item["name"] != op["name"]]
+    return items + [op["item"]]
+
+
+def op_keys(op):
+    """Ключи (пользователь, категория), которые затрагивает операция."""
+    keys = [(op["user"], op["category"])]
+    new_category = op.get("fields", {}).get("category")
+    if new_category and new_category != op["category"]:
+        keys.append((op["user"], new_category))
+    return keys
+
+
+def _log_refresh_error(task):
+    # Ошибка фонового обновления не должна теряться молча: читатель получит старую копию
+    if task.cancelled() or task.exception() is None:
+        return
+    if isinstance(task.exception(), CircuitOpenError):
+        # Бекенд отключен автоматом — копия останется прежней, об этом уже предупредил автомат
+        logger.debug("Реплика списков: обновление пропущено: %s", task.exception())
+        return
+    logger.warning("Реплика списков: не удалось обновить список: %s", task.exception())
+
+
+class ListReplica:
+    """Локальные копии списков по ключу (пользователь, категория) и очередь записи в бекенд."""
+
+    def __init__(self, api, path="", ttl=15.0, retry_base=0.5, retry_max=30.0, window=0.2, push_ttl=300.0):
+        self.api = api
+        self.path = path
+        self.ttl = ttl
+        self.push_ttl = push_ttl
+        self._push = False
+        # Окно склейки добавлений: элементы, добавленные подряд, уходят одним запросом
+        self.window = window
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._lists = {}
+        # Время (time.time) последнего принятого снимка и последней отправки операции по ключу
+        self._synced = {}
+        self._sent = {}
+        self._loading = {}
+        self._ops = deque()
+        self._pending = {}
+        self._inflight = ()
+        self._ids = itertools.count(1)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._db = None
+
+    async def start(self):
+        """Поднимает сохранённое состояние и запускает фоновую синхронизацию."""
+        if self.path:
+            self._open()
+        self._task = asyncio.create_task(self._sync_loop())
+        if self._ops:
+            self._wakeup.set()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._ops:
+            logger.warning("Реплика списков: %d операций не отправлено в бекенд", len(self._ops))
+        if self._db is not None:
+            self._db.close()
+
+    def set_push(self, enabled):
+        """Включает режим, в котором об изменениях в бекенде сообщают уведомления."""
+        self._push = enabled
+
+    @property
+    def current_ttl(self):
+        return self.push_ttl if self._push else self.ttl
+
+    # Чтение
+
+    async def get(self, user, category):
+        """Возвращает список из локальной копии или загружает его из бекенда."""
+        key = (user, category)
+        items = self._lists.get(key)
+        if items is None:
+            CACHE_REQUESTS.labels("lists", "miss").inc()
+            return await self._load_shared(key)
+        if time.time() - self._synced.get(key, 0) > self.current_ttl:
+            CACHE_REQUESTS.labels("lists", "stale").inc()
+            self._refresh_in_background(key)
+        else:
+            CACHE_REQUESTS.labels("lists", "hit").inc()
+        return items
+
+    async def refresh(self, user, category):
+        """Перечитывает список из бекенда (список изменился) и возвращает актуальную копию."""
+        key = (user, category)
+        task = self._loading.get(key)
+        if task is not None:
+            # Идущая загрузка могла начаться до изменения: дожидаемся её и читаем заново
+            await asyncio.wait([task])
+        return await self._load_shared(key)
+
+    def cached(self, key):
+        return key in self._lists
+
+    async def find(self, user, category, name):
+        """Возвращает элемент по названию или None."""
+        for item in await self.get(user, category):
+            if item["name"] == name:
+                return item
+        return None
+
+    async def warm(self, user, categories):
+        """Загружает все устаревшие категории пользователя одним запросом к бекенду."""
+        now = time.time()
+        stale = [
+            category for category in categories
+            if (user, category) not in self._loading and now - self._synced.get((user, category), 0) > self.current_ttl
+        ]
+        if not stale:
+            return
+        started = time.time()
+        lists = await self.api.get_lists(stale, user_id=user)
+        for category, items in lists.items():
+            self._apply_snapshot((user, category), items, started)
+
+    def _refresh_in_background(self, key):
+        if key in self._loading:
+            return
+        task = asyncio.ensure_future(self._load_shared(key))
+        task.add_done_callback(_log_refresh_error)
+
+    async def _load_shared(self, key):
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key))
+            self._loading[key] = task
+        # shield: отмена одного хендлера не должна отменять общую загрузку
+        return await asyncio.shield(task)
+
+    async def _load(self, key):
+        started = time.time()
+        try:
+            items = await self.api.get_list(key[1], user_id=key[0])
+        finally:
+            if self._loading.get(key) is asyncio.current_task():
+                del self._loading[key]
+        self._apply_snapshot(key, items, started)
+        return self._lists[key] if key in self._lists else self._rebase(key, items)
+
+    def _apply_snapshot(self, key, items, started):
+        """Принимает снимок из бекенда, если он не старше последней отправленной операции."""
+        if key in self._inflight or self._sent.get(key, 0) >= started:
+            # Снимок мог не увидеть операцию, которую бекенд уже применил; дождемся следующего
+            return
+        self._lists[key] = self._rebase(key, items)
+        self._synced[key] = time.time()
+        self._save_list(key)
+
+    def _rebase(self, key, items):
+        """Накладывает неподтвержденные операции по ключу поверх снимка из бекенда."""
+        for op in self._ops:
+            if key in op_keys(op):
+                items = apply_op(key[1], items, op)
+        return items
+
+    # Запись
+
+    def add_items(self, user, category, names, priority=2):
+        """Добавляет элементы в категорию."""
+        self._enqueue({
+            "kind": "add",
+            "user": user,
+            "category": category,
+            "items": [{"name": name, "category": category, "bought": False, "priority": priority} for name in names],
+        })
+
+    async def delete_item(self, user, category, name):
+        """Удаляет элемент. Возвращает False, если его нет в списке."""
+        if await self.find(user, category, name) is None:
+            return False
+        self._enqueue({"kind": "delete", "user": user, "category": category, "name": name})
+        return True
+
+    async def update_item(self, user, category, name, /, **fields):
+        """Меняет поля элемента (priority, bought или category для переноса).
+
+        Возвращает False, если элемента нет в списке.
+        """
+        item = await self.find(user, category, name)
+        if item is None:
+            return False
+        self._enqueue({
+            "kind": "patch",
+            "user": user,
+            "category": category,
+            "name": name,
+            "fields": fields,
+            "item": dict(item, **fields),
+        })
+        return True
+
+    def _enqueue(self, op):
+        op["id"] = next(self._ids)
+        op["ts"] = time.time()
+        for key in op_keys(op):
+            self._pending[key] = self._pending.get(key, 0) + 1
+            if key in self._lists:
+                self._lists[key] = apply_op(key[1], self._lists[key], op)
+                self._save_list(key)
+        self._ops.append(op)
+        self._save_op(op)
+        self._wakeup.set()
+
+    # Синхронизация
+
+    async def _sync_loop(self):
+        attempt = 0
+        while True:
+            if not self._ops:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if self._ops[0]["kind"] == "add" and attempt == 0 and self.window:
+                await asyncio.sleep(self.window)
+            batch = self._next_batch()
+            keys = {key for op in batch for key in op_keys(op)}
+            self._inflight = keys
+            try:
+                await self._send(batch)
+            except (APIError, httpx.HTTPError, CircuitOpenError) as e:
+                if isinstance(e, APIError) and e.status_code < 500:
+                    # Бекенд отверг операцию: повтор не поможет, локальную копию перечитываем
+                    logger.error("Реплика списков: бекенд отклонил %s %s: %s", batch[0]["kind"], batch[0]["category"], e)
+                    self._done(batch, refresh=True)
+                    attempt = 0
+                    continue
+                attempt += 1
+                delay = backoff(attempt, self.retry_base, self.retry_max)
+                logger.warning("Реплика списков: бекенд недоступен (%s), повтор через %.1f с", e, delay)
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                self._inflight = ()
+                now = time.time()
+                for key in keys:
+                    self._sent[key] = now
+            attempt = 0
+            self._done(batch)
+
+    def _next_batch(self):
+        """Операции для одного запроса: голова очереди и идущие за ней добавления того же пользователя.
+
+        Добавления в разные категории тоже склеиваются — /add/bulk принимает их вместе.
+        """
+        head = self._ops[0]
+        if head["kind"] != "add":
+            return [head]
+        batch = []
+        for op in self._ops:
+            if op["kind"] != "add" or op["user"] != head["user"]:
+                break
+            batch.append(op)
+        return batch
+
+    async def _send(self, batch):
+        op = batch[0]
+        if op["kind"] == "add":
+            await self.api.add_items([item for op in batch for item in op["items"]], user_id=op["user"])
+        elif op["kind"] == "delete":
+            await self.api.delete_item(op["name"], op["category"], user_id=op["user"])
+        else:
+            await self.api.patch_item(op["name"], op["category"], user_id=op["user"], **op["fields"])
+
+    def _done(self, batch, refresh=False):
+        for op in batch:
+            self._ops.popleft()
+            self._delete_op(op)
+            for key in op_keys(op):
+                self._pending[key] -= 1
+                if not self._pending[key]:
+                    del self._pending[key]
+                if refresh:
+                    self._synced.pop(key, None)
+                    if key in self._lists:
+                        self._refresh_in_background(key)
+
+    # Снимки в SQLite. WAL и synchronous=NORMAL не делают fsync на каждый коммит,
+    # поэтому запись идет прямо из event loop.
+
+    def _open(self):
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS lists "
+            "(user TEXT, category TEXT, items TEXT, synced_at REAL, PRIMARY KEY (user, category))"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS ops (id INTEGER PRIMARY KEY, op TEXT)")
+        for user, category, items, synced_at in self._db.execute("SELECT user, category, items, synced_at FROM lists"):
+            self._lists[(user, category)] = json.loads(items)
+            self._synced[(user, category)] = synced_at
+        last_id = 0
+        for op_id, value in self._db.execute("SELECT id, op FROM ops ORDER BY id"):
+            op = json.loads(value)
+            self._ops.append(op)
+            for key in op_keys(op):
+                self._pending[key] = self._pending.get(key, 0) + 1
+            last_id = op_id
+        self._ids = itertools.count(last_id + 1)
+
+    def _save_list(self, key):
+        if self._db is None:
+            return
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO lists VALUES (?, ?, ?, ?)",
+                (key[0], key[1], json.dumps(self._lists[key], ensure_ascii=False), self._synced.get(key, 0)),
+            )
+
+    def _save_op(self, op):
+        if self._db is None:
+            return
+        with self._db:
+            self._db.execute("INSERT INTO ops VALUES (?, ?)", (op["id"], json.dumps(op, ensure_ascii=False)))
+
+    def _delete_op(self, op):
+        if self._db is None:
+            return
+        with self._db:
+            self._db.execute("DELETE FROM ops WHERE id = ?", (op["id"],))
@@ -0,0 +1,297 @@
+"""Живое обновление сообщений со списками в телеграм-боте.
+
+Сообщение, которое нарисовал show_list, устаревает, как только список
+меняют через веб-интерфейс или Алису, и пользователь листает категории
+туда-обратно, чтобы его обновить. Бекенд хранит каждый список в ключе
+shoppingList:{пользователь}:{категория}, а Redis сообщает о каждой записи в
+такой ключ keyspace-уведомлением, кто бы её ни сделал (уведомления
+включает redis.conf: notify-keyspace-events Kg$). LiveLists подписывается
+на них, помнит, какое сообщение показывает какой список и страницу, и
+через паузу debounce перечитывает изменённый список и правит только его
+сообщения. Серия изменений подряд даёт одно чтение и одну правку;
+сообщение, текст которого не изменился, не трогается.
+
+Пока подписка работает, копия списков бота обновляется по уведомлениям, а
+не по LIST_CACHE_TTL (см. ListReplica.set_push). После разрыва соединения
+с Redis все отслеживаемые списки перечитываются: уведомления за время
+разрыва потеряны.
+
+При нескольких репликах уведомление получает каждая, и каждая правит
+сообщения, которые показала сама. Какой список сейчас в сообщении, хранится
+ещё и в Redis, поэтому сообщение, которое потом перерисовала другая реплика,
+не будет исправлено на старый список.
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+
+import redis
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from common.metrics import LIVE_UPDATES
+from common.resilience import backoff
+
+logger = logging.getLogger(__name__)
+
+# Какие keyspace-уведомления нужны: K — канал ключа, $ — SET, g — DEL/RENAME/EXPIRE
+REQUIRED_EVENTS = "Kg$"
+
+
+def _glob_escape(value):
+    return re.sub(r"([*?\[\]\\])", r"\\\1", value)
+
+
+def has_events(flags, required=REQUIRED_EVENTS):
+    """Включены ли в notify-keyspace-events все нужные классы событий (A — все, кроме K/E/m)."""
+    return all(flag in flags or (flag != "K" and "A" in flags) for flag in required)
+
+
+class View:
+    """Сообщение со страницей списка."""
+
+    __slots__ = ("key", "page", "shown", "at")
+
+    def __init__(self, key, page, shown, at):
+        self.key = key
+        self.page = page
+        # (текст, клавиатура), которые сейчас в сообщении
+        self.shown = shown
+        self.at = at
+
+
+class LiveLists:
+    """Сообщения со списками по ключу (пользователь, категория) и их обновление по событиям Redis."""
+
+    def __init__(self, replica, user, sources, redis_client=None, debounce=1.0, max_messages=1000,
+                 track_ttl=48 * 3600):
+        self.replica = replica
+        # Бот видит список (user, категория) как объединение ключей бекенда всех sources
+        self.user = user
+        self.sources = list(sources) or [user]
+        self.redis = redis_client
+        self.debounce = debounce
+        self.max_messages = max_messages
+        self.track_ttl = track_ttl
+        self.prefix = "live:message"
+        self.bot = None
+        self.render = None
+        self._views = OrderedDict()
+        self._by_key = {}
+        self._updates = {}
+        self._again = set()
+        self._task = None
+
+    @property
+    def enabled(self):
+        return self.redis is not None
+
+    async def start(self, bot, render):
+        """Подписывается на изменения списков; без Redis ничего не делает.
+
+        render(категория, элементы, страница) — корутина, которая возвращает (текст, клавиатура).
+        """
+        self.bot = bot
+        self.render = render
+        if self.enabled:
+            self._task = asyncio.create_task(self._listen())
+
+    async def close(self):
+        tasks = [task for task in (self._task, *self._updates.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.replica.set_push(False)
+
+    # Реестр сообщений
+
+    async def track(self, chat_id, message_id, category, page, shown):
+        """Запоминает, что сообщение показывает страницу page списка category."""
+        if not self.enabled:
+            return
+        message = (chat_id, message_id)
+        key = (self.user, category)
+        self._drop(message)
+        self._views[message] = View(key, page, shown, time.time())
+        self._by_key.setdefault(key, set()).add(message)
+        while len(self._views) > self.max_messages:
+            self._drop(next(iter(self._views)))
+        try:
+            await self.redis.set(self._redis_key(message), json.dumps([category, page]), ex=self.track_ttl)
+        except redis.RedisError as e:
+            logger.warning("Живые списки: не удалось сохранить сообщение в Redis: %s", e)
+
+    async def forget(self, chat_id, message_id):
+        """Сообщение больше не показывает список (например, вернулись в главное меню)."""
+        message = (chat_id, message_id)
+        if not self.enabled or message not in self._views:
+            return
+        self._drop(message)
+        try:
+            await self.redis.delete(self._redis_key(message))
+        except redis.RedisError as e:
+            logger.warning("Живые списки: не удалось удалить сообщение из Redis: %s", e)
+
+    def _drop(self, message):
+        view = self._views.pop(message, None)
+        if view is None:
+            return
+        messages = self._by_key.get(view.key)
+        if messages is not None:
+            messages.discard(message)
+            if not messages:
+                del self._by_key[view.key]
+
+    def _redis_key(self, message):
+        return f"{self.prefix}:{message[0]}:{message[1]}"
+
+    # Уведомления
+
+    def _patterns(self):
+        db = self.redis.connection_pool.connection_kwargs.get("db", 0)
+        return [f"__keyspace@{db}__:shoppingList:{_glob_escape(source)}:*" for source in self.sources]
+
+    async def _notifications_enabled(self):
+        """Включены ли на сервере нужные keyspace-уведомления (их включает redis.conf).
+
+        Бот только читает настройку: CONFIG SET поменял бы её для всех клиентов общего Redis,
+        а после перезапуска без redis.conf она всё равно пропала бы.
+        """
+        try:
+            flags = (await self.redis.config_get("notify-keyspace-events")).get("notify-keyspace-events", "")
+        except redis.ResponseError as e:
+            # CONFIG может быть запрещён: тогда неизвестно, придут ли уведомления
+            logger.warning("Живые списки: не удалось прочитать notify-keyspace-events: %s", e)
+            return False
+        if not has_events(flags):
+            logger.warning(
+                "Живые списки: в Redis не включены keyspace-уведомления (notify-keyspace-events %s, нужно %s), "
+                "списки обновляются по LIST_CACHE_TTL", flags or '""', REQUIRED_EVENTS,
+            )
+            return False
+        return True
+
+    async def _listen(self):
+        attempt = 0
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                notified = await self._notifications_enabled()
+                await pubsub.psubscribe(*self._patterns())
+                # Без уведомлений (или если это неизвестно) копия списков по-прежнему обновляется по TTL
+                self.replica.set_push(notified)
+                if attempt:
+                    logger.info("Живые списки: подписка восстановлена")
+                    # Изменения за время разрыва неизвестны: перечитываем всё, что на экране
+                    for key in list(self._by_key):
+                        self._schedule(key)
+                attempt = 0
+                while True:
+                    # У клиента короткий socket_timeout, поэтому ждём с явным таймаутом, а не через listen()
+                    message = await pubsub.get_message(timeout=5.0)
+                    if message is not None and message["type"] == "pmessage":
+                        self._on_event(message["channel"])
+            except (redis.RedisError, OSError) as e:
+                self.replica.set_push(False)
+                attempt += 1
+                delay = backoff(attempt, 1.0, 60.0)
+                logger.warning("Живые списки: подписка на Redis прервана (%s), повтор через %.1f с", e, delay)
+                await asyncio.sleep(delay)
+            finally:
+                await pubsub.aclose()
+
+    def _on_event(self, channel):
+        # __keyspace@0__:shoppingList:{пользователь}:{категория}; категории без двоеточий
+        key = channel.split(":", 1)[1]
+        source, _, category = key[len("shoppingList:"):].rpartition(":")
+        if source not in self.sources:
+            return
+        key = (self.user, category)
+        if key in self._by_key or self.replica.cached(key):
+            self._schedule(key)
+
+    # Обновление сообщений
+
+    def _schedule(self, key):
+        if key in self._updates:
+            # Обновление уже запланировано; если оно уже идёт, повторим после него
+            self._again.add(key)
+            return
+        self._updates[key] = asyncio.create_task(self._update_later(key))
+
+    async def _update_later(self, key):
+        try:
+            while True:
+                await asyncio.sleep(self.debounce)
+                self._again.discard(key)
+                try:
+                    await self._update(key)
+                except Exception as e:
+                    LIVE_UPDATES.labels("error").inc()
+                    logger.warning("Живые списки: не удалось обновить %s: %s", key[1], e)
+                if key not in self._again:
+                    return
+        finally:
+            del self._updates[key]
+
+    async def _update(self, key):
+        items = await self.replica.refresh(*key)
+        messages = await self._owned(self._by_key.get(key, ()))
+        for message in messages:
+            view = self._views.get(message)
+            if view is None or view.key != key:
+                continue
+            shown = await self.render(key[1], items, view.page)
+            if shown == view.shown:
+                LIVE_UPDATES.labels("unchanged").inc()
+                continue
+            if await self._edit(message, shown):
+                view.shown = shown
+
+    async def _owned(self, messages):
+        """Сообщения, которые по данным Redis всё ещё показывают этот список с этой реплики."""
+        messages = [m for m in messages if time.time() - self._views[m].at < self.track_ttl]
+        if not messages:
+            return []
+        try:
+            values = await self.redis.mget([self._redis_key(m) for m in messages])
+        except redis.RedisError as e:
+            logger.warning("Живые списки: Redis недоступен, правим без проверки: %s", e)
+            return messages
+        owned = []
+        for message, value in zip(messages, values):
+            view = self._views.get(message)
+            if view is not None and value == json.dumps([view.key[1], view.page]):
+                owned.append(message)
+            else:
+                # Сообщение перерисовали (другая реплика) или запись истекла
+                self._drop(message)
+        return owned
+
+    async def _edit(self, message, shown):
+        text, reply_markup = shown
+        try:
+            await self.bot.edit_message_text(text, chat_id=message[0], message_id=message[1], reply_markup=reply_markup)
+        except RetryAfter as e:
+            # Telegram просит подождать: повторим обновление этого списка позже
+            LIVE_UPDATES.labels("error").inc()
+            view = self._views.get(message)
+            if view is not None:
+                asyncio.get_running_loop().call_later(e.retry_after, self._schedule, view.key)
+            return False
+        except BadRequest as e:
+            if "not modified" in str(e):
+                LIVE_UPDATES.labels("unchanged").inc()
+                return True
+            # Сообщение удалено или его больше нельзя редактировать
+            LIVE_UPDATES.labels("gone").inc()
+            await self.forget(*message)
+            return False
+        except TelegramError as e:
+            LIVE_UPDATES.labels("error").inc()
+            logger.warning("Живые списки: не удалось отредактировать сообщение: %s", e)
+            return False
+        LIVE_UPDATES.labels("edited").inc()
+        return True
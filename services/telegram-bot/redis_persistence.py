@@ -0,0 +1,100 @@
+"""Хранение состояния диалога бота в Redis.
+
+Хендлеры держат шаги диалога (awaiting_item, category, item_name, items) в
+context.user_data. Штатно python-telegram-bot хранит его в памяти процесса:
+перезапуск теряет недоделанное добавление, а второй экземпляр бота не видит
+состояние первого. RedisPersistence перечитывает user_data из Redis перед
+каждым апдейтом и записывает обратно сразу после него, поэтому апдейты
+одного пользователя могут обрабатывать разные реплики.
+"""
+import json
+import logging
+
+import redis
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+
+class RedisPersistence(BasePersistence):
+    """Persistence для user_data в Redis: JSON на пользователя с TTL."""
+
+    def __init__(self, redis_client, prefix="telegram:user_data", ttl=24 * 3600, update_interval=60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, user_id):
+        return f"{self.prefix}:{user_id}"
+
+    async def get_user_data(self):
+        # Состояние загружается лениво в refresh_user_data, а не целиком при старте
+        return {}
+
+    async def refresh_user_data(self, user_id, user_data):
+        """Подменяет user_data свежим состоянием из Redis перед обработкой апдейта."""
+        try:
+            value = await self.redis.get(self._key(user_id))
+        except redis.RedisError as e:
+            logger.warning("Состояние диалога: Redis недоступен, используем локальное: %s", e)
+            return
+        user_data.clear()
+        if value:
+            user_data.update(json.loads(value))
+
+    async def update_user_data(self, user_id, data):
+        try:
+            if data:
+                await self.redis.set(self._key(user_id), json.dumps(data, ensure_ascii=False), ex=self.ttl)
+            else:
+                await self.redis.delete(self._key(user_id))
+        except redis.RedisError as e:
+            logger.warning("Состояние диалога: не удалось записать в Redis: %s", e)
+
+    async def drop_user_data(self, user_id):
+        try:
+            await self.redis.delete(self._key(user_id))
+        except redis.RedisError as e:
+            logger.warning("Состояние диалога: не удалось удалить из Redis: %s", e)
+
+    async def flush(self):
+        await self.redis.aclose()
+
+    # chat_data, bot_data, callback_data и ConversationHandler бот не использует
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
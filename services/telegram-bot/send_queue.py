@@ -0,0 +1,184 @@
+"""Очередь исходящих запросов бота к Telegram с учётом лимитов.
+
+Хендлеры вызывают edit_text/reply_text напрямую, и при всплеске нажатий бот
+упирается в лимиты Telegram: около 30 сообщений в секунду на бота, около
+одного в секунду в личный чат и 20 в минуту в группу. Ответ 429 (RetryAfter)
+ещё и уводил хендлеры в запасную ветку с новым сообщением, то есть удваивал
+трафик как раз во время ограничения.
+
+SendQueue подключается к Application как rate limiter, поэтому через неё
+проходят все запросы к Bot API. Каждый запрос в чат ждёт токен в ведре
+чата и в общем ведре бота (token bucket: ровный темп с небольшим запасом
+на всплеск). На RetryAfter очередь останавливает чат (или весь бот, если
+чата в запросе нет) на указанное время и повторяет запрос сама. Правки
+одного и того же сообщения склеиваются: если, пока правка ждёт очереди,
+пришла более новая, старая не отправляется — уходит только последнее
+состояние.
+
+answerCallbackQuery и запросы без чата идут без очереди: это не сообщения,
+и от них зависит, как быстро на кнопке пропадут часики.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from common.metrics import TELEGRAM_QUEUE_WAIT, TELEGRAM_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Правки, которые склеиваются по сообщению
+EDIT_ENDPOINTS = {"editMessageText", "editMessageReplyMarkup"}
+
+
+def is_group_chat(chat_id):
+    """Группа или канал: отрицательный id или @username. У них лимит строже, чем у личных чатов."""
+    try:
+        return int(chat_id) < 0
+    except (TypeError, ValueError):
+        return True
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше burst про запас.
+
+    Ожидающие получают токены по очереди (FIFO), потому что ждут под замком.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds):
+        """Не выдавать токены seconds секунд (Telegram ответил RetryAfter)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    @property
+    def idle(self):
+        """Ведро полное и без паузы — его можно выбросить и создать заново."""
+        now = time.monotonic()
+        return not self._lock.locked() and now >= self._paused_until and \
+            self._tokens + (now - self._updated) * self.rate >= self.burst
+
+    async def acquire(self, skip=None):
+        """Ждёт токен. Если skip() стал истинным, пока запрос ждал, токен не тратится и возвращается False."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if skip is not None and skip():
+                    return False
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class SendQueue(BaseRateLimiter):
+    """Rate limiter для Application: ведра на чат и на бота, повтор по RetryAfter, склейка правок."""
+
+    def __init__(self, global_rate=30.0, chat_rate=1.0, chat_burst=3, group_per_minute=20, max_retries=3,
+                 max_chats=10000):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_per_minute = group_per_minute
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._global = None
+        self._chats = OrderedDict()
+        # Номер последней правки по (метод, чат, сообщение)
+        self._edits = {}
+
+    async def initialize(self):
+        # Ведра создаются в event loop приложения: asyncio.Lock привязывается к нему
+        self._global = TokenBucket(self.global_rate, self.global_rate)
+
+    async def shutdown(self):
+        self._chats.clear()
+        self._edits.clear()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is not None:
+            self._chats.move_to_end(chat_id)
+            return bucket
+        if len(self._chats) >= self.max_chats:
+            # Полные ведра без ожидающих ничего не помнят, их можно выбросить (начиная с давно не нужных)
+            idle = [key for key, old in self._chats.items() if old.idle]
+            for key in idle[:len(self._chats) - self.max_chats + 1]:
+                del self._chats[key]
+        if is_group_chat(chat_id):
+            bucket = TokenBucket(self.group_per_minute / 60.0, self.chat_burst)
+        else:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+        self._chats[chat_id] = bucket
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None or endpoint == "answerCallbackQuery":
+            return await self._call_with_retry(callback, args, kwargs, endpoint, self._global, None)
+
+        edit = None
+        if endpoint in EDIT_ENDPOINTS and data.get("message_id") is not None:
+            edit = (endpoint, chat_id, data["message_id"])
+            generation = self._edits.get(edit, 0) + 1
+            self._edits[edit] = generation
+
+        def superseded():
+            return edit is not None and self._edits.get(edit) != generation
+
+        try:
+            started = time.monotonic()
+            bucket = self._chat_bucket(chat_id)
+            if not await bucket.acquire(superseded) or not await self._global.acquire(superseded):
+                # Пока правка ждала, пришла более новая правка того же сообщения
+                TELEGRAM_REQUESTS.labels(endpoint, "coalesced").inc()
+                return True
+            TELEGRAM_QUEUE_WAIT.observe(time.monotonic() - started)
+            return await self._call_with_retry(callback, args, kwargs, endpoint, bucket, superseded)
+        finally:
+            if edit is not None and self._edits.get(edit) == generation:
+                del self._edits[edit]
+
+    async def _call_with_retry(self, callback, args, kwargs, endpoint, bucket, superseded):
+        attempt = 0
+        while True:
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                TELEGRAM_REQUESTS.labels(endpoint, "retry_after").inc()
+                attempt += 1
+                retry_after = float(e.retry_after)
+                logger.warning("Telegram ограничил запросы (%s): пауза %.0f с, попытка %d", endpoint, retry_after, attempt)
+                bucket.pause(retry_after)
+                if attempt > self.max_retries:
+                    raise
+                if bucket is self._global:
+                    # Запрос без чата не ждёт токенов, поэтому просто выжидает паузу
+                    await asyncio.sleep(retry_after)
+                elif not await bucket.acquire(superseded) or not await self._global.acquire(superseded):
+                    TELEGRAM_REQUESTS.labels(endpoint, "coalesced").inc()
+                    return True
+                continue
+            except Exception:
+                TELEGRAM_REQUESTS.labels(endpoint, "error").inc()
+                raise
+            TELEGRAM_REQUESTS.labels(endpoint, "ok").inc()
+            return result
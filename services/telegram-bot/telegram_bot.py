@@ -1,18 +1,35 @@
 import os
 import json
-import requests
+import asyncio
+import time
+import httpx
 from dotenv import load_dotenv
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters
-import logging
-import g4f  # Импортируем g4f для предложения блюд
-
-# Настройка логирования
-logging.basicConfig(
-    filename='bot.log',
-    level=logging.ERROR,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+from telegram.error import BadRequest
+from telegram.ext import (
+    Application, CommandHandler, CallbackQueryHandler, MessageHandler, PersistenceInput, PicklePersistence,
+    TypeHandler, filters,
 )
+import logging
+from api_client import APIClient
+from callback_tokens import CallbackTokens
+from list_replica import ListReplica
+from live_lists import LiveLists
+from redis_persistence import RedisPersistence
+from send_queue import SendQueue
+from update_processor import PerUserUpdateProcessor
+from common import metrics
+from common.health import Health
+from common.internal_api import APIError
+from common.items import split_items
+from common.llm import LLMExecutor, build_scheduler  # Пул для запросов к g4f (предложение блюд)
+from common.recipe_cache import RecipeCache, recipe_prompt
+from common.redis_client import get_async_redis, get_redis
+from common.resilience import CircuitBreaker
+from common.tracing import setup_logging, stage, traced
+
+# Логи в stdout одной JSON-строкой, уровень задаётся LOG_LEVEL
+setup_logging("telegram-bot")
 
 # Загружаем переменные из .env (только для локальной разработки)
 # В Kubernetes/Docker переменные передаются через Secrets/ConfigMaps
@@ -24,6 +41,113 @@ if not os.getenv("KUBERNETES_SERVICE_HOST"):
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 API_URL = os.getenv("API_URL", "http://geshtalt:8080/internal/api")
 SERVICE_USER_ID = os.getenv("SERVICE_USER_ID", "")
+# Параметры пула соединений к внутреннему API
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "5"))
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "20"))
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "10"))
+# Повторы GET при сбоях, хеджирующий GET после паузы (сек, 0 — выключен) и автомат отключения бекенда
+API_RETRIES = int(os.getenv("API_RETRIES", "2"))
+API_HEDGE_AFTER = float(os.getenv("API_HEDGE_AFTER", "0.3"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "10"))
+
+# Дедлайн и размер пула для запросов к GPT
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "2"))
+# Показывать ответ GPT по мере генерации и как часто править сообщение с ним, сек
+LLM_STREAM = os.getenv("LLM_STREAM", "true").lower() in ("1", "true", "yes")
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1"))
+# Кэш предложений блюд по содержимому холодильника
+RECIPE_CACHE_TTL = int(os.getenv("RECIPE_CACHE_TTL", str(6 * 3600)))
+RECIPE_CACHE_MAX = int(os.getenv("RECIPE_CACHE_MAX", "256"))
+# Через сколько секунд локальная копия списка обновляется из бекенда (в фоне)
+LIST_CACHE_TTL = float(os.getenv("LIST_CACHE_TTL", "15"))
+# Живое обновление сообщений со списками по событиям Redis: пауза склейки изменений, сек,
+# и через сколько секунд копия списка перечитывается, пока события приходят (страховка от потерянных)
+LIVE_UPDATES = os.getenv("LIVE_UPDATES", "true").lower() in ("1", "true", "yes")
+LIVE_UPDATE_DEBOUNCE = float(os.getenv("LIVE_UPDATE_DEBOUNCE", "1"))
+LIVE_LIST_TTL = float(os.getenv("LIVE_LIST_TTL", "300"))
+LIVE_MAX_MESSAGES = int(os.getenv("LIVE_MAX_MESSAGES", "1000"))
+# Пользователи бекенда, чьи списки бот показывает вместе (как SERVICE_USER_IDS в бекенде)
+SERVICE_USER_IDS = [uid.strip() for uid in os.getenv("SERVICE_USER_IDS", "").split(",") if uid.strip()]
+# Файл SQLite для локальной копии списков и очереди записи (пусто — только память)
+BOT_REPLICA_PATH = os.getenv("BOT_REPLICA_PATH", "")
+# Максимальная пауза между повторами записи в недоступный бекенд, сек
+SYNC_RETRY_MAX = float(os.getenv("SYNC_RETRY_MAX", "30"))
+# Окно склейки добавлений перед отправкой в бекенд, сек
+WRITE_BATCH_WINDOW = float(os.getenv("WRITE_BATCH_WINDOW", "0.2"))
+# Сколько элементов показывается на одной странице списка
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "20"))
+# Таблица токенов кнопок элементов: размер в памяти и срок жизни в Redis
+CALLBACK_TOKENS_MAX = int(os.getenv("CALLBACK_TOKENS_MAX", "4096"))
+CALLBACK_TOKENS_TTL = int(os.getenv("CALLBACK_TOKENS_TTL", str(7 * 24 * 3600)))
+# Состояние диалога (user_data): сколько живет в Redis и файл для запуска без Redis
+BOT_STATE_TTL = int(os.getenv("BOT_STATE_TTL", str(24 * 3600)))
+BOT_STATE_FILE = os.getenv("BOT_STATE_FILE", "")
+
+# Режим получения апдейтов: polling (по умолчанию) или webhook за nginx.
+# Несколько реплик бота возможны только в режиме webhook.
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Внешний адрес, например https://домен/telegram
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8081"))
+WEBHOOK_PATH = "telegram"
+# Секрет, который Telegram передает в X-Telegram-Bot-Api-Secret-Token (A-Z, a-z, 0-9, _ и -)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Сколько апдейтов разных пользователей обрабатывается одновременно
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "16"))
+# Порт метрик Prometheus (/metrics) и проб Kubernetes (/healthz, /readyz); 0 отключает
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8082"))
+# Загружать g4f в фоне сразу после старта, а не при первом запросе рецепта
+LLM_WARMUP = os.getenv("LLM_WARMUP", "true").lower() in ("1", "true", "yes")
+# Через сколько секунд без оборота event loop бот считается зависшим (/healthz отвечает 503)
+HEALTH_STALL_AFTER = float(os.getenv("HEALTH_STALL_AFTER", "30"))
+
+# Лимиты исходящих запросов к Telegram: сообщений в секунду на бота, в секунду на личный чат
+# (с запасом на короткий всплеск), в минуту на группу; сколько раз повторять запрос после RetryAfter
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", "30"))
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))
+TG_CHAT_BURST = int(os.getenv("TG_CHAT_BURST", "3"))
+TG_GROUP_PER_MINUTE = int(os.getenv("TG_GROUP_PER_MINUTE", "20"))
+TG_MAX_RETRIES = int(os.getenv("TG_MAX_RETRIES", "3"))
+
+# Бот обрабатывает только сообщения (команды и текст) и нажатия кнопок
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+# Общий асинхронный клиент для всех хендлеров
+api = APIClient(
+    API_URL,
+    user_id=SERVICE_USER_ID,
+    timeout=API_TIMEOUT,
+    max_connections=API_MAX_CONNECTIONS,
+    max_concurrency=API_MAX_CONCURRENCY,
+    retries=API_RETRIES,
+    hedge_after=API_HEDGE_AFTER,
+    breaker=CircuitBreaker("backend", failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET),
+)
+# Локальная копия списков: чтение без ожидания бекенда, запись через фоновую очередь
+lists = ListReplica(
+    api, path=BOT_REPLICA_PATH, ttl=LIST_CACHE_TTL, retry_max=SYNC_RETRY_MAX, window=WRITE_BATCH_WINDOW,
+    push_ttl=LIVE_LIST_TTL,
+)
+# Провайдеры g4f для гонки (через запятую, например "Bing,You"); пусто — g4f выбирает сам.
+# Статистика провайдеров общая с другим сервисом через Redis, без Redis — в файле LLM_PROVIDER_STATE
+LLM_PROVIDERS = os.getenv("LLM_PROVIDERS", "")
+LLM_RACE = int(os.getenv("LLM_RACE", "2"))
+LLM_PROVIDER_STATE = os.getenv("LLM_PROVIDER_STATE", "")
+llm = LLMExecutor(
+    model="gpt-4", max_workers=LLM_WORKERS, timeout=LLM_TIMEOUT,
+    scheduler=build_scheduler(LLM_PROVIDERS, top_k=LLM_RACE, redis_client=get_redis(), state_path=LLM_PROVIDER_STATE),
+)
+recipe_cache = RecipeCache(get_redis(), ttl=RECIPE_CACHE_TTL, max_entries=RECIPE_CACHE_MAX)
+callback_tokens = CallbackTokens(get_redis(), max_entries=CALLBACK_TOKENS_MAX, ttl=CALLBACK_TOKENS_TTL)
+# Какое сообщение показывает какой список; без Redis (или при LIVE_UPDATES=false) выключено
+live = LiveLists(
+    lists, SERVICE_USER_ID or "service", SERVICE_USER_IDS,
+    redis_client=get_async_redis() if LIVE_UPDATES else None,
+    debounce=LIVE_UPDATE_DEBOUNCE, max_messages=LIVE_MAX_MESSAGES,
+)
+health = Health(stall_after=HEALTH_STALL_AFTER)
+_heartbeat = None
 
 # Категории для списков
 LISTS = {
@@ -70,32 +194,53 @@ def get_list_keyboard(current_category):
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def get_item_actions_keyboard(item_name, category):
-    """Возвращает клавиатуру для действий с элементом."""
+def get_item_actions_keyboard(token, category):
+    """Возвращает клавиатуру для действий с элементом по его токену."""
     keyboard = [
-        [InlineKeyboardButton("Удалить", callback_data=f"item_action:delete:{item_name}:{category}")],
-        [InlineKeyboardButton("Сменить категорию", callback_data=f"item_action:change_cat:{item_name}:{category}")],
-        [InlineKeyboardButton("Сменить приоритет", callback_data=f"item_action:change_pri:{item_name}:{category}")],
+        [InlineKeyboardButton("Удалить", callback_data=f"item_action:delete:{token}")],
+        [InlineKeyboardButton("Сменить категорию", callback_data=f"item_action:change_cat:{token}")],
+        [InlineKeyboardButton("Сменить приоритет", callback_data=f"item_action:change_pri:{token}")],
         [InlineKeyboardButton("Назад", callback_data=f"list:{category}")]
     ]
     return InlineKeyboardMarkup(keyboard)
 
+async def resolve_callback_token(token):
+    """Возвращает (user, category, name) по токену кнопки или None, если токен устарел."""
+    entry = callback_tokens.resolve(token)
+    if entry is None and callback_tokens.redis is not None:
+        # После перезапуска бота токены старых сообщений есть только в Redis
+        entry = await asyncio.to_thread(callback_tokens.fetch, token)
+    return entry
+
+async def warm_lists():
+    """Прогревает кэш всех категорий одним запросом, чтобы листание шло из памяти."""
+    try:
+        await lists.warm(SERVICE_USER_ID, CATEGORIES)
+    except Exception as e:
+        logging.error(f"Не удалось прогреть кэш списков: {e}")
+
 async def start(update: Update, context):
     """Обработчик команды /start. Показывает основную клавиатуру."""
+    # Прогрев идет в фоне и не задерживает ответ
+    context.application.create_task(warm_lists())
     reply_markup = get_main_keyboard()
     if update.message:
         await update.message.reply_text("Выберите категорию:", reply_markup=reply_markup)
     elif update.callback_query:
+        message = update.callback_query.message
+        await live.forget(message.chat_id, message.message_id)
         try:
-        await update.callback_query.message.edit_text("Выберите категорию:", reply_markup=reply_markup)
-        except Exception:
-            # Если не удалось отредактировать, отправляем новое сообщение
-            await update.callback_query.message.reply_text("Выберите категорию:", reply_markup=reply_markup)
+            await message.edit_text("Выберите категорию:", reply_markup=reply_markup)
+        except BadRequest as e:
+            if "not modified" in str(e):
+                return
+            # Сообщение нельзя отредактировать — отправляем новое. RetryAfter и сетевые ошибки
+            # сюда не попадают: новое сообщение во время ограничения только удвоило бы трафик
+            await message.reply_text("Выберите категорию:", reply_markup=reply_markup)
 
 async def add_start(update: Update, context):
     """Обработчик кнопки Добавить. Запрашивает текст элемента."""
     query = update.callback_query
-    await query.answer()
     data = query.data
     category = data.split(":")[1] if data.startswith("add:") else None
     context.user_data["awaiting_item"] = True
@@ -104,13 +249,24 @@ async def add_start(update: Update, context):
         f"Введите название элемента для добавления в {LISTS[category]}:"
     )
 
+def format_items(items):
+    """'молоко' для одного элемента, 'молоко', 'хлеб' и 'яйца' для нескольких."""
+    quoted = [f"'{name}'" for name in items]
+    if len(quoted) == 1:
+        return quoted[0]
+    return f"{', '.join(quoted[:-1])} и {quoted[-1]}"
+
 async def handle_item_text(update: Update, context):
     """Обработчик ввода текста элемента."""
     if not context.user_data.get("awaiting_item"):
         return
 
-    item_name = update.message.text
-    context.user_data["item_name"] = item_name
+    # Сообщение может содержать несколько элементов: по строкам, через запятую или "и"
+    items = split_items(update.message.text)
+    if not items:
+        await update.message.reply_text("Название элемента не может быть пустым.")
+        return
+    context.user_data["items"] = items
     context.user_data["awaiting_item"] = False
 
     if context.user_data.get("category"):
@@ -122,103 +278,91 @@ async def handle_item_text(update: Update, context):
             for key, name in LISTS.items()
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text(f"Куда добавить '{item_name}'?", reply_markup=reply_markup)
+        await update.message.reply_text(f"Куда добавить {format_items(items)}?", reply_markup=reply_markup)
 
 async def add_to_category(update: Update, context):
     """Обработчик выбора категории для добавления."""
     category = context.user_data.get("category")
     if not category:
         query = update.callback_query
-        await query.answer()
         data = query.data
         if not data.startswith("add_to:"):
             return
         category = data.split(":")[1]
 
+    # Категорию могли выбрать кнопкой, тогда update.message пустой
+    message = update.message or update.callback_query.message
+
     if category not in LISTS:
-        await update.message.reply_text(f"Неизвестная категория: {category}")
+        await message.reply_text(f"Неизвестная категория: {category}")
         return
 
-    item_name = context.user_data.get("item_name")
+    items = context.user_data.get("items") or []
     context.user_data["awaiting_category"] = False
-    context.user_data.pop("item_name", None)
+    context.user_data.pop("items", None)
     context.user_data.pop("category", None)
+    if not items:
+        return
 
     try:
-        headers = {"Content-Type": "application/json"}
-        if SERVICE_USER_ID:
-            headers["X-User-ID"] = SERVICE_USER_ID
-
-        data = {
-            "name": item_name,
-            "category": category,
-            "bought": False,
-            "priority": 2
-        }
-
-        response = requests.post(f"{API_URL}/add", headers=headers, json=data)
-        if response.status_code != 201:
-            error_msg = f"Ошибка добавления: {response.status_code} - {response.text}"
-            logging.error(error_msg)
-            await update.message.reply_text(error_msg)
-            return
+        # Элементы сразу попадают в локальную копию, в бекенд их отправит фоновая синхронизация
+        lists.add_items(SERVICE_USER_ID, category, items)
 
         reply_markup = get_list_keyboard(category)
-        await update.message.reply_text(f"Добавлено '{item_name}' в {LISTS[category]}", reply_markup=reply_markup)
-    except requests.RequestException as e:
-        error_msg = f"Ошибка подключения к API: {e}"
-        logging.error(error_msg)
-        await update.message.reply_text(error_msg)
+        await message.reply_text(f"Добавлено {format_items(items)} в {LISTS[category]}", reply_markup=reply_markup)
     except Exception as e:
         error_msg = f"Произошла ошибка: {str(e)}"
         logging.error(error_msg)
-        await update.message.reply_text(error_msg)
+        await message.reply_text(error_msg)
 
 async def show_item_actions(update: Update, context):
     """Показывает действия для выбранного элемента."""
     query = update.callback_query
-    await query.answer()
-
     data = query.data
     if not data.startswith("item:"):
         return
 
-    item_name, category = data.split(":")[1:3]
+    token = data.split(":", 1)[1]
+    entry = await resolve_callback_token(token)
+    if entry is None:
+        await query.message.reply_text("Кнопка устарела, откройте список заново.", reply_markup=get_main_keyboard())
+        return
+    _, category, item_name = entry
     context.user_data["item_name"] = item_name
     context.user_data["category"] = category
 
-    reply_markup = get_item_actions_keyboard(item_name, category)
+    reply_markup = get_item_actions_keyboard(token, category)
     await query.message.reply_text(f"Что сделать с '{item_name}' в {LISTS[category]}?", reply_markup=reply_markup)
 
 async def handle_item_action(update: Update, context):
     """Обработчик действий с элементом."""
     query = update.callback_query
-    await query.answer()
-
     data = query.data
     if not data.startswith("item_action:"):
         return
 
-    action, item_name, category = data.split(":")[1:4]
+    _, action, token = data.split(":", 2)
+    entry = await resolve_callback_token(token)
+    if entry is None:
+        await query.message.reply_text("Кнопка устарела, откройте список заново.", reply_markup=get_main_keyboard())
+        return
+    _, category, item_name = entry
     context.user_data["item_name"] = item_name
     context.user_data["category"] = category
 
     if action == "delete":
         try:
-            headers = {}
-            if SERVICE_USER_ID:
-                headers["X-User-ID"] = SERVICE_USER_ID
-
-            response = requests.delete(f"{API_URL}/delete/{item_name}?category={category}", headers=headers)
-            if response.status_code != 200:
-                error_msg = f"Ошибка удаления: {response.status_code} - {response.text}"
-                logging.error(error_msg)
-                await query.message.reply_text(error_msg)
+            if not await lists.delete_item(SERVICE_USER_ID, category, item_name):
+                await query.message.reply_text(f"Элемент '{item_name}' не найден в {LISTS[category]}")
                 return
 
             reply_markup = get_list_keyboard(category)
             await query.message.reply_text(f"Удалено '{item_name}' из {LISTS[category]}", reply_markup=reply_markup)
-        except requests.RequestException as e:
+        except APIError as e:
+            error_msg = f"Ошибка API: {e}"
+            logging.error(error_msg)
+            await query.message.reply_text(error_msg)
+        except httpx.HTTPError as e:
             error_msg = f"Ошибка подключения к API: {e}"
             logging.error(error_msg)
             await query.message.reply_text(error_msg)
@@ -247,8 +391,6 @@ async def handle_item_action(update: Update, context):
 async def change_category_to(update: Update, context):
     """Обработчик выбора новой категории."""
     query = update.callback_query
-    await query.answer()
-
     if not context.user_data.get("awaiting_new_category"):
         return
 
@@ -268,46 +410,24 @@ async def change_category_to(update: Update, context):
     context.user_data.pop("category", None)
 
     try:
-        headers = {"Content-Type": "application/json"}
-        if SERVICE_USER_ID:
-            headers["X-User-ID"] = SERVICE_USER_ID
-
-        response = requests.get(f"{API_URL}/list?category={old_category}", headers=headers)
-        if response.status_code != 200:
-            error_msg = f"Ошибка получения данных: {response.status_code} - {response.text}"
-            logging.error(error_msg)
-            await query.message.reply_text(error_msg)
-            return
-
         try:
-        items = response.json()
-        except json.JSONDecodeError as e:
-            error_msg = f"Ошибка парсинга JSON: {e}. Ответ: {response.text[:200]}"
+            # Бекенд не переносит элемент в категорию, где уже есть такое название (409)
+            if new_category != old_category and await lists.find(SERVICE_USER_ID, new_category, item_name):
+                await query.message.reply_text(f"Элемент '{item_name}' уже есть в {LISTS[new_category]}")
+                return
+            moved = await lists.update_item(SERVICE_USER_ID, old_category, item_name, category=new_category)
+        except APIError as e:
+            error_msg = f"Ошибка смены категории: {e}"
             logging.error(error_msg)
-            await query.message.reply_text(f"Ошибка подключения к API: {e}")
+            await query.message.reply_text(error_msg)
             return
-        item = next((i for i in items if i["name"] == item_name), None)
-        if not item:
+        if not moved:
             await query.message.reply_text(f"Элемент '{item_name}' не найден в {LISTS[old_category]}")
             return
 
-        data = {
-            "name": item_name,
-            "category": new_category,
-            "bought": item["bought"],
-            "priority": item["priority"]
-        }
-
-        response = requests.put(f"{API_URL}/edit/{item_name}?oldCategory={old_category}", headers=headers, json=data)
-        if response.status_code != 200:
-            error_msg = f"Ошибка смены категории: {response.status_code} - {response.text}"
-            logging.error(error_msg)
-            await query.message.reply_text(error_msg)
-            return
-
         reply_markup = get_list_keyboard(new_category)
         await query.message.reply_text(f"Элемент '{item_name}' перенесен из {LISTS[old_category]} в {LISTS[new_category]}", reply_markup=reply_markup)
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         error_msg = f"Ошибка подключения к API: {e}"
         logging.error(error_msg)
         await query.message.reply_text(error_msg)
@@ -319,8 +439,6 @@ async def change_category_to(update: Update, context):
 async def change_priority_to(update: Update, context):
     """Обработчик выбора нового приоритета."""
     query = update.callback_query
-    await query.answer()
-
     if not context.user_data.get("awaiting_priority"):
         return
 
@@ -336,46 +454,20 @@ async def change_priority_to(update: Update, context):
     context.user_data.pop("category", None)
 
     try:
-        headers = {"Content-Type": "application/json"}
-        if SERVICE_USER_ID:
-            headers["X-User-ID"] = SERVICE_USER_ID
-
-        response = requests.get(f"{API_URL}/list?category={category}", headers=headers)
-        if response.status_code != 200:
-            error_msg = f"Ошибка получения данных: {response.status_code} - {response.text}"
-            logging.error(error_msg)
-            await query.message.reply_text(error_msg)
-            return
-
         try:
-        items = response.json()
-        except json.JSONDecodeError as e:
-            error_msg = f"Ошибка парсинга JSON: {e}. Ответ: {response.text[:200]}"
+            updated = await lists.update_item(SERVICE_USER_ID, category, item_name, priority=new_priority)
+        except APIError as e:
+            error_msg = f"Ошибка смены приоритета: {e}"
             logging.error(error_msg)
-            await query.message.reply_text(f"Ошибка подключения к API: {e}")
+            await query.message.reply_text(error_msg)
             return
-        item = next((i for i in items if i["name"] == item_name), None)
-        if not item:
+        if not updated:
             await query.message.reply_text(f"Элемент '{item_name}' не найден в {LISTS[category]}")
             return
 
-        data = {
-            "name": item_name,
-            "category": category,
-            "bought": item["bought"],
-            "priority": new_priority
-        }
-
-        response = requests.put(f"{API_URL}/edit/{item_name}?oldCategory={category}", headers=headers, json=data)
-        if response.status_code != 200:
-            error_msg = f"Ошибка смены приоритета: {response.status_code} - {response.text}"
-            logging.error(error_msg)
-            await query.message.reply_text(error_msg)
-            return
-
         reply_markup = get_list_keyboard(category)
         await query.message.reply_text(f"Приоритет для '{item_name}' в {LISTS[category]} изменен на {PRIORITY_EMOJI[new_priority]}", reply_markup=reply_markup)
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         error_msg = f"Ошибка подключения к API: {e}"
         logging.error(error_msg)
         await query.message.reply_text(error_msg)
@@ -384,48 +476,84 @@ async def change_priority_to(update: Update, context):
         logging.error(error_msg)
         await query.message.reply_text(error_msg)
 
+# Максимальная длина текста сообщения в Telegram
+MESSAGE_LIMIT = 4096
+LLM_BUSY_TEXT = "GPT сейчас долго отвечает, попробуйте ещё раз через минуту."
+
+async def stream_recipe(message, prompt, items_in_fridge):
+    """Отвечает на сообщение текстом GPT по мере генерации.
+
+    Сначала сразу отправляется заглушка, первая часть ответа заменяет её, как
+    только придёт, а дальше то же сообщение дописывается не чаще раза в
+    STREAM_EDIT_INTERVAL. Последняя правка добавляет клавиатуру главного меню.
+    """
+    reply = await message.reply_text("Думаю, что можно приготовить…")
+    text = ""
+    shown = ""
+    last_edit = 0.0
+    try:
+        with stage("llm"):
+            async for chunk in llm.astream(prompt, on_result=lambda result: recipe_cache.set(items_in_fridge, result)):
+                text += chunk
+                if time.monotonic() - last_edit < STREAM_EDIT_INTERVAL or text.strip() == shown:
+                    continue
+                shown = text.strip()
+                last_edit = time.monotonic()
+                try:
+                    await reply.edit_text(f"{shown[:MESSAGE_LIMIT - 2]} …")
+                except BadRequest as e:
+                    logging.debug(f"Не удалось дописать ответ GPT: {e}")
+    except Exception as e:
+        logging.error(f"Ошибка при обращении к GPT: {e}")
+        if not text.strip():
+            text = "Извините, произошла ошибка при запросе рецепта."
+    await reply.edit_text((text.strip() or LLM_BUSY_TEXT)[:MESSAGE_LIMIT], reply_markup=get_main_keyboard())
+
 async def suggest_dishes(update: Update, context):
     """Обработчик кнопки 'Что приготовить'. Предлагает блюда на основе содержимого холодильника."""
     query = update.callback_query
-    await query.answer()
-
     try:
-        headers = {}
-        if SERVICE_USER_ID:
-            headers["X-User-ID"] = SERVICE_USER_ID
-
-        response = requests.get(f"{API_URL}/list?category=холодос", headers=headers)
-        if response.status_code != 200:
-            error_msg = f"Ошибка получения данных: {response.status_code} - {response.text}"
+        try:
+            items = await lists.get(SERVICE_USER_ID, "холодос")
+        except APIError as e:
+            error_msg = f"Ошибка получения данных: {e}"
             logging.error(error_msg)
             await query.message.reply_text(error_msg)
             return
-
-        try:
-        items = response.json()
         except json.JSONDecodeError as e:
-            error_msg = f"Ошибка парсинга JSON: {e}. Ответ: {response.text[:200]}"
+            error_msg = f"Ошибка парсинга JSON: {e}"
             logging.error(error_msg)
             await query.message.reply_text(f"Ошибка подключения к API: {e}")
             return
-        items_in_fridge = [item['name'] for item in items if item.get('category', '').lower() == 'холодос' and item['name'].strip()]
+        # Список уже только из холодильника: копия хранит списки по категориям, как и бекенд
+        items_in_fridge = [item['name'] for item in items if item['name'].strip()]
         
         if not items_in_fridge:
             reply_markup = get_main_keyboard()
             await query.message.reply_text("В холодильнике пусто, нечего приготовить.", reply_markup=reply_markup)
             return
 
-        prompt = f"Что можно приготовить из таких продуктов: {', '.join(items_in_fridge)}? Назови только 10 названий блюд. Желательно из русской, татарской, грузинской, итальянской, вьетнамской, узбекской, японской кухонь. Пример: лагман, манты, хинкали, мясо по-французски, очпочмак, шаурма, бургер, пицца, борщ, солянка, курица во фритюре, на мангале, на пару. Не повторяй, что я сказал, из этого списка - только как пример,от силы 1 повторенье."
+        prompt = recipe_prompt(items_in_fridge)
         try:
-            response_from_gpt = g4f.ChatCompletion.create(model='gpt-4', messages=[{"role": "user", "content": prompt}])
-            response_text = f"{response_from_gpt}"
+            # Redis-клиент синхронный, поэтому обращаемся к кэшу из потока
+            response_text = await asyncio.to_thread(recipe_cache.get, items_in_fridge)
+            if response_text is None and LLM_STREAM:
+                await stream_recipe(query.message, prompt, items_in_fridge)
+                return
+            if response_text is None:
+                with stage("llm"):
+                    response_text = await llm.acomplete(
+                        prompt, on_result=lambda text: recipe_cache.set(items_in_fridge, text)
+                    )
+            if response_text is None:
+                response_text = LLM_BUSY_TEXT
             reply_markup = get_main_keyboard()  # Возвращаемся в главное меню
             await query.message.reply_text(response_text, reply_markup=reply_markup)
         except Exception as e:
             error_msg = f"Ошибка при обращении к GPT: {e}"
             logging.error(error_msg)
             await query.message.reply_text("Извините, произошла ошибка при запросе рецепта.", reply_markup=get_main_keyboard())
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         error_msg = f"Ошибка подключения к API: {e}"
         logging.error(error_msg)
         await query.message.reply_text(error_msg, reply_markup=get_main_keyboard())
@@ -437,9 +565,13 @@ async def suggest_dishes(update: Update, context):
 async def button_callback(update: Update, context):
     """Обработчик нажатий на кнопки."""
     query = update.callback_query
+    # На нажатие отвечаем один раз здесь; хендлеры ниже query.answer() не вызывают
     await query.answer()
 
     data = query.data
+    if data == "noop":
+        # Кнопка с номером страницы ничего не делает
+        return
     if data == "restart":
         await start(update, context)
         return
@@ -469,79 +601,105 @@ async def button_callback(update: Update, context):
         await start(update, context)
         return
     if data.startswith("list:"):
-        list_type = data.split(":")[1]
-        await show_list(update, context, list_type)
+        # list:{категория} или list:{категория}:{страница}
+        parts = data.split(":")
+        page = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 1
+        await show_list(update, context, parts[1], page)
         return
 
-async def show_list(update: Update, context, list_type):
-    """Показывает содержимое указанного списка."""
+def sort_items(items):
+    """Сначала высокий приоритет; внутри приоритета порядок бекенда (сортировка устойчивая)."""
+    return sorted(items, key=lambda item: -item.get("priority", 2))
+
+def render_list_page(list_type, items, page):
+    """Собирает текст и клавиатуру одной страницы списка. Возвращает (текст, клавиатура)."""
+    pages = max(1, -(-len(items) // LIST_PAGE_SIZE))
+    page = min(max(page, 1), pages)
+    start = (page - 1) * LIST_PAGE_SIZE
+
+    title = f"{LISTS[list_type]}:" if pages == 1 else f"{LISTS[list_type]} (стр. {page}/{pages}):"
+    lines = [title]
+    keyboard = []
+    for item in items[start:start + LIST_PAGE_SIZE]:
+        emoji = PRIORITY_EMOJI.get(item["priority"], "🟡")
+        lines.append(f"- {emoji} {item['name']}")
+        # В кнопку кладется короткий токен, поэтому длина и символы названия не важны
+        token = callback_tokens.issue(SERVICE_USER_ID, list_type, item['name'])
+        keyboard.append([InlineKeyboardButton(f"{emoji} {item['name']}", callback_data=f"item:{token}")])
+
+    if pages > 1:
+        keyboard.append([
+            InlineKeyboardButton("◀️", callback_data=f"list:{list_type}:{page - 1 if page > 1 else pages}"),
+            InlineKeyboardButton(f"{page}/{pages}", callback_data="noop"),
+            InlineKeyboardButton("▶️", callback_data=f"list:{list_type}:{page + 1 if page < pages else 1}"),
+        ])
+    keyboard.append([])
+    keyboard.extend(get_list_keyboard(list_type).inline_keyboard)
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+# Ошибки editMessageText, после которых список отправляется новым сообщением
+UNEDITABLE_ERRORS = ("message to edit not found", "message can't be edited")
+
+async def render_list(list_type, items, page):
+    """Текст и клавиатура страницы списка, в том числе пустого. Возвращает (текст, клавиатура)."""
+    if not items:
+        return f"{LISTS[list_type]} пуст.", get_list_keyboard(list_type)
+    with stage("render"):
+        response_text, reply_markup = render_list_page(list_type, sort_items(items), page)
+    if callback_tokens.dirty:
+        await asyncio.to_thread(callback_tokens.flush)
+    return response_text, reply_markup
+
+async def edit_list_message(message, text, reply_markup):
+    """Перерисовывает сообщение со списком, если его содержимое изменилось.
+
+    Возвращает сообщение, в котором теперь список: это же или новое.
+    """
+    if message.text == text and message.reply_markup == reply_markup:
+        return message
+    try:
+        await message.edit_text(text, reply_markup=reply_markup)
+    except BadRequest as e:
+        # Гонка двух одинаковых нажатий: сообщение уже в нужном виде
+        if "not modified" in str(e):
+            return message
+        # Сообщение удалено или слишком старое — отправляем новое. С остальными ошибками
+        # новое сообщение не отправится так же, поэтому их пробрасываем
+        if not any(reason in str(e).lower() for reason in UNEDITABLE_ERRORS):
+            raise
+        return await message.reply_text(text, reply_markup=reply_markup)
+    return message
+
+async def show_list(update: Update, context, list_type, page=1):
+    """Показывает одну страницу указанного списка."""
     if list_type not in LISTS:
         if update.callback_query:
-        await update.callback_query.message.reply_text(f"Неизвестная категория: {list_type}")
+            await update.callback_query.message.reply_text(f"Неизвестная категория: {list_type}")
         return
 
     try:
-        headers = {}
-        if SERVICE_USER_ID:
-            headers["X-User-ID"] = SERVICE_USER_ID
-
-        response = requests.get(f"{API_URL}/list?category={list_type}", headers=headers)
-        if response.status_code != 200:
-            error_msg = f"Ошибка API: {response.status_code} - {response.text}"
+        try:
+            items = await lists.get(SERVICE_USER_ID, list_type)
+        except APIError as e:
+            error_msg = f"Ошибка API: {e}"
             logging.error(error_msg)
             if update.callback_query:
                 await update.callback_query.message.reply_text(error_msg)
             return
-
-        # Проверяем, что ответ не пустой и является JSON
-        if not response.text or response.text.strip() == "":
-            error_msg = "Пустой ответ от API"
-            logging.error(error_msg)
-            if update.callback_query:
-            await update.callback_query.message.reply_text(error_msg)
-            return
-
-        try:
-        items = response.json()
         except json.JSONDecodeError as e:
-            error_msg = f"Ошибка парсинга JSON: {e}. Ответ: {response.text[:200]}"
+            error_msg = f"Ошибка парсинга JSON: {e}"
             logging.error(error_msg)
             if update.callback_query:
                 await update.callback_query.message.reply_text(f"Ошибка подключения к API: {e}")
             return
-        if not items:
-            response_text = f"{LISTS[list_type]} пуст."
-            reply_markup = get_list_keyboard(list_type)
-            if update.callback_query:
-                await update.callback_query.message.edit_text(response_text, reply_markup=reply_markup)
-            return
+        response_text, reply_markup = await render_list(list_type, items, page)
 
-        response_text = f"{LISTS[list_type]}:\n"
-        keyboard = []
-        for item in items:
-            priority = item["priority"]
-            emoji = PRIORITY_EMOJI.get(priority, "🟡")
-            response_text += f"- {emoji} {item['name']}\n"
-            max_name_length = 50
-            safe_name = item['name'][:max_name_length].encode('utf-8').decode('utf-8', 'ignore')
-            callback_data = f"item:{safe_name}:{list_type}"
-            if len(callback_data.encode('utf-8')) > 64:
-                logging.error(f"Callback data too long for item: {item['name']} in category: {list_type}")
-                continue
-            keyboard.append([InlineKeyboardButton(f"{emoji} {item['name']}", callback_data=callback_data)])
-
-        keyboard.append([])
-        keyboard.extend(get_list_keyboard(list_type).inline_keyboard)
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         # Редактируем сообщение вместо создания нового
         if update.callback_query:
-            try:
-                await update.callback_query.message.edit_text(response_text, reply_markup=reply_markup)
-            except Exception as e:
-                # Если не удалось отредактировать (например, текст не изменился), отправляем новое сообщение
-        await update.callback_query.message.reply_text(response_text, reply_markup=reply_markup)
-    except requests.RequestException as e:
+            message = await edit_list_message(update.callback_query.message, response_text, reply_markup)
+            # Дальше сообщение обновляется само, когда список меняют в вебе или через Алису
+            await live.track(message.chat_id, message.message_id, list_type, page, (response_text, reply_markup))
+    except httpx.HTTPError as e:
         error_msg = f"Ошибка подключения к API: {e}"
         logging.error(error_msg)
         await update.callback_query.message.reply_text(error_msg)
@@ -554,6 +712,65 @@ async def show_list(update: Update, context, list_type):
         logging.error(error_msg)
         await update.callback_query.message.reply_text(error_msg)
 
+# Префиксы callback_data, которые выдает бот
+CALLBACK_PREFIXES = {
+    "noop", "restart", "suggest_dishes", "add", "add_to", "item", "item_action", "change_cat_to", "pri", "back", "list",
+}
+
+def callback_trace_name(update, context):
+    """Имя трассы для нажатия кнопки: префикс callback_data без аргументов.
+
+    callback_data присылает клиент, поэтому неизвестные префиксы сводятся к "other" —
+    имя трассы становится меткой метрики, и число меток должно быть ограничено.
+    """
+    prefix = (update.callback_query.data or "").split(':', 1)[0]
+    return f"telegram.callback.{prefix if prefix in CALLBACK_PREFIXES else 'other'}"
+
+def build_persistence():
+    """Хранилище user_data: Redis (общий для реплик), локальный файл или только память."""
+    redis_client = get_async_redis()
+    if redis_client is not None:
+        return RedisPersistence(redis_client, ttl=BOT_STATE_TTL)
+    if BOT_STATE_FILE:
+        return PicklePersistence(
+            BOT_STATE_FILE,
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+        )
+    return None
+
+async def save_user_state(update: Update, context):
+    """Записывает user_data сразу после апдейта, а не раз в update_interval.
+
+    Следующий апдейт того же пользователя может прийти на другую реплику.
+    """
+    if context.application.persistence is None or update.effective_user is None:
+        return
+    context.application.mark_data_for_update_persistence(user_ids=update.effective_user.id)
+    await context.application.update_persistence()
+
+async def start_sync(application):
+    """Запускает фоновую синхронизацию локальной копии списков с бекендом и подписку на её изменения."""
+    global _heartbeat
+    await lists.start()
+    await live.start(application.bot, render_list)
+    if LLM_WARMUP:
+        llm.warm_up_in_background()
+    _heartbeat = asyncio.create_task(health.heartbeat())
+    health.set_ready()
+
+async def stop_ready(application):
+    """Снимает готовность, когда бот перестал принимать апдейты и закрывает ресурсы."""
+    health.set_ready(False)
+
+async def close_api(application):
+    """Останавливает синхронизацию, закрывает пул соединений к API и пул GPT при остановке бота."""
+    if _heartbeat is not None:
+        _heartbeat.cancel()
+    await live.close()
+    await lists.close()
+    await api.close()
+    llm.shutdown()
+
 def main():
     """Запуск бота."""
     if not TELEGRAM_TOKEN:
@@ -568,14 +785,53 @@ def main():
         logging.warning("Предупреждение: SERVICE_USER_ID не указан, будет использован дефолтный пользователь")
         print("Предупреждение: SERVICE_USER_ID не указан, будет использован дефолтный пользователь")
 
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
-
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CallbackQueryHandler(button_callback))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_item_text))
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT, health=health)
+
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(BOT_CONCURRENT_UPDATES))
+        # Все запросы к Bot API идут через очередь с лимитами Telegram
+        .rate_limiter(SendQueue(
+            global_rate=TG_GLOBAL_RATE, chat_rate=TG_CHAT_RATE, chat_burst=TG_CHAT_BURST,
+            group_per_minute=TG_GROUP_PER_MINUTE, max_retries=TG_MAX_RETRIES,
+        ))
+        .post_init(start_sync)
+        .post_stop(stop_ready)
+        .post_shutdown(close_api)
+    )
+    persistence = build_persistence()
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    application = builder.build()
+
+    # Каждый апдейт выполняется в своей трассе: X-Request-ID в API и время по этапам
+    application.add_handler(CommandHandler("start", traced("telegram.start")(start)))
+    application.add_handler(CallbackQueryHandler(traced(callback_trace_name)(button_callback)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, traced("telegram.text")(handle_item_text)))
+    # Отдельная группа выполняется после основного хендлера апдейта
+    application.add_handler(TypeHandler(Update, save_user_state), group=1)
+
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            logging.error("Ошибка: для BOT_MODE=webhook нужен WEBHOOK_URL")
+            return
+        print(f"Бот запущен в режиме webhook на порту {WEBHOOK_PORT}...")
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=ALLOWED_UPDATES,
+            # Telegram не откроет больше соединений, чем бот обрабатывает параллельно
+            max_connections=BOT_CONCURRENT_UPDATES,
+        )
+        return
 
     print("Бот запущен...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,46 @@
+"""Параллельная обработка апдейтов с сохранением порядка для одного пользователя.
+
+По умолчанию python-telegram-bot обрабатывает апдейты строго по одному, и
+долгий запрос к GPT у одного пользователя задерживает кнопки всех остальных.
+Полная параллельность тоже не подходит: шаги диалога одного пользователя
+("Добавить" -> текст -> выбор категории) читают и пишут общий user_data и
+должны выполняться по порядку. Поэтому апдейты разных пользователей идут
+параллельно, а апдейты одного пользователя — последовательно.
+"""
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Не больше max_concurrent_updates апдейтов сразу и не больше одного на пользователя."""
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}
+
+    async def do_process_update(self, update, coroutine):
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            await coroutine
+            return
+
+        entry = self._locks.get(user.id)
+        if entry is None:
+            entry = self._locks[user.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            # Замок больше никто не ждет — убираем, чтобы словарь не рос с числом пользователей
+            if entry[1] == 0:
+                del self._locks[user.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
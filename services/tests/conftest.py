@@ -0,0 +1,8 @@
+"""Пути импорта для тестов: сервисы запускаются с services/ в PYTHONPATH и из своего каталога."""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+for path in (ROOT, ROOT / "alice", ROOT / "telegram-bot"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
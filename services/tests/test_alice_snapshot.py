@@ -0,0 +1,123 @@
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+import requests
+
+# Модуль Алисы создаёт очередь записи и пул g4f при импорте
+os.environ.setdefault("LLM_WARMUP", "false")
+os.environ.setdefault("ALICE_QUEUE_PATH", os.path.join(tempfile.mkdtemp(prefix="alice-test-"), "write_queue.db"))
+
+import alice  # noqa: E402
+from common.resilience import CircuitBreaker  # noqa: E402
+
+LISTS = b'{"\xd0\xba\xd1\x83\xd0\xbf\xd0\xb8\xd1\x82\xd1\x8c": [{"name": "x", "bought": false, "category": "k", "priority": 1}]}'
+
+
+class Response:
+    status_code = 200
+    content = LISTS
+
+
+class Backend:
+    """Подмена _backend_call: держит запросы, пока тест не откроет gate, и считает их."""
+
+    def __init__(self, fail=False):
+        self.calls = 0
+        self.fail = fail
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def __call__(self, call, route, headers, timeout):
+        self.calls += 1
+        self.started.set()
+        self.gate.wait(5)
+        if self.fail:
+            raise requests.ConnectionError("бекенд недоступен")
+        return Response()
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(alice, "_lists_snapshot", (0, None))
+    monkeypatch.setattr(alice, "_lists_loading", None)
+    # Без повторов и хеджирования каждый запрос снимка — ровно один вызов бекенда
+    monkeypatch.setattr(alice, "API_RETRIES", 0)
+    monkeypatch.setattr(alice, "API_HEDGE_AFTER", 0)
+    monkeypatch.setattr(alice, "backend_breaker", CircuitBreaker("test", failure_threshold=100))
+
+    def install(fail=False):
+        fake = Backend(fail)
+        monkeypatch.setattr(alice, "_backend_call", fake)
+        return fake
+
+    return install
+
+
+def run_callers(count, budget):
+    results = [None] * count
+
+    def caller(i):
+        started = time.monotonic()
+        try:
+            value = alice.get_lists_snapshot(time.monotonic() + budget)
+        except Exception as e:  # noqa: BLE001
+            value = e
+        results[i] = (value, time.monotonic() - started)
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_callers_share_one_backend_call(backend):
+    fake = backend()
+    threads, results = run_callers(8, budget=5)
+    assert fake.started.wait(2)
+    time.sleep(0.1)  # остальные потоки успевают встать в ожидание Future
+    fake.gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert fake.calls == 1
+    assert all(value == {"купить": [{"name": "x", "bought": False, "category": "k", "priority": 1}],
+                         "не-забыть": [], "холодос": []} for value, _ in results)
+    # Следующее чтение берёт свежий снимок без бекенда
+    alice.get_lists_snapshot(time.monotonic() + 1)
+    assert fake.calls == 1
+
+
+def test_failed_leader_releases_waiters(backend):
+    fake = backend(fail=True)
+    threads, results = run_callers(4, budget=5)
+    assert fake.started.wait(2)
+    time.sleep(0.1)
+    fake.gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert fake.calls == 1
+    for value, elapsed in results:
+        assert isinstance(value, requests.ConnectionError)
+        # Ошибка приходит сразу, а не по истечении бюджета ожидания Future
+        assert elapsed < 1
+    assert alice._lists_loading is None
+
+
+def test_waiter_with_stale_snapshot_answers_within_its_budget(backend):
+    fake = backend()
+    stale = {"купить": [], "не-забыть": [], "холодос": []}
+    alice._lists_snapshot = (0, stale)
+    leader, _ = run_callers(1, budget=5)
+    assert fake.started.wait(2)
+
+    started = time.monotonic()
+    assert alice.get_lists_snapshot(time.monotonic() + 0.1) is stale
+    assert time.monotonic() - started < 0.5
+
+    fake.gate.set()
+    leader[0].join(5)
+    assert fake.calls == 1
@@ -0,0 +1,61 @@
+import pytest
+import redis
+
+from callback_tokens import CallbackTokens
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+class FlakyRedis:
+    """Redis, который отказывает на записи, пока down=True."""
+
+    def __init__(self):
+        self.server = fakeredis.FakeRedis(decode_responses=True)
+        self.down = True
+
+    def pipeline(self, transaction=True):
+        if self.down:
+            raise redis.ConnectionError("Redis недоступен")
+        return self.server.pipeline(transaction=transaction)
+
+    def get(self, key):
+        return self.server.get(key)
+
+
+def test_flush_writes_tokens_to_redis():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    tokens = CallbackTokens(client)
+    token = tokens.issue("u", "купить", "молоко")
+    tokens.flush()
+    assert not tokens.dirty
+    assert CallbackTokens(client).fetch(token) == ("u", "купить", "молоко")
+
+
+def test_failed_flush_keeps_tokens_for_retry():
+    client = FlakyRedis()
+    tokens = CallbackTokens(client)
+    token = tokens.issue("u", "купить", "молоко")
+    tokens.flush()
+    assert tokens.dirty
+
+    # Повторный показ списка не ставит токен в очередь заново: он уже есть в памяти
+    assert tokens.issue("u", "купить", "молоко") == token
+    newer = tokens.issue("u", "купить", "хлеб")
+    client.down = False
+    tokens.flush()
+    assert not tokens.dirty
+    restarted = CallbackTokens(client)
+    assert restarted.fetch(token) == ("u", "купить", "молоко")
+    assert restarted.fetch(newer) == ("u", "купить", "хлеб")
+
+
+def test_failed_flush_keeps_newest_entries_only():
+    client = FlakyRedis()
+    tokens = CallbackTokens(client, max_entries=2)
+    issued = [tokens.issue("u", "купить", name) for name in ("а", "б", "в")]
+    tokens.flush()
+    client.down = False
+    tokens.flush()
+    restarted = CallbackTokens(client)
+    assert restarted.fetch(issued[0]) is None
+    assert restarted.fetch(issued[2]) == ("u", "купить", "в")
@@ -0,0 +1,85 @@
+import pytest
+
+from intents import IntentRouter, build_router, stem
+
+
+@pytest.fixture(scope="module")
+def router():
+    return build_router()
+
+
+def match(router, text):
+    return router.match(text.split())
+
+
+@pytest.mark.parametrize("word, base", [
+    ("купи", "куп"), ("купить", "куп"), ("купите", "куп"), ("Холодильнике", "холодильник"), ("ёлка", "елк"),
+])
+def test_stem(word, base):
+    assert stem(word) == base
+
+
+def test_short_words_keep_their_form():
+    assert stem("что") == "что"
+    assert stem("не") == "не"
+
+
+@pytest.mark.parametrize("text", ["купи молоко", "купить молоко", "Купите молоко"])
+def test_stemmed_forms_match_one_intent(router, text):
+    result = match(router, text)
+    assert result.intent == "add_buy"
+    assert result.text == "молоко"
+
+
+@pytest.mark.parametrize("text", ["добавь хлеб", "внеси хлеб", "запишите хлеб"])
+def test_synonyms(router, text):
+    result = match(router, text)
+    assert result.intent == "add_remember"
+    assert result.args == ["хлеб"]
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("что в холодосе", "list_fridge"),
+    ("что можно сварить", "suggest_recipes"),
+    ("далее", "recipe_followup"),
+])
+def test_synonyms_in_fixed_phrases(router, text, intent):
+    assert match(router, text).intent == intent
+
+
+def test_longest_phrase_wins():
+    router = IntentRouter()
+    router.add("short", "что", takes_args=True)
+    router.add("long", "что купить", takes_args=True)
+    assert router.match("что купить хлеб".split()).intent == "long"
+    assert router.match("что съесть".split()).intent == "short"
+
+
+def test_fixed_phrase_needs_full_match(router):
+    assert match(router, "что купить").intent == "list_buy"
+    assert match(router, "что купить завтра") is None
+
+
+def test_takes_args_keeps_rest_as_argument(router):
+    result = match(router, "запиши позвонить маме")
+    assert result.intent == "add_remember"
+    assert result.text == "позвонить маме"
+
+
+def test_fixed_phrase_falls_back_to_shorter_phrase_with_args():
+    router = IntentRouter()
+    router.add("add", "купить", takes_args=True)
+    router.add("list", "купить хлеб")
+    assert router.match("купить хлеб".split()).intent == "list"
+    result = router.match("купить хлеб и сыр".split())
+    assert result.intent == "add"
+    assert result.text == "хлеб и сыр"
+
+
+def test_empty_utterance_is_greeting(router):
+    assert router.match([]).intent == "greeting"
+
+
+@pytest.mark.parametrize("text", ["как дела", "погода завтра", "что"])
+def test_unknown_returns_none(router, text):
+    assert match(router, text) is None
@@ -0,0 +1,121 @@
+import pytest
+
+from common import llm_providers
+from common.llm_providers import COOLDOWN_BASE, ProviderScheduler
+
+
+class FakeProvider:
+    """Локальный провайдер вместо g4f: планировщику нужно только имя."""
+
+    def __init__(self, name):
+        self.__name__ = name
+
+    def __repr__(self):
+        return self.__name__
+
+
+FAST, SLOW, FLAKY = FakeProvider("Fast"), FakeProvider("Slow"), FakeProvider("Flaky")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время планировщика (time.time в llm_providers)."""
+    now = [1000.0]
+    monkeypatch.setattr(llm_providers.time, "time", lambda: now[0])
+    return now
+
+
+def names(providers):
+    return [provider.__name__ for provider in providers]
+
+
+def warm_up(scheduler, provider, ok, seconds, times=10):
+    for _ in range(times):
+        scheduler.record(provider, ok, seconds)
+
+
+def test_pick_prefers_lower_latency(clock):
+    scheduler = ProviderScheduler([SLOW, FAST], top_k=1, explore=0)
+    warm_up(scheduler, SLOW, True, 4.0)
+    warm_up(scheduler, FAST, True, 0.5)
+    assert names(scheduler.pick()) == ["Fast"]
+
+
+def test_pick_weighs_success_rate(clock):
+    scheduler = ProviderScheduler([FLAKY, SLOW], top_k=2, explore=0)
+    warm_up(scheduler, SLOW, True, 2.0)
+    # Flaky быстрее, но отвечает хорошо только в каждом третьем вызове
+    for i in range(30):
+        scheduler.record(FLAKY, i % 3 == 0, 1.0)
+    clock[0] += 1000  # паузы после ошибок истекли, сравниваем только оценку
+    assert names(scheduler.pick()) == ["Slow", "Flaky"]
+
+
+def test_unknown_provider_gets_a_chance(clock):
+    newcomer = FakeProvider("New")
+    scheduler = ProviderScheduler([SLOW, newcomer], top_k=1, explore=0)
+    warm_up(scheduler, SLOW, True, 8.0)
+    assert names(scheduler.pick()) == ["New"]
+
+
+def test_cooldown_after_failure_and_recovery(clock):
+    scheduler = ProviderScheduler([FAST, SLOW], top_k=1, explore=0)
+    warm_up(scheduler, FAST, True, 0.5)
+    warm_up(scheduler, SLOW, True, 3.0)
+    scheduler.record(FAST, False, 0.5)
+    assert names(scheduler.pick()) == ["Slow"]
+
+    clock[0] += COOLDOWN_BASE + 1
+    assert names(scheduler.pick()) == ["Fast"]
+
+
+def test_cooldown_grows_with_consecutive_failures(clock):
+    scheduler = ProviderScheduler([FAST], explore=0)
+    scheduler.record(FAST, False, 1.0)
+    scheduler.record(FAST, False, 1.0)
+    assert scheduler.stats()["Fast"]["cooldown_until"] == clock[0] + 2 * COOLDOWN_BASE
+    scheduler.record(FAST, True, 1.0)
+    assert scheduler.stats()["Fast"]["cooldown_until"] == 0.0
+    assert scheduler.stats()["Fast"]["failures"] == 0
+
+
+def test_all_in_cooldown_still_picks_best(clock):
+    scheduler = ProviderScheduler([FAST, SLOW], top_k=1, explore=0)
+    warm_up(scheduler, FAST, True, 0.5)
+    warm_up(scheduler, SLOW, True, 3.0)
+    scheduler.record(FAST, False, 0.5)
+    scheduler.record(SLOW, False, 3.0)
+    assert names(scheduler.pick()) == ["Fast"]
+
+
+def test_stats_persist_to_file(clock, tmp_path):
+    path = str(tmp_path / "providers.json")
+    scheduler = ProviderScheduler([FAST, SLOW], state_path=path, explore=0)
+    warm_up(scheduler, FAST, True, 0.5)
+    scheduler.record(SLOW, False, 3.0)
+
+    reloaded = ProviderScheduler([FAST, SLOW], state_path=path, explore=0)
+    assert reloaded.stats() == scheduler.stats()
+    assert names(reloaded.pick()) == ["Fast"]
+
+
+def test_stats_persist_to_redis(clock):
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis(decode_responses=True)
+    scheduler = ProviderScheduler([FAST, SLOW], redis_client=client, explore=0)
+    warm_up(scheduler, SLOW, True, 0.5)
+
+    reloaded = ProviderScheduler([FAST, SLOW], redis_client=client, explore=0)
+    assert reloaded.stats()["Slow"] == scheduler.stats()["Slow"]
+    assert names(reloaded.pick())[0] == "Slow"
+
+
+def test_reload_ignores_unknown_and_broken_state(clock, tmp_path):
+    path = tmp_path / "providers.json"
+    path.write_text('{"Gone": {"latency": 0.1}, "Fast": {"latency": 0.7, "extra": 1}}', encoding="utf-8")
+    scheduler = ProviderScheduler([FAST], state_path=str(path))
+    assert set(scheduler.stats()) == {"Fast"}
+    assert scheduler.stats()["Fast"]["latency"] == 0.7
+
+    path.write_text("{not json", encoding="utf-8")
+    assert ProviderScheduler([FAST], state_path=str(path)).stats()["Fast"]["calls"] == 0
@@ -0,0 +1,73 @@
+import time
+
+from common.write_queue import Rejected, WriteBehindQueue
+
+
+class Sink:
+    """send для очереди: запоминает отправленное."""
+
+    def __init__(self, reject=False):
+        self.sent = []
+        self.reject = reject
+
+    def __call__(self, user, items):
+        self.sent.append((user, items))
+        if self.reject:
+            raise Rejected("400 - bad item")
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_batches_adds_of_one_user(tmp_path):
+    sink = Sink()
+    queue = WriteBehindQueue(sink, str(tmp_path / "q.db"), window=0.05)
+    queue.put("u", [{"name": "молоко", "category": "купить"}])
+    queue.put("u", [{"name": "хлеб", "category": "купить"}])
+    assert wait_for(lambda: queue.pending("u", "купить") == [])
+    assert sink.sent == [("u", [{"name": "молоко", "category": "купить"}, {"name": "хлеб", "category": "купить"}])]
+    queue.close()
+
+
+def test_failing_on_flushed_does_not_stop_the_queue(tmp_path):
+    sink = Sink()
+    calls = []
+
+    def on_flushed(user):
+        calls.append(user)
+        raise RuntimeError("сбой сброса кэша")
+
+    queue = WriteBehindQueue(sink, str(tmp_path / "q.db"), window=0.01, on_flushed=on_flushed)
+    queue.put("u", [{"name": "молоко", "category": "купить"}])
+    assert wait_for(lambda: len(calls) == 1)
+    queue.put("u", [{"name": "хлеб", "category": "купить"}])
+    assert wait_for(lambda: len(calls) == 2)
+    assert queue.pending("u", "купить") == []
+    queue.close()
+
+
+def test_flushed_counter_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "q.db")
+    queue = WriteBehindQueue(Sink(), path, window=0.01)
+    other_worker = WriteBehindQueue(Sink(), path)
+    before = other_worker.flushed()
+    queue.put("u", [{"name": "молоко", "category": "купить"}])
+    assert wait_for(lambda: other_worker.flushed() == before + 1)
+    queue.close()
+
+
+def test_rejected_items_move_to_rejected_table(tmp_path):
+    sink = Sink(reject=True)
+    queue = WriteBehindQueue(sink, str(tmp_path / "q.db"), window=0.01)
+    queue.put("u", [{"name": "", "category": "купить"}])
+    assert wait_for(lambda: queue.pending("u", "купить") == [])
+    rows = queue._db.execute("SELECT user, category, reason FROM rejected").fetchall()
+    assert rows == [("u", "купить", "400 - bad item")]
+    assert queue.flushed() == 0
+    queue.close()